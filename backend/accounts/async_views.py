@@ -0,0 +1,13 @@
+from mechanic_assist.async_support import async_api_view, json_response
+from mechanic_assist.conditional import Validators
+from .serializers import UserSerializer
+
+
+@async_api_view()
+async def get_current_user(request):
+    """Async counterpart of views.get_current_user"""
+    validators = Validators.for_instances(request, request.user)
+    not_modified = validators.not_modified(request)
+    if not_modified:
+        return not_modified
+    return validators.apply(json_response(UserSerializer(request.user).data))
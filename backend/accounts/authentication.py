@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .models import User
+
+
+class UserCache:
+    """
+    Per-process LRU cache of user rows by id, so a request's JWT resolves to its user
+    (role, is_active, name and the rest) without a query
+
+    Entries expire after USER_CACHE_TTL_SECONDS. Saving or deleting a user drops its
+    entry in this process at once; changes made by other processes show up within the
+    TTL. Every hit builds a new User instance, so request code may modify it freely.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._field_names = [field.attname for field in User._meta.concrete_fields]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return User.from_db('default', self._field_names, entry[1])
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def set(self, user):
+        values = tuple(getattr(user, name) for name in self._field_names)
+        with self._lock:
+            self._entries[user.pk] = (time.monotonic() + settings.USER_CACHE_TTL_SECONDS, values)
+            self._entries.move_to_end(user.pk)
+            while len(self._entries) > settings.USER_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+user_cache = UserCache()
+
+
+def check_cached_user(user):
+    """The checks JWTAuthentication.get_user applies to a freshly loaded user"""
+    if not user.is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication resolving users through user_cache"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        # Revocation checks compare token claims with the current password hash, so
+        # they always read the row
+        user = user_cache.get(user_id) if not jwt_settings.CHECK_REVOKE_TOKEN else None
+        if user is not None:
+            return check_cached_user(user)
+        return user_cache.set(super().get_user(validated_token))
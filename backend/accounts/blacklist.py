@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import BlacklistedToken
+
+
+class TokenBlacklist:
+    """
+    Refresh token jtis that may not be used again, in the token_blacklist table
+
+    Using up a token is a single INSERT on the unique jti index: it succeeds only for
+    the first caller, so the check and the write are one statement and concurrent
+    refreshes with one token cannot both win. Jtis this process has seen blacklisted
+    are kept in an in-memory set (up to TOKEN_BLACKLIST_LOCAL_MAX_ENTRIES, until the
+    token expires) and rejected without a query. Rows are purged once their token has
+    expired (purge_token_blacklist), so the table only ever holds tokens still inside
+    REFRESH_TOKEN_LIFETIME.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._known = OrderedDict()
+        self.local_rejections = 0
+
+    def add(self, jti, expires_at):
+        """Blacklist a jti; returns False if it already was (the token was used before)"""
+        if self._is_known(jti):
+            return False
+        try:
+            with transaction.atomic():
+                BlacklistedToken.objects.create(jti=jti, expires_at=expires_at)
+        except IntegrityError:
+            self._remember(jti, expires_at)
+            return False
+        transaction.on_commit(lambda: self._remember(jti, expires_at))
+        return True
+
+    def contains(self, jti):
+        if self._is_known(jti):
+            return True
+        expires_at = BlacklistedToken.objects.filter(jti=jti).values_list('expires_at', flat=True).first()
+        if expires_at is None:
+            return False
+        self._remember(jti, expires_at)
+        return True
+
+    def _is_known(self, jti):
+        with self._lock:
+            expires = self._known.get(jti)
+            if expires is not None and expires > time.time():
+                self.local_rejections += 1
+                return True
+            if expires is not None:
+                del self._known[jti]
+            return False
+
+    def _remember(self, jti, expires_at):
+        with self._lock:
+            self._known[jti] = expires_at.timestamp()
+            while len(self._known) > settings.TOKEN_BLACKLIST_LOCAL_MAX_ENTRIES:
+                # The table is authoritative, so forgetting the oldest entry only costs a query
+                self._known.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._known.clear()
+            self.local_rejections = 0
+
+
+token_blacklist = TokenBlacklist()
+
+
+def token_expiry(token):
+    return datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+
+
+class BlacklistableRefreshToken(RefreshToken):
+    """RefreshToken whose blacklist() records its jti in token_blacklist"""
+
+    def blacklist(self):
+        if not token_blacklist.add(self[jwt_settings.JTI_CLAIM], token_expiry(self)):
+            raise TokenError('Token is blacklisted')
+
+    def check_blacklist(self):
+        if token_blacklist.contains(self[jwt_settings.JTI_CLAIM]):
+            raise TokenError('Token is blacklisted')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import BlacklistedToken
+from mechanic_assist.purge import delete_in_batches
+
+
+class Command(BaseCommand):
+    help = 'Delete blacklisted refresh tokens that have expired anyway, in batches'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+    
+    def handle(self, *args, **options):
+        # An expired token fails validation before the blacklist is consulted
+        expired = BlacklistedToken.objects.filter(expires_at__lt=timezone.now())
+        deleted = delete_in_batches(expired, options['batch_size'])
+        self.stdout.write(f'Deleted {deleted} expired blacklisted tokens')
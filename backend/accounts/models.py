@@ -57,3 +57,16 @@ class User(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return f"{self.name} ({self.email})"
 
+
+
+class BlacklistedToken(models.Model):
+    """A refresh token jti that may not be used again, kept until the token expires"""
+    
+    jti = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        db_table = 'token_blacklist'
+    
+    def __str__(self):
+        return self.jti
@@ -1,5 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .blacklist import BlacklistableRefreshToken
 from .models import User
 
 
@@ -41,3 +44,17 @@ class UserProfileSerializer(serializers.ModelSerializer):
         fields = ('id', 'email', 'name', 'phone', 'role')
         read_only_fields = ('id', 'email', 'role')
 
+
+
+class BlacklistingTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    TokenRefreshSerializer backed by accounts.blacklist: with BLACKLIST_AFTER_ROTATION
+    a refresh token works once, and tokens blacklisted at logout are refused
+    """
+    token_class = BlacklistableRefreshToken
+    
+    def validate(self, attrs):
+        if not (jwt_settings.ROTATE_REFRESH_TOKENS and jwt_settings.BLACKLIST_AFTER_ROTATION):
+            # Rotation does not blacklist the token on the way through, so look it up
+            self.token_class(attrs['refresh']).check_blacklist()
+        return super().validate(attrs)
@@ -0,0 +1,154 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management import call_command
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from mechanic_assist.query_budget import QueryBudgetTestMixin
+from mechanic_assist.throttling import TokenBucketThrottle, token_buckets
+from . import async_views
+from .authentication import user_cache
+from .blacklist import token_blacklist
+from .models import BlacklistedToken, User
+
+
+def create_user(email, role):
+    return User.objects.create_user(email=email, password='password', name=email, phone='5550100', role=role)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class CachedUserAuthenticationTests(QueryBudgetTestMixin, TestCase):
+    
+    def setUp(self):
+        user_cache.clear()
+        self.customer = create_user('customer@example.com', 'CUSTOMER')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.customer)}')
+    
+    def test_token_user_is_resolved_from_the_cache(self):
+        with self.assertMaxQueries(3):
+            self.assertEqual(self.client.get('/api/requests/customer/').status_code, 200)
+        with self.assertMaxQueries(2):
+            self.assertEqual(self.client.get('/api/requests/customer/').status_code, 200)
+        with self.assertMaxQueries(0):
+            self.assertEqual(self.client.get('/api/auth/me/').data['role'], 'CUSTOMER')
+        self.assertEqual((user_cache.hits, user_cache.misses), (2, 1))
+    
+    def test_saving_a_user_drops_the_cached_copy(self):
+        self.assertEqual(self.client.get('/api/auth/me/').data['name'], 'customer@example.com')
+        response = self.client.put('/api/auth/profile/update/', {'name': 'Renamed', 'phone': '5550101'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/auth/me/').data['name'], 'Renamed')
+        
+        self.customer.refresh_from_db()
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertEqual(self.client.get('/api/auth/me/').status_code, 401)
+    
+    def test_async_me_matches_the_sync_view(self):
+        expected = self.client.get('/api/auth/me/')
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.customer)}'}
+        me = async_to_sync(async_views.get_current_user)
+        
+        with self.assertMaxQueries(0):
+            response = me(AsyncRequestFactory().get('/api/auth/me/', headers=headers))
+        self.assertEqual(json.loads(response.content), expected.json())
+        self.assertEqual(response['ETag'], expected['ETag'])
+        
+        response = me(AsyncRequestFactory().get('/api/auth/me/', headers={**headers, 'If-None-Match': expected['ETag']}))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(me(AsyncRequestFactory().get('/api/auth/me/')).status_code, 401)
+
+
+class TokenBlacklistTests(TestCase):
+    
+    def setUp(self):
+        token_blacklist.clear()
+        self.customer = create_user('customer@example.com', 'CUSTOMER')
+        self.client = APIClient()
+    
+    def refresh(self, token):
+        return self.client.post('/api/auth/token/refresh/', {'refresh': token}, format='json')
+    
+    def test_rotated_refresh_token_works_once(self):
+        token = str(RefreshToken.for_user(self.customer))
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+        self.assertEqual(self.refresh(response.data['refresh']).status_code, 200)
+        
+        # The replay is refused by the unique jti, after which this process knows the jti
+        self.assertEqual(self.refresh(token).status_code, 401)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.refresh(token).status_code, 401)
+        self.assertEqual(token_blacklist.local_rejections, 1)
+        self.assertEqual(BlacklistedToken.objects.count(), 2)
+    
+    def test_logout_blacklists_the_refresh_token(self):
+        token = str(RefreshToken.for_user(self.customer))
+        for _ in range(2):
+            response = self.client.post('/api/auth/logout/', {'refresh': token}, format='json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh(token).status_code, 401)
+        self.assertEqual(self.client.post('/api/auth/logout/', {'refresh': 'junk'}, format='json').status_code, 401)
+    
+    def test_purge_drops_only_expired_tokens(self):
+        now = timezone.now()
+        BlacklistedToken.objects.create(jti='expired', expires_at=now - timedelta(seconds=1))
+        BlacklistedToken.objects.create(jti='live', expires_at=now + timedelta(days=1))
+        call_command('purge_token_blacklist', batch_size=1, stdout=StringIO())
+        self.assertEqual(list(BlacklistedToken.objects.values_list('jti', flat=True)), ['live'])
+
+
+class FakeClock:
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+
+@override_settings(
+    REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {'login': '2/min', 'register': '1/hour'},
+    },
+)
+class AuthThrottleTests(TestCase):
+    
+    def setUp(self):
+        token_buckets.clear()
+        self.clock = FakeClock()
+        patcher = mock.patch.object(TokenBucketThrottle, 'timer', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+    
+    def login(self):
+        return self.client.post('/api/auth/login/', {'email': 'nobody@example.com', 'password': 'wrong'}, format='json')
+    
+    def test_login_bucket_refills_over_the_period(self):
+        self.assertEqual([self.login().status_code for _ in range(2)], [401, 401])
+        throttled = self.login()
+        self.assertEqual(throttled.status_code, 429)
+        self.assertEqual(throttled['Retry-After'], '30')
+        
+        self.clock.now += 29
+        self.assertEqual(self.login().status_code, 429)
+        self.clock.now += 1
+        self.assertEqual(self.login().status_code, 401)
+        self.assertEqual(self.login().status_code, 429)
+    
+    def test_register_is_limited_per_ip(self):
+        self.assertEqual(self.client.post('/api/auth/register/', {}, format='json').status_code, 400)
+        throttled = self.client.post('/api/auth/register/', {}, format='json')
+        self.assertEqual(throttled.status_code, 429)
+        self.assertEqual(throttled['Retry-After'], '3600')
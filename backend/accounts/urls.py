@@ -1,10 +1,15 @@
+from django.conf import settings
 from django.urls import path
-from .views import RegisterView, login_view, get_current_user, ProfileUpdateView
+from rest_framework_simplejwt.views import TokenRefreshView
+from . import async_views
+from .views import RegisterView, login_view, logout_view, get_current_user, ProfileUpdateView
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', login_view, name='login'),
-    path('me/', get_current_user, name='me'),
+    path('logout/', logout_view, name='logout'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
+    path('me/', async_views.get_current_user if settings.ASYNC_VIEWS else get_current_user, name='me'),
     path('profile/update/', ProfileUpdateView.as_view(), name='profile-update'),
 ]
 
@@ -1,8 +1,12 @@
 from rest_framework import status, generics, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from mechanic_assist.conditional import Validators
+from mechanic_assist.throttling import LoginThrottle, RegisterThrottle
+from .blacklist import BlacklistableRefreshToken
 from .models import User
 from .serializers import UserRegistrationSerializer, UserSerializer, UserProfileSerializer
 
@@ -11,6 +15,7 @@ class RegisterView(generics.CreateAPIView):
     """User registration endpoint"""
     queryset = User.objects.all()
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [RegisterThrottle]
     serializer_class = UserRegistrationSerializer
     
     def create(self, request, *args, **kwargs):
@@ -38,6 +43,7 @@ class RegisterView(generics.CreateAPIView):
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([LoginThrottle])
 def login_view(request):
     """User login endpoint"""
     email = request.data.get('email')
@@ -75,12 +81,43 @@ def login_view(request):
     }, status=status.HTTP_200_OK)
 
 
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def logout_view(request):
+    """Blacklist a refresh token so it cannot be used again"""
+    token = request.data.get('refresh')
+    
+    if not token:
+        return Response(
+            {'error': 'Refresh token is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        refresh = BlacklistableRefreshToken(token)
+    except TokenError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_401_UNAUTHORIZED)
+    
+    try:
+        refresh.blacklist()
+    except TokenError:
+        # Already used or logged out; the token is dead either way
+        pass
+    
+    return Response({'message': 'Logout successful'}, status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_current_user(request):
     """Get current authenticated user"""
+    validators = Validators.for_instances(request, request.user)
+    not_modified = validators.not_modified(request)
+    if not_modified:
+        return not_modified
+    
     serializer = UserSerializer(request.user)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return validators.apply(Response(serializer.data, status=status.HTTP_200_OK))
 
 
 class ProfileUpdateView(generics.UpdateAPIView):
@@ -90,5 +127,6 @@ class ProfileUpdateView(generics.UpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_object(self):
-        return self.request.user
+        # request.user may come from the user cache; save over the current row instead
+        return User.objects.get(pk=self.request.user.pk)
 
@@ -0,0 +1,132 @@
+"""
+Helpers for the async (ASGI-native) views.
+
+Async views authenticate with the same JWT settings as the DRF views and use Django's
+async ORM. Work that has no async form runs on one bounded thread pool shared by all
+of them, sized by ASYNC_SYNC_WORKERS, instead of an unbounded thread per call.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import close_old_connections
+from django.http import JsonResponse
+from rest_framework.exceptions import APIException, NotAuthenticated, Throttled
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.ASYNC_SYNC_WORKERS, thread_name_prefix='async-sync'
+        )
+    return _executor
+
+
+def _call_in_worker(func, args, kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_sync(func, *args, **kwargs):
+    """Run blocking code on the shared bounded thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), _call_in_worker, func, args, kwargs)
+
+
+def json_response(data, status=200, headers=None):
+    return JsonResponse(data, status=status, headers=headers, encoder=JSONEncoder, safe=False)
+
+
+async def authenticate(request):
+    """
+    Resolve the user behind the request's Bearer token from the user cache, or with one
+    async query on a miss
+    Returns None without credentials; raises like JWTAuthentication for bad ones
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+    raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    
+    token = authentication.get_validated_token(raw_token)
+    try:
+        user_id = token[jwt_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken('Token contained no recognizable user identification')
+    
+    from accounts.authentication import check_cached_user, user_cache
+    from accounts.models import User
+    user = user_cache.get(user_id) if not jwt_settings.CHECK_REVOKE_TOKEN else None
+    if user is not None:
+        return check_cached_user(user)
+    try:
+        user = await User.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+    except User.DoesNotExist:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    if not user.is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    return user_cache.set(user)
+
+
+def _error_response(exc):
+    # Same body and headers as DRF's default exception handler
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    headers = {}
+    if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+        headers['WWW-Authenticate'] = 'Bearer realm="api"'
+    if getattr(exc, 'wait', None):
+        headers['Retry-After'] = '%d' % exc.wait
+    return json_response(data, status=exc.status_code, headers=headers)
+
+
+def async_api_view(methods=('GET',), authenticated=True, throttle_classes=()):
+    """
+    Decorate an async view taking (request, *args, **kwargs), mirroring the DRF
+    @api_view/@permission_classes/@throttle_classes decorators used by the sync views:
+    request.user is set from the JWT, throttles are checked after authentication, and
+    authentication failures and API exceptions get the same responses DRF returns
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return json_response(
+                    {'detail': f'Method "{request.method}" not allowed.'}, status=405
+                )
+            
+            try:
+                user = await authenticate(request)
+            except (InvalidToken, AuthenticationFailed) as exc:
+                return _error_response(exc)
+            if user is None and authenticated:
+                return _error_response(NotAuthenticated())
+            
+            request.user = user if user is not None else AnonymousUser()
+            waits = [
+                throttle.wait() for throttle in (cls() for cls in throttle_classes)
+                if not throttle.allow_request(request, None)
+            ]
+            if waits:
+                return _error_response(Throttled(max(waits)))
+            try:
+                return await view(request, *args, **kwargs)
+            except APIException as exc:
+                return _error_response(exc)
+        return wrapper
+    return decorator
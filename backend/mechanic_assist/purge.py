@@ -0,0 +1,19 @@
+"""
+Batched deletes for the purge commands of append-heavy tables.
+
+Rows are deleted by primary key a batch at a time, each batch in its own short
+statement, so row locks stay brief while the API keeps inserting into the table and
+no single transaction grows with the backlog.
+"""
+
+
+def delete_in_batches(queryset, batch_size):
+    """Delete every row of queryset, batch_size rows per DELETE; returns the number deleted"""
+    model = queryset.model
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if pks:
+            deleted += model._base_manager.filter(pk__in=pks).delete()[0]
+        if len(pks) < batch_size:
+            return deleted
@@ -0,0 +1,90 @@
+"""
+Query budgets for views.
+
+A view decorated with @query_budget(n) may run at most n queries, however many rows it
+returns. With QUERY_BUDGET_STRICT on (the default under DEBUG, and in the test suite)
+going over raises QueryBudgetExceeded so an N+1 regression fails loudly; otherwise it
+is logged as a warning.
+"""
+
+import functools
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """Count (and keep) the SQL run on the default connection inside a with block"""
+
+    def __init__(self):
+        self.queries = []
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+
+def _over_budget_message(name, max_queries, counter):
+    queries = '\n'.join(f'{index}. {sql}' for index, sql in enumerate(counter.queries, 1))
+    return f'{name} ran {counter.count} queries, budget is {max_queries}:\n{queries}'
+
+
+def query_budget(max_queries):
+    """
+    Cap the queries of a view function. Place it below @api_view/@permission_classes
+    so authentication is not counted against the view.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            with QueryCounter() as counter:
+                response = view(*args, **kwargs)
+            if counter.count > max_queries:
+                message = _over_budget_message(view.__qualname__, max_queries, counter)
+                if settings.QUERY_BUDGET_STRICT:
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+        wrapped.max_queries = max_queries
+        return wrapped
+    return decorator
+
+
+class QueryBudgetTestMixin:
+    """TestCase mixin for asserting an upper bound on queries, e.g. independent of row count"""
+
+    def assertMaxQueries(self, max_queries):
+        return _AssertMaxQueries(self, max_queries)
+
+
+class _AssertMaxQueries(QueryCounter):
+
+    def __init__(self, test_case, max_queries):
+        super().__init__()
+        self.test_case = test_case
+        self.max_queries = max_queries
+
+    def __exit__(self, exc_type, *exc_info):
+        super().__exit__(exc_type, *exc_info)
+        if exc_type is None and self.count > self.max_queries:
+            self.test_case.fail(_over_budget_message('Block', self.max_queries, self))
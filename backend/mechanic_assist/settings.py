@@ -5,6 +5,7 @@ Django settings for mechanic_assist project.
 from pathlib import Path
 import os
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 from decouple import config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -122,13 +123,20 @@ AUTH_USER_MODEL = 'accounts.User'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # Token buckets of mechanic_assist.throttling, per worker process; see its docstring
+    'DEFAULT_THROTTLE_RATES': {
+        'login': config('THROTTLE_LOGIN_RATE', default='10/min'),
+        'register': config('THROTTLE_REGISTER_RATE', default='20/hour'),
+        'nearby': config('THROTTLE_NEARBY_RATE', default='60/min'),
+        'nearby_ip': config('THROTTLE_NEARBY_IP_RATE', default='300/min'),
+    },
 }
 
 # JWT Settings
@@ -137,6 +145,7 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.BlacklistingTokenRefreshSerializer',
     'UPDATE_LAST_LOGIN': True,
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
@@ -152,7 +161,94 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+CORS_ALLOW_HEADERS = [*default_headers, 'idempotency-key']
+
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor', 'Idempotent-Replayed']
+
 # Pricing Configuration
 BASE_FARE = config('BASE_FARE', default=100, cast=float)
 PER_KM_RATE = config('PER_KM_RATE', default=10, cast=float)
 
+
+# Nearby Mechanic Search
+NEARBY_DEFAULT_RADIUS_KM = config('NEARBY_DEFAULT_RADIUS_KM', default=25, cast=float)
+NEARBY_MAX_RADIUS_KM = config('NEARBY_MAX_RADIUS_KM', default=100, cast=float)
+NEARBY_DEFAULT_LIMIT = config('NEARBY_DEFAULT_LIMIT', default=20, cast=int)
+NEARBY_MAX_RESULTS = config('NEARBY_MAX_RESULTS', default=50, cast=int)
+
+# In-memory mechanic location index (per worker). Each worker reads the profiles other
+# processes saved every MECHANIC_INDEX_REFRESH_SECONDS, rereading the last
+# MECHANIC_INDEX_OVERLAP_SECONDS for late commits, and rebuilds every MAX_AGE seconds
+MECHANIC_INDEX_ENABLED = config('MECHANIC_INDEX_ENABLED', default=True, cast=bool)
+MECHANIC_INDEX_REFRESH_SECONDS = config('MECHANIC_INDEX_REFRESH_SECONDS', default=2, cast=float)
+MECHANIC_INDEX_OVERLAP_SECONDS = config('MECHANIC_INDEX_OVERLAP_SECONDS', default=5, cast=float)
+MECHANIC_INDEX_MAX_AGE_SECONDS = config('MECHANIC_INDEX_MAX_AGE_SECONDS', default=300, cast=float)
+
+# Nearby search cache (per worker: a mechanic change only drops the entries of the
+# worker that saved it, other workers may serve them until NEARBY_CACHE_TTL_SECONDS).
+# First pages are ranked from the caller's origin among NEARBY_CACHE_OVERFETCH times
+# `limit` mechanics fetched around the grid cell's center
+NEARBY_CACHE_ENABLED = config('NEARBY_CACHE_ENABLED', default=True, cast=bool)
+NEARBY_CACHE_OVERFETCH = config('NEARBY_CACHE_OVERFETCH', default=2, cast=int)
+NEARBY_CACHE_CELL_DEGREES = config('NEARBY_CACHE_CELL_DEGREES', default=0.005, cast=float)
+NEARBY_CACHE_TTL_SECONDS = config('NEARBY_CACHE_TTL_SECONDS', default=30, cast=float)
+NEARBY_CACHE_MAX_ENTRIES = config('NEARBY_CACHE_MAX_ENTRIES', default=2048, cast=int)
+
+# Buffered mechanic location pings (per worker)
+LOCATION_FLUSH_INTERVAL_SECONDS = config('LOCATION_FLUSH_INTERVAL_SECONDS', default=5, cast=float)
+LOCATION_FLUSH_MAX_PENDING = config('LOCATION_FLUSH_MAX_PENDING', default=500, cast=int)
+LOCATION_MAX_CLOCK_SKEW_SECONDS = config('LOCATION_MAX_CLOCK_SKEW_SECONDS', default=300, cast=float)
+
+# Service request push events. InProcessBroker only reaches WebSocket clients connected
+# to the same process; use services.events.PostgresNotifyBroker for several workers
+EVENT_BROKER = config('EVENT_BROKER', default='services.events.InProcessBroker')
+
+# Async read views, routed instead of the DRF views when ASYNC_VIEWS is on (the ASGI
+# entry point turns it on by default). Blocking work shares one bounded thread pool
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+ASYNC_SYNC_WORKERS = config('ASYNC_SYNC_WORKERS', default=8, cast=int)
+
+# Views decorated with mechanic_assist.query_budget raise when over their query budget
+# instead of logging a warning
+QUERY_BUDGET_STRICT = config('QUERY_BUDGET_STRICT', default=DEBUG, cast=bool)
+
+# Batch dispatch of requests created without a mechanic (run_dispatcher command)
+DISPATCH_INTERVAL_SECONDS = config('DISPATCH_INTERVAL_SECONDS', default=5, cast=float)
+DISPATCH_BATCH_SIZE = config('DISPATCH_BATCH_SIZE', default=10000, cast=int)
+DISPATCH_RADIUS_KM = config('DISPATCH_RADIUS_KM', default=15, cast=float)
+DISPATCH_CANDIDATES = config('DISPATCH_CANDIDATES', default=8, cast=int)
+DISPATCH_ROUNDS = config('DISPATCH_ROUNDS', default=3, cast=int)
+DISPATCH_RATING_WEIGHT_KM = config('DISPATCH_RATING_WEIGHT_KM', default=0.5, cast=float)
+
+# Open requests are offered to up to INBOX_MAX_RECIPIENTS mechanics within INBOX_RADIUS_KM
+INBOX_RADIUS_KM = config('INBOX_RADIUS_KM', default=10, cast=float)
+INBOX_MAX_RECIPIENTS = config('INBOX_MAX_RECIPIENTS', default=50, cast=int)
+
+# Idempotency-Key replays for create endpoints; purge older keys with purge_idempotency_keys
+IDEMPOTENCY_TTL_SECONDS = config('IDEMPOTENCY_TTL_SECONDS', default=86400, cast=int)
+IDEMPOTENCY_LOCK_SECONDS = config('IDEMPOTENCY_LOCK_SECONDS', default=60, cast=int)
+
+# Per-mechanic rating summary, maintained on every new rating
+RATING_SUMMARY_RECENT_REVIEWS = config('RATING_SUMMARY_RECENT_REVIEWS', default=5, cast=int)
+RATING_SUMMARY_MAX_AGE_SECONDS = config('RATING_SUMMARY_MAX_AGE_SECONDS', default=60, cast=int)
+
+# Delta sync of requests and ratings; purge older tombstones with purge_sync_tombstones
+SYNC_PAGE_SIZE = config('SYNC_PAGE_SIZE', default=200, cast=int)
+SYNC_OVERLAP_SECONDS = config('SYNC_OVERLAP_SECONDS', default=5, cast=int)
+SYNC_TOMBSTONE_TTL_SECONDS = config('SYNC_TOMBSTONE_TTL_SECONDS', default=30 * 86400, cast=int)
+
+# Longest a mechanic's wait-for-work long poll is held open
+LONG_POLL_MAX_SECONDS = config('LONG_POLL_MAX_SECONDS', default=25, cast=float)
+
+# Per-process cache of the users behind JWTs (accounts.authentication.user_cache)
+USER_CACHE_TTL_SECONDS = config('USER_CACHE_TTL_SECONDS', default=60, cast=float)
+USER_CACHE_MAX_ENTRIES = config('USER_CACHE_MAX_ENTRIES', default=10000, cast=int)
+
+# Used refresh tokens (accounts.blacklist); purge expired ones with purge_token_blacklist
+TOKEN_BLACKLIST_LOCAL_MAX_ENTRIES = config('TOKEN_BLACKLIST_LOCAL_MAX_ENTRIES', default=100000, cast=int)
+
+# Most token buckets (clients) one worker keeps for throttling
+THROTTLE_MAX_BUCKETS = config('THROTTLE_MAX_BUCKETS', default=100000, cast=int)
+
+# Rows fetched per round trip by the streaming admin exports
+ADMIN_EXPORT_CHUNK_SIZE = config('ADMIN_EXPORT_CHUNK_SIZE', default=2000, cast=int)
@@ -0,0 +1,120 @@
+"""
+Token-bucket throttling kept in process memory.
+
+Each scope's rate comes from REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] in DRF's
+'N/period' form (period s, m, h or d): a client starts with N tokens, each request
+takes one, and tokens come back evenly over the period, so bursts of up to N are
+allowed while the sustained rate stays at N per period. A scope without a rate is
+not throttled. A request with no token left gets a 429 whose Retry-After says when
+the next one is due.
+
+Buckets live in the worker process, with no cache server involved, so with several
+workers a client can get up to that many times the configured rate.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+PERIOD_SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """(capacity, refill per second) of an 'N/period' rate"""
+    count, period = rate.split('/')
+    capacity = int(count)
+    return capacity, capacity / PERIOD_SECONDS[period[0]]
+
+
+class TokenBuckets:
+    """
+    Token buckets by key, least recently used first; beyond THROTTLE_MAX_BUCKETS the
+    oldest are dropped, which hands those clients a full bucket again
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key, capacity, refill_per_second, now):
+        """Take a token from key's bucket; returns 0 if one was taken, else the seconds until one is"""
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / refill_per_second
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > settings.THROTTLE_MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+token_buckets = TokenBuckets()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttle the requests sharing get_bucket_key under the scope's rate"""
+    scope = None
+    timer = time.monotonic
+
+    def get_bucket_key(self, request):
+        """The client a request is counted against, or None to let it through"""
+        raise NotImplementedError('.get_bucket_key() must be overridden')
+
+    def allow_request(self, request, view):
+        self.wait_seconds = 0
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        key = self.get_bucket_key(request) if rate else None
+        if key is None:
+            return True
+        capacity, refill_per_second = parse_rate(rate)
+        self.wait_seconds = token_buckets.take(f'{self.scope}:{key}', capacity, refill_per_second, self.timer())
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """One bucket per client IP (see DRF's NUM_PROXIES for clients behind proxies)"""
+
+    def get_bucket_key(self, request):
+        return self.get_ident(request)
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """One bucket per authenticated user; anonymous requests are not counted"""
+
+    def get_bucket_key(self, request):
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return None
+        return user.pk
+
+
+class LoginThrottle(IPTokenBucketThrottle):
+    scope = 'login'
+
+
+class RegisterThrottle(IPTokenBucketThrottle):
+    scope = 'register'
+
+
+class NearbySearchUserThrottle(UserTokenBucketThrottle):
+    scope = 'nearby'
+
+
+class NearbySearchIPThrottle(IPTokenBucketThrottle):
+    scope = 'nearby_ip'
@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, FloatField, Sum
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+
+from services.cache import nearby_cache
+from services.models import MechanicProfile
+from .models import MechanicRatingSummary, Rating, rating_average
+from .serializers import RatingListSerializer
+
+
+def add_rating_to_profile(mechanic_id, stars):
+    """
+    Fold one new rating into the mechanic's profile with a single UPDATE of the rating
+    columns; every F() reads the row as it was, so concurrent ratings cannot lose updates
+    Returns whether the mechanic has a profile
+    """
+    updated = MechanicProfile.objects.filter(user_id=mechanic_id).update(
+        rating_sum=F('rating_sum') + stars,
+        rating_count=F('rating_count') + 1,
+        rating_avg=Round(
+            Cast(
+                Cast(F('rating_sum') + stars, FloatField()) / (F('rating_count') + 1),
+                DecimalField(max_digits=12, decimal_places=4)
+            ),
+            2
+        ),
+        updated_at=timezone.now()
+    )
+    if updated:
+        # update() skips the post_save signal that drops cached nearby searches
+        location = MechanicProfile.objects.filter(user_id=mechanic_id).values_list('latitude', 'longitude').first()
+        if location and None not in location:
+            transaction.on_commit(lambda: nearby_cache.invalidate_point(*location))
+    return bool(updated)
+
+
+def add_rating_to_summary(rating):
+    """
+    Count a new rating in its mechanic's star histogram and put it at the head of the
+    recent reviews; call inside the transaction that creates the rating. The summary
+    row stays locked until commit, so concurrent ratings apply one after the other.
+    """
+    summary = _locked_summary(rating.mechanic_id)
+    field = f'stars_{rating.stars}'
+    setattr(summary, field, getattr(summary, field) + 1)
+    summary.recent_reviews = [review_entry(rating)] + summary.recent_reviews[
+        :settings.RATING_SUMMARY_RECENT_REVIEWS - 1
+    ]
+    summary.save()
+    return summary
+
+
+def _locked_summary(mechanic_id):
+    summaries = MechanicRatingSummary.objects.select_for_update()
+    summary = summaries.filter(mechanic_id=mechanic_id).first()
+    if summary is None:
+        try:
+            with transaction.atomic():
+                return MechanicRatingSummary.objects.create(mechanic_id=mechanic_id)
+        except IntegrityError:
+            # Another rating created the row first; wait for its lock instead
+            summary = summaries.get(mechanic_id=mechanic_id)
+    return summary
+
+
+def review_entry(rating):
+    return RatingListSerializer(rating).data
+
+
+def recent_ratings(mechanic_id):
+    return Rating.objects.filter(mechanic_id=mechanic_id).select_related('customer').order_by(
+        '-created_at', '-id'
+    )[:settings.RATING_SUMMARY_RECENT_REVIEWS]
+
+
+def reconcile_profiles(profiles, dry_run=False):
+    """
+    Recompute the rating columns of the given profiles from their ratings
+    Returns the profiles that had drifted (and were fixed unless dry_run)
+    """
+    totals = {
+        row['mechanic_id']: (row['stars'], row['count'])
+        for row in Rating.objects.filter(mechanic_id__in=[profile.user_id for profile in profiles])
+        .values('mechanic_id').annotate(stars=Sum('stars'), count=Count('id'))
+    }
+    drifted = []
+    for profile in profiles:
+        stars_sum, count = totals.get(profile.user_id, (0, 0))
+        average = rating_average(stars_sum, count)
+        if (profile.rating_sum, profile.rating_count, profile.rating_avg) != (stars_sum, count, average):
+            profile.rating_sum, profile.rating_count, profile.rating_avg = stars_sum, count, average
+            profile.updated_at = timezone.now()
+            drifted.append(profile)
+    if drifted and not dry_run:
+        MechanicProfile.objects.bulk_update(drifted, ['rating_sum', 'rating_count', 'rating_avg', 'updated_at'])
+    return drifted
+
+
+def reconcile_summaries(mechanic_ids, dry_run=False):
+    """
+    Rebuild the rating summaries of the given mechanics from their ratings
+    Returns the ids of the mechanics whose summary had drifted (and was fixed unless dry_run)
+    """
+    mechanic_ids = list(mechanic_ids)
+    histograms = {mechanic_id: dict.fromkeys(range(1, 6), 0) for mechanic_id in mechanic_ids}
+    for row in Rating.objects.filter(mechanic_id__in=mechanic_ids).values('mechanic_id', 'stars').annotate(
+        count=Count('id')
+    ):
+        histograms[row['mechanic_id']][row['stars']] = row['count']
+    summaries = {
+        summary.mechanic_id: summary
+        for summary in MechanicRatingSummary.objects.select_for_update().filter(mechanic_id__in=mechanic_ids)
+    }
+    
+    drifted = []
+    for mechanic_id in mechanic_ids:
+        histogram = histograms[mechanic_id]
+        summary = summaries.get(mechanic_id)
+        if summary is None and not any(histogram.values()):
+            continue
+        if summary is None:
+            summary = MechanicRatingSummary(mechanic_id=mechanic_id)
+        recent = [review_entry(rating) for rating in recent_ratings(mechanic_id)] if any(histogram.values()) else []
+        if summary.histogram == histogram and [review['id'] for review in summary.recent_reviews] == [
+            review['id'] for review in recent
+        ]:
+            continue
+        drifted.append(mechanic_id)
+        if not dry_run:
+            for stars, count in histogram.items():
+                setattr(summary, f'stars_{stars}', count)
+            summary.recent_reviews = recent
+            summary.save()
+    return drifted
@@ -0,0 +1,48 @@
+from accounts.models import User
+from mechanic_assist.async_support import async_api_view, json_response
+from mechanic_assist.conditional import Validators
+from services.pagination import CreatedAtCursorPagination
+from .models import MechanicRatingSummary
+from .serializers import MechanicRatingSummarySerializer, RatingListSerializer
+from .views import RATING_VALIDATOR_FIELDS, mechanic_ratings_queryset, summary_cache_control
+
+
+@async_api_view(authenticated=False)
+async def mechanic_rating_summary_view(request, mechanic_id):
+    """Async counterpart of views.mechanic_rating_summary_view"""
+    summary = await MechanicRatingSummary.objects.filter(mechanic_id=mechanic_id).afirst()
+    if summary is None:
+        if not await User.objects.filter(id=mechanic_id, role='MECHANIC').aexists():
+            return json_response({'error': 'Mechanic not found'}, status=404)
+        return json_response(
+            MechanicRatingSummarySerializer(MechanicRatingSummary(mechanic_id=mechanic_id)).data,
+            headers={'Cache-Control': summary_cache_control()}
+        )
+    
+    validators = Validators.for_instances(request, summary)
+    not_modified = validators.not_modified(request)
+    if not_modified:
+        not_modified['Cache-Control'] = summary_cache_control()
+        return not_modified
+    
+    serializer = MechanicRatingSummarySerializer(summary)
+    return validators.apply(json_response(serializer.data, headers={'Cache-Control': summary_cache_control()}))
+
+
+@async_api_view(authenticated=False)
+async def mechanic_ratings_view(request, mechanic_id):
+    """Async counterpart of views.mechanic_ratings_view"""
+    if not await User.objects.filter(id=mechanic_id, role='MECHANIC').aexists():
+        return json_response({'error': 'Mechanic not found'}, status=404)
+    
+    ratings = mechanic_ratings_queryset(mechanic_id)
+    validators = await Validators.afor_querysets(request, ratings, fields=RATING_VALIDATOR_FIELDS)
+    not_modified = validators.not_modified(request)
+    if not_modified:
+        return not_modified
+    
+    paginator = CreatedAtCursorPagination()
+    page = paginator.get_page_queryset(ratings.select_related('customer'), request)
+    ratings = paginator.paginate_rows([rating async for rating in page])
+    serializer = RatingListSerializer(ratings, many=True)
+    return validators.apply(json_response(paginator.get_paginated_data(serializer.data)))
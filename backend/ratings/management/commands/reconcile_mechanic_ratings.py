@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ratings.aggregation import reconcile_profiles, reconcile_summaries
+from services.models import MechanicProfile
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute every mechanic profile rating_sum/rating_count/rating_avg and rating summary '
+        'from the ratings table, in batches'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+    
+    def handle(self, *args, **options):
+        last_id = 0
+        checked = fixed = summaries_fixed = 0
+        while True:
+            with transaction.atomic():
+                # Locked so a rating landing mid-batch is applied after the fix instead of lost
+                profiles = list(
+                    MechanicProfile.objects.select_for_update().filter(id__gt=last_id).order_by('id').only(
+                        'id', 'user_id', 'rating_sum', 'rating_count', 'rating_avg'
+                    )[:options['batch_size']]
+                )
+                if not profiles:
+                    break
+                drifted = reconcile_profiles(profiles, dry_run=options['dry_run'])
+                drifted_summaries = reconcile_summaries(
+                    [profile.user_id for profile in profiles], dry_run=options['dry_run']
+                )
+            
+            for profile in drifted:
+                self.stdout.write(
+                    f'Mechanic {profile.user_id}: sum={profile.rating_sum} count={profile.rating_count} '
+                    f'avg={profile.rating_avg}'
+                )
+            for mechanic_id in drifted_summaries:
+                self.stdout.write(f'Mechanic {mechanic_id}: rating summary rebuilt')
+            checked += len(profiles)
+            fixed += len(drifted)
+            summaries_fixed += len(drifted_summaries)
+            last_id = profiles[-1].id
+        
+        action = 'drifted' if options['dry_run'] else 'fixed'
+        self.stdout.write(
+            f'Checked {checked} mechanic profiles, {fixed} {action}, {summaries_fixed} rating summaries {action}'
+        )
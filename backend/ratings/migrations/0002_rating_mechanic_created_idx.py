@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['mechanic', '-created_at'], name='rating_mechanic_created_idx'),
+        ),
+    ]
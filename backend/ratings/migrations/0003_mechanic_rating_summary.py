@@ -0,0 +1,67 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:15
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+RECENT_REVIEWS = 5
+
+
+def populate_summaries(apps, schema_editor):
+    Rating = apps.get_model('ratings', 'Rating')
+    MechanicRatingSummary = apps.get_model('ratings', 'MechanicRatingSummary')
+    histograms = {}
+    for row in Rating.objects.values('mechanic_id', 'stars').annotate(count=Count('id')):
+        histograms.setdefault(row['mechanic_id'], {})[f"stars_{row['stars']}"] = row['count']
+
+    batch = []
+    for mechanic_id, histogram in histograms.items():
+        recent = Rating.objects.filter(mechanic_id=mechanic_id).select_related('customer').order_by(
+            '-created_at', '-id'
+        )[:RECENT_REVIEWS]
+        batch.append(MechanicRatingSummary(mechanic_id=mechanic_id, recent_reviews=[
+            {
+                'id': rating.id,
+                'customer_name': rating.customer.name,
+                'service_request': rating.service_request_id,
+                'stars': rating.stars,
+                'review_text': rating.review_text,
+                'created_at': rating.created_at,
+            }
+            for rating in recent
+        ], **histogram))
+        if len(batch) >= 1000:
+            MechanicRatingSummary.objects.bulk_create(batch)
+            batch = []
+    MechanicRatingSummary.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('ratings', '0002_rating_mechanic_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MechanicRatingSummary',
+            fields=[
+                ('mechanic', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('stars_1', models.PositiveIntegerField(default=0)),
+                ('stars_2', models.PositiveIntegerField(default=0)),
+                ('stars_3', models.PositiveIntegerField(default=0)),
+                ('stars_4', models.PositiveIntegerField(default=0)),
+                ('stars_5', models.PositiveIntegerField(default=0)),
+                ('recent_reviews', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'mechanic_rating_summaries',
+            },
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
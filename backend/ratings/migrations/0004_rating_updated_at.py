@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:24
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def copy_created_at(apps, schema_editor):
+    Rating = apps.get_model('ratings', 'Rating')
+    Rating.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('ratings', '0003_mechanic_rating_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rating',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['customer', 'updated_at', 'id'], name='rating_customer_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['mechanic', 'updated_at', 'id'], name='rating_mechanic_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0004_rating_updated_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='rating',
+            name='rating_mechanic_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['mechanic', '-created_at', '-id'], name='rating_mechanic_created_idx'),
+        ),
+    ]
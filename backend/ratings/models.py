@@ -1,8 +1,17 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from accounts.models import User
 from services.models import ServiceRequest
 
 
+def rating_average(stars_sum, count):
+    if not count:
+        return Decimal('0.00')
+    return (Decimal(stars_sum) / count).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
 class Rating(models.Model):
     """Rating model for mechanic reviews"""
     
@@ -12,11 +21,60 @@ class Rating(models.Model):
     stars = models.IntegerField(choices=[(i, i) for i in range(1, 6)])
     review_text = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         db_table = 'ratings'
         ordering = ['-created_at']
         unique_together = [['customer', 'service_request']]
+        indexes = [
+            # Mechanic rating list, keyset-paginated on (created_at, id)
+            models.Index(fields=['mechanic', '-created_at', '-id'], name='rating_mechanic_created_idx'),
+            # Delta sync walks each user's ratings on (updated_at, id)
+            models.Index(fields=['customer', 'updated_at', 'id'], name='rating_customer_updated_idx'),
+            models.Index(fields=['mechanic', 'updated_at', 'id'], name='rating_mechanic_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.customer.name} rated {self.mechanic.name} - {self.stars} stars"
+
+
+class MechanicRatingSummary(models.Model):
+    """
+    Star distribution and latest reviews of one mechanic, maintained as ratings are
+    written so a profile page reads a single row by primary key
+    """
+    
+    mechanic = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='rating_summary'
+    )
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+    # Newest first, at most RATING_SUMMARY_RECENT_REVIEWS entries shaped like RatingListSerializer
+    recent_reviews = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'mechanic_rating_summaries'
+    
+    def __str__(self):
+        return f"Rating summary of mechanic {self.mechanic_id}"
+    
+    @property
+    def histogram(self):
+        return {stars: getattr(self, f'stars_{stars}') for stars in range(1, 6)}
+    
+    @property
+    def count(self):
+        return sum(self.histogram.values())
+    
+    @property
+    def stars_sum(self):
+        return sum(stars * count for stars, count in self.histogram.items())
+    
+    @property
+    def average(self):
+        return rating_average(self.stars_sum, self.count)
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from accounts.serializers import UserSerializer
-from .models import Rating
+from .models import MechanicRatingSummary, Rating
 
 
 class RatingSerializer(serializers.ModelSerializer):
@@ -14,6 +14,29 @@ class RatingSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at')
 
 
+class RatingListSerializer(serializers.ModelSerializer):
+    """Lighter serializer for a mechanic's review list; the mechanic is implied by the URL"""
+    customer_name = serializers.CharField(source='customer.name', read_only=True)
+    
+    class Meta:
+        model = Rating
+        fields = ('id', 'customer_name', 'service_request', 'stars', 'review_text', 'created_at')
+        read_only_fields = fields
+
+
+class MechanicRatingSummarySerializer(serializers.ModelSerializer):
+    """Serializer for MechanicRatingSummary"""
+    mechanic_id = serializers.IntegerField(read_only=True)
+    average = serializers.DecimalField(max_digits=3, decimal_places=2, read_only=True)
+    count = serializers.IntegerField(read_only=True)
+    histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+    
+    class Meta:
+        model = MechanicRatingSummary
+        fields = ('mechanic_id', 'average', 'count', 'histogram', 'recent_reviews', 'updated_at')
+        read_only_fields = fields
+
+
 class RatingCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating rating"""
     mechanic_id = serializers.IntegerField(write_only=True, required=True)
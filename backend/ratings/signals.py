@@ -0,0 +1,11 @@
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from services.sync import record_tombstones
+from .models import Rating
+
+
+@receiver(pre_delete, sender=Rating)
+def tombstone_deleted_rating(sender, instance, **kwargs):
+    """Tell the devices of the customer and mechanic to drop the rating"""
+    record_tombstones('rating', [instance.customer_id, instance.mechanic_id], instance.pk)
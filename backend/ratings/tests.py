@@ -1,3 +1,166 @@
-from django.test import TestCase
+import json
+from decimal import Decimal
 
-# Create your tests here.
+from io import StringIO
+
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from mechanic_assist.query_budget import QueryBudgetTestMixin
+from services.models import MechanicProfile, ServiceRequest
+from . import async_views
+from .models import MechanicRatingSummary, Rating
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class RatingListQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+
+    def test_mechanic_ratings(self):
+        mechanic = User.objects.create_user(
+            email='mechanic@example.com', password='password', name='Mechanic', phone='5550100', role='MECHANIC'
+        )
+        for i in range(10):
+            customer = User.objects.create_user(
+                email=f'customer{i}@example.com', password='password', name='Customer', phone='5550100'
+            )
+            service_request = ServiceRequest.objects.create(
+                customer=customer, mechanic=mechanic, issue_text='Flat tyre', status='COMPLETED',
+                customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+            )
+            Rating.objects.create(customer=customer, mechanic=mechanic, service_request=service_request, stars=5)
+
+        with self.assertMaxQueries(3):
+            response = APIClient().get(f'/api/ratings/mechanic/{mechanic.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 10)
+
+
+class RatingAggregationTests(TestCase):
+    
+    def test_ratings_update_running_totals_and_reconcile_fixes_drift(self):
+        mechanic = User.objects.create_user(
+            email='mechanic@example.com', password='password', name='Mechanic', phone='5550100', role='MECHANIC'
+        )
+        profile = MechanicProfile.objects.create(user=mechanic)
+        for i, stars in enumerate([5, 4, 4]):
+            customer = User.objects.create_user(
+                email=f'customer{i}@example.com', password='password', name='Customer', phone='5550100'
+            )
+            service_request = ServiceRequest.objects.create(
+                customer=customer, mechanic=mechanic, issue_text='Flat tyre', status='COMPLETED',
+                customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+            )
+            client = APIClient()
+            client.force_authenticate(customer)
+            response = client.post('/api/ratings/add/', {
+                'mechanic_id': mechanic.id, 'service_request_id': service_request.id, 'stars': stars
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+        
+        profile.refresh_from_db()
+        self.assertEqual((profile.rating_sum, profile.rating_count, profile.rating_avg), (13, 3, Decimal('4.33')))
+        
+        MechanicProfile.objects.filter(pk=profile.pk).update(rating_sum=1, rating_avg=Decimal('0.33'))
+        output = StringIO()
+        call_command('reconcile_mechanic_ratings', stdout=output)
+        self.assertIn('1 fixed', output.getvalue())
+        profile.refresh_from_db()
+        self.assertEqual((profile.rating_sum, profile.rating_count, profile.rating_avg), (13, 3, Decimal('4.33')))
+
+
+@override_settings(QUERY_BUDGET_STRICT=True, RATING_SUMMARY_RECENT_REVIEWS=2)
+class RatingSummaryTests(QueryBudgetTestMixin, TestCase):
+    
+    def setUp(self):
+        self.mechanic = User.objects.create_user(
+            email='mechanic@example.com', password='password', name='Mechanic', phone='5550100', role='MECHANIC'
+        )
+    
+    def rate(self, stars, review_text=''):
+        customer = User.objects.create_user(
+            email=f'customer{Rating.objects.count()}@example.com', password='password', name='Customer',
+            phone='5550100'
+        )
+        service_request = ServiceRequest.objects.create(
+            customer=customer, mechanic=self.mechanic, issue_text='Flat tyre', status='COMPLETED',
+            customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+        )
+        client = APIClient()
+        client.force_authenticate(customer)
+        response = client.post('/api/ratings/add/', {
+            'mechanic_id': self.mechanic.id, 'service_request_id': service_request.id,
+            'stars': stars, 'review_text': review_text
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+    
+    def test_summary_is_maintained_on_write_and_read_with_one_query(self):
+        for stars, text in [(5, 'Great'), (4, 'Good'), (5, 'Quick')]:
+            self.rate(stars, text)
+        
+        with self.assertMaxQueries(1):
+            response = APIClient().get(f'/api/ratings/mechanic/{self.mechanic.id}/summary/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(response.data['average'], '4.67')
+        self.assertEqual(response.data['histogram'], {'1': 0, '2': 0, '3': 0, '4': 1, '5': 2})
+        self.assertEqual([review['review_text'] for review in response.data['recent_reviews']], ['Quick', 'Good'])
+        
+        response = APIClient().get(
+            f'/api/ratings/mechanic/{self.mechanic.id}/summary/', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+        self.rate(1)
+        response = APIClient().get(
+            f'/api/ratings/mechanic/{self.mechanic.id}/', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            APIClient().get(
+                f'/api/ratings/mechanic/{self.mechanic.id}/', HTTP_IF_NONE_MATCH=response['ETag']
+            ).status_code,
+            304
+        )
+    
+    def test_summary_of_unrated_and_unknown_mechanics(self):
+        response = APIClient().get(f'/api/ratings/mechanic/{self.mechanic.id}/summary/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['count'], response.data['average']), (0, '0.00'))
+        self.assertEqual(response.data['recent_reviews'], [])
+        
+        response = APIClient().get(f'/api/ratings/mechanic/{self.mechanic.id + 1000}/summary/')
+        self.assertEqual(response.status_code, 404)
+    
+    def test_reconcile_rebuilds_drifted_summary(self):
+        MechanicProfile.objects.create(user=self.mechanic)
+        for stars in [3, 4]:
+            self.rate(stars)
+        MechanicRatingSummary.objects.filter(mechanic=self.mechanic).update(stars_3=7, recent_reviews=[])
+        
+        output = StringIO()
+        call_command('reconcile_mechanic_ratings', stdout=output)
+        self.assertIn('1 rating summaries fixed', output.getvalue())
+        summary = MechanicRatingSummary.objects.get(mechanic=self.mechanic)
+        self.assertEqual((summary.stars_3, summary.stars_4), (1, 1))
+        self.assertEqual(len(summary.recent_reviews), 2)
+    
+    def test_async_views_match_the_sync_views(self):
+        for stars, text in [(5, 'Great'), (4, 'Good'), (5, 'Quick')]:
+            self.rate(stars, text)
+        
+        unknown = self.mechanic.id + 1000
+        for view, mechanic_id, path in [
+            (async_views.mechanic_ratings_view, self.mechanic.id, f'/api/ratings/mechanic/{self.mechanic.id}/?page_size=2'),
+            (async_views.mechanic_ratings_view, unknown, f'/api/ratings/mechanic/{unknown}/'),
+            (async_views.mechanic_rating_summary_view, self.mechanic.id, f'/api/ratings/mechanic/{self.mechanic.id}/summary/'),
+            (async_views.mechanic_rating_summary_view, unknown, f'/api/ratings/mechanic/{unknown}/summary/'),
+        ]:
+            expected = APIClient().get(path)
+            response = async_to_sync(view)(AsyncRequestFactory().get(path), mechanic_id)
+            self.assertEqual(response.status_code, expected.status_code, path)
+            self.assertEqual(json.loads(response.content), expected.json(), path)
+            for header in ('ETag', 'Cache-Control'):
+                self.assertEqual(response.get(header), expected.get(header), (path, header))
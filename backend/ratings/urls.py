@@ -1,8 +1,15 @@
+from django.conf import settings
 from django.urls import path
-from .views import RatingCreateView, mechanic_ratings_view
+from . import async_views
+from .views import RatingCreateView, mechanic_rating_summary_view, mechanic_ratings_view
 
 urlpatterns = [
     path('add/', RatingCreateView.as_view(), name='add-rating'),
-    path('mechanic/<int:mechanic_id>/', mechanic_ratings_view, name='mechanic-ratings'),
+    path('mechanic/<int:mechanic_id>/',
+         async_views.mechanic_ratings_view if settings.ASYNC_VIEWS else mechanic_ratings_view,
+         name='mechanic-ratings'),
+    path('mechanic/<int:mechanic_id>/summary/',
+         async_views.mechanic_rating_summary_view if settings.ASYNC_VIEWS else mechanic_rating_summary_view,
+         name='mechanic-rating-summary'),
 ]
 
@@ -1,15 +1,22 @@
 from rest_framework import status, generics, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from django.db.models import Avg
+from django.conf import settings
+from django.db import transaction
 from accounts.models import User
+from mechanic_assist.conditional import Validators
+from mechanic_assist.query_budget import query_budget
+from services.idempotency import IdempotentCreateMixin
 from services.models import MechanicProfile, ServiceRequest
-from .models import Rating
-from .serializers import RatingSerializer, RatingCreateSerializer
+from services.pagination import CreatedAtCursorPagination
+from .aggregation import add_rating_to_profile, add_rating_to_summary
+from .models import MechanicRatingSummary, Rating
+from .serializers import MechanicRatingSummarySerializer, RatingCreateSerializer, RatingListSerializer
 
 
-class RatingCreateView(generics.CreateAPIView):
-    """Create a rating"""
+class RatingCreateView(IdempotentCreateMixin, generics.CreateAPIView):
+    """Create a rating; retries with the same Idempotency-Key replay the first response"""
+    idempotency_scope = 'ratings.create'
     queryset = Rating.objects.all()
     serializer_class = RatingCreateSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -48,36 +55,80 @@ class RatingCreateView(generics.CreateAPIView):
             from rest_framework.exceptions import ValidationError
             raise ValidationError("You have already rated this service")
         
-        # Create rating
-        rating = serializer.save(
-            customer=customer,
-            mechanic=mechanic,
-            service_request=service_request
-        )
-        
-        # Update mechanic's average rating
-        mechanic_profile = mechanic.mechanic_profile
-        ratings = Rating.objects.filter(mechanic=mechanic)
-        avg_rating = ratings.aggregate(Avg('stars'))['stars__avg'] or 0.0
-        mechanic_profile.rating_avg = round(avg_rating, 2)
-        mechanic_profile.rating_count = ratings.count()
-        mechanic_profile.save()
+        # Create rating and fold it into the mechanic's running totals
+        with transaction.atomic():
+            rating = serializer.save(
+                customer=customer,
+                mechanic=mechanic,
+                service_request=service_request
+            )
+            add_rating_to_profile(mechanic.id, rating.stars)
+            add_rating_to_summary(rating)
         
         return rating
 
 
+# Ratings are not edited through the API; the list shows each customer's name
+RATING_VALIDATOR_FIELDS = ('created_at', 'customer__updated_at')
+
+
+def summary_cache_control():
+    return f'public, max-age={settings.RATING_SUMMARY_MAX_AGE_SECONDS}'
+
+
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
+@query_budget(2)
+def mechanic_rating_summary_view(request, mechanic_id):
+    """Get a mechanic's star distribution, average, count and latest reviews"""
+    summary = MechanicRatingSummary.objects.filter(mechanic_id=mechanic_id).first()
+    if summary is None:
+        # Only mechanics without any rating get here
+        if not User.objects.filter(id=mechanic_id, role='MECHANIC').exists():
+            return Response(
+                {'error': 'Mechanic not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(
+            MechanicRatingSummarySerializer(MechanicRatingSummary(mechanic_id=mechanic_id)).data,
+            status=status.HTTP_200_OK,
+            headers={'Cache-Control': summary_cache_control()}
+        )
+    
+    validators = Validators.for_instances(request, summary)
+    not_modified = validators.not_modified(request)
+    if not_modified:
+        not_modified['Cache-Control'] = summary_cache_control()
+        return not_modified
+    
+    serializer = MechanicRatingSummarySerializer(summary)
+    return validators.apply(Response(serializer.data, status=status.HTTP_200_OK, headers={
+        'Cache-Control': summary_cache_control()
+    }))
+
+
+def mechanic_ratings_queryset(mechanic_id):
+    return Rating.objects.filter(mechanic_id=mechanic_id)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+@query_budget(3)
 def mechanic_ratings_view(request, mechanic_id):
-    """Get all ratings for a mechanic"""
-    try:
-        mechanic = User.objects.get(id=mechanic_id, role='MECHANIC')
-    except User.DoesNotExist:
+    """Get a mechanic's ratings, newest first, one cursor page at a time"""
+    if not User.objects.filter(id=mechanic_id, role='MECHANIC').exists():
         return Response(
             {'error': 'Mechanic not found'},
             status=status.HTTP_404_NOT_FOUND
         )
     
-    ratings = Rating.objects.filter(mechanic=mechanic).order_by('-created_at')
-    serializer = RatingSerializer(ratings, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    ratings = mechanic_ratings_queryset(mechanic_id)
+    validators = Validators.for_querysets(request, ratings, fields=RATING_VALIDATOR_FIELDS)
+    not_modified = validators.not_modified(request)
+    if not_modified:
+        return not_modified
+    
+    paginator = CreatedAtCursorPagination()
+    ratings = paginator.paginate_queryset(ratings.select_related('customer'), request)
+    serializer = RatingListSerializer(ratings, many=True)
+    return validators.apply(paginator.get_paginated_response(serializer.data))
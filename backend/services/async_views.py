@@ -0,0 +1,118 @@
+import asyncio
+import math
+
+from django.conf import settings
+
+from mechanic_assist.async_support import async_api_view, json_response, run_sync
+from mechanic_assist.conditional import Validators
+from mechanic_assist.throttling import NearbySearchIPThrottle, NearbySearchUserThrottle
+from .events import get_broker, user_channel
+from .pagination import CreatedAtCursorPagination
+from .serializers import ServiceRequestListSerializer
+from .sync import SyncCursorExpired, checked_sync_positions, current_sync_cursor
+from .views import (
+    REQUEST_VALIDATOR_FIELDS, SYNC_KINDS, customer_requests_queryset, find_nearby_mechanics,
+    mechanic_requests_querysets, parse_nearby_params, sync_data
+)
+
+
+@async_api_view(throttle_classes=(NearbySearchUserThrottle, NearbySearchIPThrottle))
+async def nearby_mechanics_view(request):
+    """Async counterpart of views.nearby_mechanics_view"""
+    params, error = parse_nearby_params(request.GET)
+    if error:
+        return json_response({'error': error}, status=400)
+    
+    # The index lookup and profile hydration are sync; keep them off the event loop
+    results, next_cursor = await run_sync(find_nearby_mechanics, params)
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor else {}
+    return json_response(results, headers=headers)
+
+
+@async_api_view()
+async def customer_requests_view(request):
+    """Async counterpart of views.customer_requests_view"""
+    user = request.user
+    
+    if user.role != 'CUSTOMER':
+        return json_response({'error': 'Only customers can view their requests'}, status=403)
+    
+    validators = await Validators.afor_querysets(
+        request, customer_requests_queryset(user), fields=REQUEST_VALIDATOR_FIELDS
+    )
+    not_modified = validators.not_modified(request)
+    if not_modified:
+        return not_modified
+    
+    paginator = CreatedAtCursorPagination()
+    page = paginator.get_page_queryset(customer_requests_queryset(user), request)
+    requests = paginator.paginate_rows([service_request async for service_request in page])
+    serializer = ServiceRequestListSerializer(requests, many=True)
+    return validators.apply(json_response(paginator.get_paginated_data(serializer.data)))
+
+
+@async_api_view()
+async def mechanic_requests_view(request):
+    """Async counterpart of views.mechanic_requests_view"""
+    user = request.user
+    
+    if user.role != 'MECHANIC':
+        return json_response({'error': 'Only mechanics can view their requests'}, status=403)
+    
+    querysets = mechanic_requests_querysets(user)
+    validators = await Validators.afor_querysets(request, *querysets, fields=REQUEST_VALIDATOR_FIELDS)
+    not_modified = validators.not_modified(request)
+    if not_modified:
+        return not_modified
+    
+    paginator = CreatedAtCursorPagination()
+    pages = [
+        [service_request async for service_request in paginator.get_page_queryset(queryset, request)]
+        for queryset in querysets
+    ]
+    requests = paginator.merge_rows(*pages)
+    serializer = ServiceRequestListSerializer(requests, many=True)
+    return validators.apply(json_response(paginator.get_paginated_data(serializer.data)))
+
+
+@async_api_view()
+async def wait_for_work_view(request):
+    """
+    Long-poll for mechanics that cannot hold a WebSocket: wait up to `timeout` seconds
+    (LONG_POLL_MAX_SECONDS at most) for an event about their requests, such as a new
+    offer or an assignment, then answer like the sync view does for the `since` cursor
+    
+    Waiting is a subscription to the event broker and runs no queries. The changes are
+    read once when the wait ends, whether woken or timed out, so an event published
+    between two polls is still picked up by the next answer.
+    """
+    user = request.user
+    
+    if user.role != 'MECHANIC':
+        return json_response({'error': 'Only mechanics can wait for work'}, status=403)
+    
+    try:
+        timeout = float(request.GET.get('timeout', settings.LONG_POLL_MAX_SECONDS))
+        if not math.isfinite(timeout):
+            raise ValueError(timeout)
+    except ValueError:
+        return json_response({'error': 'timeout must be a number of seconds'}, status=400)
+    timeout = min(max(timeout, 1.0), settings.LONG_POLL_MAX_SECONDS)
+    
+    cursor = request.GET.get('since')
+    try:
+        if cursor:
+            checked_sync_positions(cursor, [*SYNC_KINDS, 'deleted'])
+        else:
+            cursor = current_sync_cursor(SYNC_KINDS)
+    except ValueError:
+        return json_response({'error': 'Invalid since cursor'}, status=400)
+    except SyncCursorExpired:
+        return json_response({'error': 'The since cursor has expired; sync again without it'}, status=410)
+    
+    with get_broker().subscribe([user_channel(user.id)]) as subscription:
+        try:
+            await subscription.get(timeout)
+        except asyncio.TimeoutError:
+            pass
+    return json_response(await run_sync(sync_data, user, cursor))
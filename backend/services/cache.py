@@ -0,0 +1,121 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .utils import calculate_distances
+
+
+# Kilometers per degree of latitude; an upper bound for a degree of longitude
+KM_PER_DEGREE = 111.32
+
+
+class NearbySearchCache:
+    """
+    Per-process LRU cache of nearby search results
+
+    Entries are keyed on the search origin snapped to a grid of
+    NEARBY_CACHE_CELL_DEGREES plus the filter parameters, so customers searching from
+    almost the same spot share one computation. Entries expire after
+    NEARBY_CACHE_TTL_SECONDS; a mechanic change drops only the cells whose searches
+    could have included that mechanic, and only in the worker that saved the change
+    (or flushed the location ping), so other workers may answer from an entry for up
+    to the TTL after a mechanic moved or became unavailable.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._cells = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def snap(self, lat, lng):
+        """Return the grid cell of a coordinate and the coordinate of its center"""
+        size = settings.NEARBY_CACHE_CELL_DEGREES
+        cell = (math.floor(float(lat) / size), math.floor(float(lng) / size))
+        return cell, ((cell[0] + 0.5) * size, (cell[1] + 0.5) * size)
+
+    def slack_km(self):
+        """Farthest any point of a cell can be from its center: half the cell's diagonal"""
+        return settings.NEARBY_CACHE_CELL_DEGREES * KM_PER_DEGREE * math.sqrt(2) / 2
+
+    def get(self, cell, params):
+        key = (cell, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def set(self, cell, params, radius_km, value):
+        key = (cell, params)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            expires_at = time.monotonic() + settings.NEARBY_CACHE_TTL_SECONDS
+            self._entries[key] = (expires_at, radius_km, value)
+            self._cells.setdefault(cell, set()).add(key)
+            while len(self._entries) > settings.NEARBY_CACHE_MAX_ENTRIES:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_point(self, lat, lng):
+        """Drop every entry whose search area could contain the given coordinate"""
+        size = settings.NEARBY_CACHE_CELL_DEGREES
+        # Searches run from the cell center and reach radius_km beyond anywhere in the cell
+        slack_km = self.slack_km()
+        with self._lock:
+            if not self._cells:
+                return
+            cells = list(self._cells)
+            distances = calculate_distances(
+                (lat, lng),
+                [(row + 0.5) * size for row, _ in cells],
+                [(col + 0.5) * size for _, col in cells]
+            )
+            for cell, distance in zip(cells, distances):
+                for key in list(self._cells[cell]):
+                    if distance <= self._entries[key][1] + slack_km:
+                        self._remove(key)
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._cells.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'cell_degrees': settings.NEARBY_CACHE_CELL_DEGREES,
+                'ttl_seconds': settings.NEARBY_CACHE_TTL_SECONDS,
+                'entries': len(self._entries),
+                'cells': len(self._cells),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._cells.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._cells[key[0]]
+
+
+nearby_cache = NearbySearchCache()
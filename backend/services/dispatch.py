@@ -0,0 +1,196 @@
+"""
+Batch dispatch of open service requests to available mechanics.
+
+Each tick takes the oldest open unassigned requests and the available mechanics that
+are not busy with another request, and assigns them in one batch. Every request
+gets its DISPATCH_CANDIDATES nearest mechanics of the right skill within
+DISPATCH_RADIUS_KM as candidate edges. The edges are then taken greedily, cheapest
+first, where the cost is the distance minus DISPATCH_RATING_WEIGHT_KM per star of
+rating. Requests whose candidates were all taken by cheaper edges look again among
+the mechanics still free, for up to DISPATCH_ROUNDS rounds.
+
+This sparse greedy matching is not the optimum an assignment solver such as the
+Hungarian algorithm would find on the full distance matrix. That matrix would hold
+10^8 cells at 10k x 10k, and the solver runs in cubic time. The greedy tick costs
+O(R * k log M) and stays well inside a second at that size.
+"""
+
+import logging
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Case, DecimalField, IntegerField, Value, When
+from django.utils import timezone
+
+from .events import publish_request_event
+from .inbox import prune_requests
+from .models import MechanicProfile, ServiceRequest
+from .spatial import KDTree, chord_sq_to_km, km_to_chord_sq, to_unit_vector
+from .utils import calculate_estimated_cost
+
+
+logger = logging.getLogger(__name__)
+
+UPDATE_BATCH_SIZE = 500
+
+
+class MechanicPool:
+    """
+    Mechanics that can take work in one tick, searchable nearest first
+    Keeps one tree per skill besides the one over everybody, so a skill search never
+    has to walk past mechanics of other skills
+    """
+
+    def __init__(self, mechanics):
+        """mechanics: iterable of (key, lat, lng, skill_type, rating_avg)"""
+        groups = {None: ([], [])}
+        self.ratings = {}
+        for key, lat, lng, skill_type, rating in mechanics:
+            point = to_unit_vector(lat, lng)
+            for group in {None, skill_type}:
+                keys, points = groups.setdefault(group, ([], []))
+                keys.append(key)
+                points.append(point)
+            self.ratings[key] = float(rating or 0)
+        self.trees = {group: KDTree(keys, points) for group, (keys, points) in groups.items()}
+
+    def __len__(self):
+        return len(self.ratings)
+
+    def nearest(self, lat, lng, skill_type, k, radius_km, accept=None):
+        """Up to k (distance_km, key) pairs for mechanics with skill_type (any when None)"""
+        tree = self.trees.get(skill_type)
+        if tree is None:
+            return []
+        is_match = None if accept is None else lambda key, chord_sq: accept(key)
+        found = tree.query(to_unit_vector(lat, lng), k, km_to_chord_sq(radius_km), is_match)
+        return [(chord_sq_to_km(chord_sq), key) for chord_sq, key in found]
+
+
+def match_requests(requests, pool, radius_km=None, candidates=None, rounds=None, rating_weight_km=None,
+                   unavailable=()):
+    """
+    Assign requests, given as (request_id, lat, lng, skill_type), to mechanics of pool
+    Each mechanic takes at most one request, and mechanics in unavailable none.
+    Returns {request_id: (mechanic_key, distance_km)} for the requests that were matched
+    """
+    radius_km = settings.DISPATCH_RADIUS_KM if radius_km is None else radius_km
+    candidates = settings.DISPATCH_CANDIDATES if candidates is None else candidates
+    rounds = settings.DISPATCH_ROUNDS if rounds is None else rounds
+    rating_weight_km = settings.DISPATCH_RATING_WEIGHT_KM if rating_weight_km is None else rating_weight_km
+
+    assignments = {}
+    taken = set(unavailable)
+    ratings = pool.ratings
+
+    def is_free(key):
+        return key not in taken
+
+    pending = list(requests)
+    for _ in range(rounds):
+        edges = []
+        for request_id, lat, lng, skill_type in pending:
+            for distance_km, key in pool.nearest(lat, lng, skill_type, candidates, radius_km, is_free):
+                edges.append((distance_km - rating_weight_km * ratings[key], request_id, key, distance_km))
+        if not edges:
+            break
+
+        edges.sort()
+        for _, request_id, key, distance_km in edges:
+            if request_id in assignments or key in taken:
+                continue
+            assignments[request_id] = (key, distance_km)
+            taken.add(key)
+
+        pending = [request for request in pending if request[0] not in assignments]
+        if not pending:
+            break
+    return assignments
+
+
+def _assign(assignments, now):
+    """
+    Write assignments {request_id: (mechanic_id, distance_km)} with conditional UPDATEs
+    that only touch requests still open and unassigned. Returns the ids that were assigned
+    """
+    request_ids = list(assignments)
+    for start in range(0, len(request_ids), UPDATE_BATCH_SIZE):
+        batch = request_ids[start:start + UPDATE_BATCH_SIZE]
+        mechanic_ids, distances, costs = [], [], []
+        for request_id in batch:
+            mechanic_id, distance_km = assignments[request_id]
+            distance_km = round(distance_km, 2)
+            mechanic_ids.append(When(pk=request_id, then=Value(mechanic_id)))
+            distances.append(When(pk=request_id, then=Value(Decimal(f'{distance_km:.2f}'))))
+            costs.append(When(pk=request_id, then=Value(Decimal(f'{calculate_estimated_cost(distance_km):.2f}'))))
+
+        ServiceRequest.objects.filter(pk__in=batch, mechanic__isnull=True, status='REQUESTED').update(
+            mechanic_id=Case(*mechanic_ids, output_field=IntegerField()),
+            distance_km=Case(*distances, output_field=DecimalField(max_digits=10, decimal_places=2)),
+            estimated_cost=Case(*costs, output_field=DecimalField(max_digits=10, decimal_places=2)),
+            updated_at=now
+        )
+
+    # A row holding the mechanic this tick wrote was assigned by it; ticks sharing a
+    # timestamp made updated_at unreliable for telling them apart
+    written = ServiceRequest.objects.filter(pk__in=request_ids, mechanic__isnull=False).values_list('id', 'mechanic_id')
+    return [request_id for request_id, mechanic_id in written if assignments[request_id][0] == mechanic_id]
+
+
+def run_dispatch_tick(limit=None, publish=True):
+    """
+    Match the oldest open unassigned requests (at most limit, DISPATCH_BATCH_SIZE by
+    default) to free mechanics and assign them. Returns statistics about the tick
+    """
+    started = time.perf_counter()
+    limit = settings.DISPATCH_BATCH_SIZE if limit is None else limit
+
+    requests = list(
+        ServiceRequest.objects.filter(mechanic__isnull=True, status='REQUESTED')
+        .order_by('created_at', 'id')
+        .values_list('id', 'customer_lat', 'customer_lng', 'skill_type')[:limit]
+    )
+    stats = {'open': len(requests), 'mechanics': 0, 'matched': 0, 'assigned': 0, 'mean_distance_km': None}
+    if requests:
+        busy = set(
+            ServiceRequest.objects.filter(status__in=('REQUESTED', 'ACCEPTED'), mechanic__isnull=False)
+            .values_list('mechanic_id', flat=True).distinct()
+        )
+        pool = MechanicPool(
+            (user_id, lat, lng, skill_type, rating)
+            for user_id, lat, lng, skill_type, rating in MechanicProfile.objects.filter(
+                availability=True, latitude__isnull=False, longitude__isnull=False
+            ).values_list('user_id', 'latitude', 'longitude', 'skill_type', 'rating_avg').iterator(chunk_size=5000)
+            if user_id not in busy
+        )
+        matched_at = time.perf_counter()
+        assignments = match_requests(
+            [(request_id, float(lat), float(lng), skill_type) for request_id, lat, lng, skill_type in requests],
+            pool
+        )
+        stats['match_ms'] = round((time.perf_counter() - matched_at) * 1000, 2)
+
+        assigned = _assign(assignments, timezone.now()) if assignments else []
+        prune_requests(assigned)
+        stats.update({
+            'mechanics': len(pool),
+            'matched': len(assignments),
+            'assigned': len(assigned),
+            'mean_distance_km': round(
+                sum(assignments[request_id][1] for request_id in assigned) / len(assigned), 2
+            ) if assigned else None,
+        })
+
+        if publish and assigned:
+            service_requests = ServiceRequest.objects.filter(pk__in=assigned).select_related('customer', 'mechanic')
+            for service_request in service_requests.iterator(chunk_size=UPDATE_BATCH_SIZE):
+                publish_request_event('request.assigned', service_request)
+
+    stats['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    if requests:
+        logger.info(
+            'Dispatched %(assigned)d of %(open)d open requests to %(mechanics)d free mechanics '
+            'in %(duration_ms)sms', stats
+        )
+    return stats
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class Subscription:
+    """An asyncio queue receiving the messages published to some channels"""
+
+    def __init__(self, broker, channels, loop):
+        self.broker = broker
+        self.channels = tuple(channels)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def deliver(self, message):
+        """Hand a message to the subscriber; safe to call from any thread"""
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A consumer this far behind resyncs over HTTP anyway
+            logger.warning('Dropping event for slow subscriber on %s', self.channels)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class InProcessBroker:
+    """
+    Pub/sub between the views and the async consumers of a single process
+    Deployments with several processes or nodes need a broker that fans messages
+    out between them, such as PostgresNotifyBroker
+    """
+
+    # Whether a message published in one process reaches subscribers in the others
+    cross_process = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self, channels):
+        """Must be called from the event loop that will consume the subscription"""
+        subscription = Subscription(self, channels, asyncio.get_running_loop())
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+    def publish(self, channel, message):
+        self.deliver_local(channel, message)
+
+    def deliver_local(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+
+class PostgresNotifyBroker(InProcessBroker):
+    """
+    Fan messages out across processes and nodes through PostgreSQL LISTEN/NOTIFY
+    Each process keeps one listening connection, opened on its first subscriber and
+    reopened with exponential backoff when it fails; events published while it is down
+    are missed. NOTIFY payloads are limited to 8000 bytes, which comfortably fits one event
+    """
+
+    pg_channel = 'mechanic_assist_events'
+    cross_process = True
+    # Delay before reconnecting the listener, doubled after each failed attempt
+    reconnect_delay_seconds = 1
+    max_reconnect_delay_seconds = 60
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def publish(self, channel, message):
+        payload = json.dumps({'channel': channel, 'message': message}, cls=JSONEncoder)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.pg_channel, payload])
+
+    def subscribe(self, channels):
+        self._ensure_listener()
+        return super().subscribe(channels)
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='pg-event-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        import psycopg2
+
+        delay = self.reconnect_delay_seconds
+        while True:
+            try:
+                pg_connection = self._connect_listener()
+            except psycopg2.Error:
+                logger.exception('Could not open event listener connection; retrying in %ss', delay)
+            else:
+                delay = self.reconnect_delay_seconds
+                try:
+                    self._receive(pg_connection)
+                except (psycopg2.Error, OSError):
+                    logger.exception('Lost event listener connection; reconnecting in %ss', delay)
+                finally:
+                    pg_connection.close()
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay_seconds)
+
+    def _connect_listener(self):
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        params = connections['default'].get_connection_params()
+        pg_connection = psycopg2.connect(**params)
+        try:
+            pg_connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with pg_connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {self.pg_channel}')
+        except BaseException:
+            pg_connection.close()
+            raise
+        return pg_connection
+
+    def _receive(self, pg_connection):
+        while True:
+            if select.select([pg_connection], [], [], 30) == ([], [], []):
+                continue
+            pg_connection.poll()
+            while pg_connection.notifies:
+                notify = pg_connection.notifies.pop(0)
+                try:
+                    data = json.loads(notify.payload)
+                    self.deliver_local(data['channel'], data['message'])
+                except (ValueError, KeyError):
+                    logger.warning('Ignoring malformed event payload')
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.EVENT_BROKER)()
+
+
+def publish_request_event(event_type, service_request, recipients=None):
+    """
+    Push a service request change to its customer and mechanic, or to the given
+    user ids, once the current transaction commits
+    """
+    from .serializers import ServiceRequestListSerializer
+
+    message = {
+        'type': event_type,
+        'request': ServiceRequestListSerializer(service_request).data,
+    }
+    if recipients is None:
+        recipients = {service_request.customer_id, service_request.mechanic_id} - {None}
+
+    def publish():
+        broker = get_broker()
+        for user_id in recipients:
+            broker.publish(user_channel(user_id), message)
+    transaction.on_commit(publish)
@@ -0,0 +1,100 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 64
+
+
+def request_fingerprint(data):
+    payload = json.dumps(data, sort_keys=True, cls=JSONEncoder)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class IdempotentCreateMixin:
+    """
+    Make a create view safe to retry with an Idempotency-Key header
+
+    The first request with a key runs normally and its successful response is stored.
+    Retries with the same key within IDEMPOTENCY_TTL_SECONDS get that stored response back
+    without running the view again. Failed requests are not stored, so they can be
+    retried. A retry that arrives while the first request is still running gets a 409.
+    Reusing a key with a different body gets a 422.
+    """
+    idempotency_scope = None
+
+    def post(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return super().post(request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        fingerprint = request_fingerprint(request.data)
+        record, created = self._claim(request.user, key, fingerprint)
+        if not created:
+            return self._replay(record, fingerprint)
+
+        try:
+            response = super().post(request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+
+        if status.is_success(response.status_code):
+            record.status_code = response.status_code
+            record.response_body = response.data
+            record.save(update_fields=['status_code', 'response_body'])
+        else:
+            record.delete()
+        return response
+
+    def _claim(self, user, key, fingerprint):
+        """Insert the key, or return the live record another request already stored for it"""
+        lookup = {'user': user, 'scope': self.idempotency_scope, 'key': key}
+        now = timezone.now()
+        for _ in range(2):
+            try:
+                with transaction.atomic():
+                    return IdempotencyKey.objects.create(request_hash=fingerprint, **lookup), True
+            except IntegrityError:
+                record = IdempotencyKey.objects.filter(**lookup).first()
+                if record is None:
+                    continue
+                expired = record.created_at < now - timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS)
+                abandoned = record.status_code is None and (
+                    record.created_at < now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+                )
+                if not (expired or abandoned):
+                    return record, False
+                # Only the request that deletes the stale record gets to claim the key again
+                if not IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).delete()[0]:
+                    return record, False
+        return IdempotencyKey.objects.filter(**lookup).first(), False
+
+    def _replay(self, record, fingerprint):
+        if record is not None and record.request_hash != fingerprint:
+            return Response(
+                {'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if record is None or record.status_code is None:
+            return Response(
+                {'error': 'A request with this Idempotency-Key is still being processed'},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(record.response_body, status=record.status_code, headers={REPLAYED_HEADER: 'true'})
@@ -0,0 +1,142 @@
+import heapq
+import logging
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+
+from .events import publish_request_event
+from .models import MechanicInboxEntry, MechanicProfile
+from .spatial import cursor_distance, mechanic_index
+from .sync import record_withdrawn_offers
+from .utils import bounding_box, calculate_distances, location_cells_for_box
+
+
+logger = logging.getLogger(__name__)
+
+
+class InboxStats:
+    """Per-process fan-out counters, served by the admin inbox endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals = {'requests': 0, 'entries': 0, 'pruned_requests': 0, 'duration_ms': 0.0}
+        self.max_duration_ms = 0.0
+        self.last_fan_out = None
+
+    def record_fan_out(self, fan_out):
+        with self._lock:
+            self.totals['requests'] += 1
+            self.totals['entries'] += fan_out['recipients']
+            self.totals['duration_ms'] += fan_out['duration_ms']
+            self.max_duration_ms = max(self.max_duration_ms, fan_out['duration_ms'])
+            self.last_fan_out = fan_out
+
+    def record_prune(self, count):
+        with self._lock:
+            self.totals['pruned_requests'] += count
+
+    def stats(self):
+        with self._lock:
+            requests = self.totals['requests']
+            return {
+                'radius_km': settings.INBOX_RADIUS_KM,
+                'max_recipients': settings.INBOX_MAX_RECIPIENTS,
+                'totals': {**self.totals, 'duration_ms': round(self.totals['duration_ms'], 2)},
+                'mean_recipients': round(self.totals['entries'] / requests, 2) if requests else None,
+                'mean_duration_ms': round(self.totals['duration_ms'] / requests, 2) if requests else None,
+                'max_duration_ms': self.max_duration_ms,
+                'last_fan_out': self.last_fan_out,
+            }
+
+
+inbox_stats = InboxStats()
+
+
+def find_recipients(lat, lng, skill_type=None):
+    """
+    Up to INBOX_MAX_RECIPIENTS available mechanics within INBOX_RADIUS_KM (with skill_type
+    when given), nearest first, as (distance_km, user_id) pairs
+    """
+    radius_km, limit = settings.INBOX_RADIUS_KM, settings.INBOX_MAX_RECIPIENTS
+    if settings.MECHANIC_INDEX_ENABLED:
+        # Read on past index hits the database no longer has available
+        found, after = [], None
+        while len(found) < limit:
+            wanted = limit - len(found)
+            nearest = mechanic_index.nearest(
+                lat, lng, k=wanted, radius_km=radius_km, skill_type=skill_type, after=after
+            )
+            user_ids = dict(
+                MechanicProfile.objects.filter(
+                    id__in=[profile_id for _, profile_id in nearest], availability=True
+                ).values_list('id', 'user_id')
+            )
+            found += [(distance, user_ids[profile_id]) for distance, profile_id in nearest if profile_id in user_ids]
+            if len(nearest) < wanted:
+                break
+            distance, profile_id = nearest[-1]
+            after = (cursor_distance(distance), profile_id)
+        return found
+
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    mechanics = MechanicProfile.objects.filter(
+        availability=True,
+        latitude__range=(min_lat, max_lat),
+        longitude__range=(min_lng, max_lng)
+    )
+    cells = location_cells_for_box(min_lat, max_lat, min_lng, max_lng)
+    if cells is not None:
+        mechanics = mechanics.filter(location_cell__in=cells)
+    if skill_type:
+        mechanics = mechanics.filter(skill_type=skill_type)
+
+    rows = list(mechanics.values_list('user_id', 'latitude', 'longitude'))
+    distances = calculate_distances((lat, lng), [row[1] for row in rows], [row[2] for row in rows])
+    return heapq.nsmallest(limit, (
+        (float(distance), user_id)
+        for (user_id, _, _), distance in zip(rows, distances)
+        if distance <= radius_km
+    ))
+
+
+def fan_out_request(service_request):
+    """
+    Offer an open service request to nearby mechanics with a matching skill: one
+    bulk insert into their inboxes plus a 'request.offered' event to each of them
+    """
+    started = time.perf_counter()
+    recipients = find_recipients(
+        service_request.customer_lat, service_request.customer_lng, service_request.skill_type
+    )
+    MechanicInboxEntry.objects.bulk_create([
+        MechanicInboxEntry(
+            mechanic_id=user_id,
+            service_request=service_request,
+            distance_km=Decimal(f'{distance:.2f}')
+        )
+        for distance, user_id in recipients
+    ], batch_size=1000)
+    if recipients:
+        publish_request_event(
+            'request.offered', service_request, recipients={user_id for _, user_id in recipients}
+        )
+
+    fan_out = {
+        'request_id': service_request.id,
+        'recipients': len(recipients),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
+    inbox_stats.record_fan_out(fan_out)
+    logger.debug('Offered request %(request_id)s to %(recipients)d mechanics in %(duration_ms)sms', fan_out)
+    return fan_out
+
+
+def prune_requests(request_ids):
+    """Withdraw requests that were taken or closed from every inbox"""
+    request_ids = list(request_ids)
+    if request_ids:
+        record_withdrawn_offers(request_ids)
+        MechanicInboxEntry.objects.filter(service_request_id__in=request_ids).delete()
+        inbox_stats.record_prune(len(request_ids))
@@ -0,0 +1,148 @@
+import atexit
+import logging
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .cache import nearby_cache
+from .models import MechanicProfile
+from .spatial import mechanic_index
+from .utils import location_cell
+
+
+logger = logging.getLogger(__name__)
+
+
+class LocationBuffer:
+    """
+    Per-process buffer of mechanic location pings
+
+    Pings are coalesced per mechanic, keeping only the most recent one (by the time
+    the device recorded it), and written with a single bulk_update when the buffer
+    holds LOCATION_FLUSH_MAX_PENDING mechanics or every LOCATION_FLUSH_INTERVAL_SECONDS,
+    whichever comes first. bulk_update bypasses save() and its signals, so the flush
+    updates the location index and nearby cache itself.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._received = 0
+        self._thread = None
+        self._wakeup = threading.Event()
+        self.totals = {'pings': 0, 'rows_written': 0, 'flushes': 0}
+        self.last_flush = None
+
+    def add(self, user_id, lat, lng, recorded_at=None):
+        """Queue a ping; an older ping never overwrites a newer one"""
+        recorded_at = recorded_at if recorded_at is not None else time.time()
+        with self._lock:
+            self._received += 1
+            current = self._pending.get(user_id)
+            if current is None or recorded_at >= current[2]:
+                self._pending[user_id] = (lat, lng, recorded_at)
+            pending = len(self._pending)
+        self._ensure_worker()
+        if pending >= settings.LOCATION_FLUSH_MAX_PENDING:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write all pending pings; returns the number of profiles updated"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                received, self._received = self._received, 0
+            if not pending:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                profiles = list(
+                    MechanicProfile.objects.filter(user_id__in=pending).only(
+                        'id', 'user_id', 'availability', 'skill_type', 'latitude', 'longitude'
+                    )
+                )
+                previous = [(profile.latitude, profile.longitude) for profile in profiles]
+                now = timezone.now()
+                for profile in profiles:
+                    lat, lng, _ = pending[profile.user_id]
+                    profile.latitude = Decimal(f'{lat:.6f}')
+                    profile.longitude = Decimal(f'{lng:.6f}')
+                    profile.location_cell = location_cell(profile.latitude, profile.longitude)
+                    profile.updated_at = now
+
+                with transaction.atomic():
+                    MechanicProfile.objects.bulk_update(
+                        profiles, ['latitude', 'longitude', 'location_cell', 'updated_at'], batch_size=1000
+                    )
+            except Exception:
+                self._requeue(pending, received)
+                raise
+
+            mechanic_index.sync_profiles([
+                (profile.id, profile.availability, profile.latitude, profile.longitude, profile.skill_type)
+                for profile in profiles
+            ])
+            for profile, (old_lat, old_lng) in zip(profiles, previous):
+                if old_lat is not None and old_lng is not None:
+                    nearby_cache.invalidate_point(old_lat, old_lng)
+                nearby_cache.invalidate_point(profile.latitude, profile.longitude)
+
+            self.last_flush = {
+                'at': now.isoformat(),
+                'pings': received,
+                'mechanics': len(pending),
+                'rows_written': len(profiles),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+            }
+            self.totals['pings'] += received
+            self.totals['rows_written'] += len(profiles)
+            self.totals['flushes'] += 1
+            logger.info(
+                'Flushed %(rows_written)d mechanic locations from %(pings)d pings in %(duration_ms)sms',
+                self.last_flush
+            )
+            return len(profiles)
+
+    def _requeue(self, pending, received):
+        with self._lock:
+            for user_id, ping in pending.items():
+                current = self._pending.get(user_id)
+                if current is None or ping[2] > current[2]:
+                    self._pending[user_id] = ping
+            self._received += received
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {'pending': pending, 'totals': dict(self.totals), 'last_flush': self.last_flush}
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='location-buffer-flush', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(settings.LOCATION_FLUSH_INTERVAL_SECONDS)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Mechanic location flush failed')
+            finally:
+                close_old_connections()
+
+
+location_buffer = LocationBuffer()
+atexit.register(location_buffer.flush)
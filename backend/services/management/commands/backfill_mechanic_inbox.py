@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from services.inbox import fan_out_request
+from services.models import ServiceRequest
+
+
+class Command(BaseCommand):
+    help = (
+        'Offer open unassigned requests that have no inbox entries yet to nearby mechanics; '
+        'run once after migrating to the mechanic inbox'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+    
+    def handle(self, *args, **options):
+        # Requests with entries were fanned out on creation, so running this again is a no-op
+        pending = ServiceRequest.objects.filter(
+            mechanic__isnull=True, status='REQUESTED', inbox_entries__isnull=True
+        ).select_related('customer').order_by('created_at', 'id')
+        requests = offers = 0
+        for service_request in pending.iterator(chunk_size=options['chunk_size']):
+            offers += fan_out_request(service_request)['recipients']
+            requests += 1
+        self.stdout.write(f'Offered {requests} open requests to {offers} mechanic inboxes')
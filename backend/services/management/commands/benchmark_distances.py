@@ -0,0 +1,60 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from geopy.distance import geodesic
+
+from services.utils import calculate_distances
+
+
+def per_row_geodesic(origin, lats, lngs):
+    """The original nearby search loop: one geopy call and float conversion per row"""
+    distances = []
+    for lat, lng in zip(lats, lngs):
+        point = (float(lat), float(lng))
+        distances.append(geodesic((float(origin[0]), float(origin[1])), point).kilometers)
+    return distances
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-row geodesic loop against the batch distance engine'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+    
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        origin = (Decimal('28.613900'), Decimal('77.209000'))
+        
+        self.stdout.write(f"{'points':>8} {'per-row':>12} {'haversine':>12} {'exact':>12} {'speedup':>9} {'max err':>9}")
+        for size in options['sizes']:
+            # Decimal inputs mirror what the ORM hands back for the coordinate columns
+            lats = [Decimal(f'{28.6139 + rng.uniform(-0.5, 0.5):.6f}') for _ in range(size)]
+            lngs = [Decimal(f'{77.2090 + rng.uniform(-0.5, 0.5):.6f}') for _ in range(size)]
+            
+            baseline, reference = self._time(per_row_geodesic, origin, lats, lngs, options['repeat'])
+            haversine, approx = self._time(calculate_distances, origin, lats, lngs, options['repeat'])
+            exact, _ = self._time(
+                lambda *a: calculate_distances(*a, exact=True), origin, lats, lngs, options['repeat']
+            )
+            
+            max_error = max(
+                abs(a - r) / r for a, r in zip(approx, reference) if r > 0
+            ) if size else 0.0
+            self.stdout.write(
+                f'{size:>8} {baseline * 1000:>10.1f}ms {haversine * 1000:>10.1f}ms '
+                f'{exact * 1000:>10.1f}ms {baseline / haversine:>8.0f}x {max_error:>8.3%}'
+            )
+    
+    def _time(self, func, origin, lats, lngs, repeat):
+        best = None
+        result = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func(origin, lats, lngs)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
@@ -0,0 +1,87 @@
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure API throughput under concurrent keep-alive connections. Run it once '
+        'against the WSGI deployment and once against the ASGI one (uvicorn '
+        'mechanic_assist.asgi:application) to compare the sync and async read views.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server base URL')
+        parser.add_argument('--token', required=True, help='Access token sent as a Bearer header')
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Endpoint to request; repeat for a mix (default: the hot read endpoints)'
+        )
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32, 64])
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per concurrency level')
+    
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme not in ('http', 'https'):
+            raise CommandError('--url must be an http(s) URL')
+        paths = options['paths'] or [
+            '/api/auth/me/',
+            '/api/mechanics/nearby/?lat=28.6139&lng=77.2090',
+            '/api/requests/customer/',
+        ]
+        headers = {'Authorization': f"Bearer {options['token']}", 'Connection': 'keep-alive'}
+        
+        self.stdout.write(f"{'conns':>6} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for concurrency in options['concurrency']:
+            latencies, errors = self._run(url, paths, headers, concurrency, options['duration'])
+            if not latencies:
+                self.stdout.write(f'{concurrency:>6} {"-":>9} {"-":>8} {"-":>8} {errors:>7}')
+                continue
+            latencies.sort()
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(
+                f'{concurrency:>6} {len(latencies) / options["duration"]:>9.1f} '
+                f'{statistics.median(latencies) * 1000:>8.1f} {p99 * 1000:>8.1f} {errors:>7}'
+            )
+    
+    def _run(self, url, paths, headers, concurrency, duration):
+        deadline = time.monotonic() + duration
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        
+        def worker(offset):
+            connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+            connection = connection_class(url.hostname, url.port, timeout=30)
+            local_latencies, local_errors, i = [], 0, offset
+            while time.monotonic() < deadline:
+                path = paths[i % len(paths)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', path, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    local_errors += 1
+                    connection.close()
+                    continue
+                if response.status >= 400:
+                    local_errors += 1
+                else:
+                    local_latencies.append(time.perf_counter() - started)
+            connection.close()
+            with lock:
+                latencies.extend(local_latencies)
+                errors[0] += local_errors
+        
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, errors[0]
@@ -0,0 +1,116 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.http import HttpRequest
+from django.utils import timezone
+
+from accounts.models import User
+from ratings.models import Rating
+from ratings.views import mechanic_ratings_queryset
+from services.models import MechanicProfile, ServiceRequest
+from services.pagination import CreatedAtCursorPagination
+from services.utils import location_cell
+from services.views import customer_requests_queryset, mechanic_requests_querysets
+
+
+PAGE = 21
+
+
+def first_page(queryset):
+    """The first page the list views read through CreatedAtCursorPagination"""
+    return CreatedAtCursorPagination().get_page_queryset(queryset, HttpRequest())
+
+
+def hot_queries():
+    """(description, queryset, indexes the plan is expected to use) for each hot query"""
+    customer_id = User.objects.filter(role='CUSTOMER').values_list('id', flat=True).first() or 0
+    mechanic_id = User.objects.filter(role='MECHANIC').values_list('id', flat=True).first() or 0
+    since = timezone.now() - timedelta(hours=1)
+    return [
+        (
+            'Customer request list',
+            first_page(customer_requests_queryset(customer_id)),
+            ['req_customer_created_idx'],
+        ),
+        (
+            'Mechanic request list, assigned part',
+            first_page(mechanic_requests_querysets(mechanic_id)[0]),
+            ['req_mechanic_created_idx'],
+        ),
+        (
+            'Mechanic request list, inbox part',
+            first_page(mechanic_requests_querysets(mechanic_id)[1]),
+            ['inbox_mechanic_request_uniq'],
+        ),
+        (
+            'Open unassigned requests (dispatcher)',
+            ServiceRequest.objects.filter(mechanic__isnull=True, status='REQUESTED').order_by(
+                'created_at', 'id'
+            )[:PAGE],
+            ['req_open_unassigned_idx'],
+        ),
+        (
+            'Customer delta sync',
+            ServiceRequest.objects.filter(customer_id=customer_id, updated_at__gt=since).order_by(
+                'updated_at', 'id'
+            )[:PAGE],
+            ['req_customer_updated_idx'],
+        ),
+        (
+            'Mechanic delta sync, ratings part',
+            Rating.objects.filter(mechanic_id=mechanic_id, updated_at__gt=since).order_by('updated_at', 'id')[:PAGE],
+            ['rating_mechanic_updated_idx'],
+        ),
+        (
+            'Mechanic ratings',
+            first_page(mechanic_ratings_queryset(mechanic_id).select_related('customer')),
+            ['rating_mechanic_created_idx'],
+        ),
+        (
+            'Available mechanics near a point',
+            MechanicProfile.objects.filter(
+                availability=True, location_cell__in=[location_cell(28.6139, 77.2090)]
+            ),
+            ['mech_avail_cell_idx'],
+        ),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN on the hot API queries and report whether each uses its intended index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-seqscan', action='store_true',
+            help='PostgreSQL only: discourage sequential scans, for checking small development databases'
+        )
+        parser.add_argument('--analyze', action='store_true', help='PostgreSQL only: EXPLAIN ANALYZE')
+        parser.add_argument('--plans', action='store_true', help='Print the full plans')
+
+    def handle(self, *args, **options):
+        postgres = connection.vendor == 'postgresql'
+        explain_options = {'analyze': True} if options['analyze'] and postgres else {}
+        missing = 0
+
+        with transaction.atomic():
+            if options['no_seqscan'] and postgres:
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for description, queryset, indexes in hot_queries():
+                plan = queryset.explain(**explain_options)
+                unused = [name for name in indexes if name not in plan]
+                missing += bool(unused)
+                if unused:
+                    self.stdout.write(self.style.ERROR(f'{description}: NOT using {", ".join(unused)}'))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'{description}: uses {", ".join(indexes)}'))
+                if options['plans'] or unused:
+                    self.stdout.write(plan + '\n')
+
+        if missing:
+            self.stdout.write(self.style.WARNING(
+                f'{missing} queries did not use their index. On small tables the planner may '
+                'prefer sequential scans; retry with --no-seqscan or run against production-sized data.'
+            ))
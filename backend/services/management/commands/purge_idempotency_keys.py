@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from mechanic_assist.purge import delete_in_batches
+from services.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete idempotency keys older than IDEMPOTENCY_TTL_SECONDS, in batches'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+    
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS)
+        deleted = delete_in_batches(IdempotencyKey.objects.filter(created_at__lt=cutoff), options['batch_size'])
+        self.stdout.write(f'Deleted {deleted} expired idempotency keys')
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+from services.dispatch import run_dispatch_tick
+
+
+class Command(BaseCommand):
+    help = 'Assign open unassigned service requests to mechanics every DISPATCH_INTERVAL_SECONDS'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single tick and exit')
+        parser.add_argument('--interval', type=float, default=None, help='Seconds between ticks')
+        parser.add_argument(
+            '--no-events', action='store_true', help='Assign without publishing request.assigned events'
+        )
+    
+    def handle(self, *args, **options):
+        # The dispatcher is a process of its own, so events published through a broker
+        # that stays inside it would never reach the clients of the web workers
+        publish = not options['no_events']
+        if publish and not import_string(settings.EVENT_BROKER).cross_process:
+            raise CommandError(
+                f'EVENT_BROKER {settings.EVENT_BROKER} only delivers within this process; set it to '
+                'services.events.PostgresNotifyBroker or pass --no-events'
+            )
+        
+        interval = options['interval'] or settings.DISPATCH_INTERVAL_SECONDS
+        while True:
+            started = time.monotonic()
+            stats = run_dispatch_tick(publish=publish)
+            close_old_connections()
+            if options['once'] or stats['open']:
+                self.stdout.write(
+                    f"{stats['assigned']}/{stats['open']} open requests assigned to "
+                    f"{stats['mechanics']} free mechanics in {stats['duration_ms']}ms"
+                )
+            if options['once']:
+                return
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
@@ -0,0 +1,130 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from services.dispatch import MechanicPool, match_requests
+from services.models import MechanicProfile
+
+
+SKILLS = [skill for skill, _ in MechanicProfile.SKILL_TYPE_CHOICES]
+
+# Ticks to keep running after the last arrival so late requests get a chance to match
+DRAIN_TICKS = 50
+
+
+def sequential_match(requests, pool, unavailable=()):
+    """First come, first served: each request in turn takes the nearest free mechanic"""
+    assignments = {}
+    taken = set(unavailable)
+    for request_id, lat, lng, skill_type in requests:
+        found = pool.nearest(
+            lat, lng, skill_type, 1, settings.DISPATCH_RADIUS_KM, lambda key: key not in taken
+        )
+        if found:
+            distance_km, key = found[0]
+            assignments[request_id] = (key, distance_km)
+            taken.add(key)
+    return assignments
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate dispatch ticks on synthetic requests and mechanics, without the database, '
+        'and report tick time, match latency and travel distance'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mechanics', type=int, default=10000)
+        parser.add_argument('--requests', type=int, default=10000)
+        parser.add_argument(
+            '--ticks', type=int, default=1,
+            help='Ticks over which the requests arrive (1: all open at once, the worst-case batch)'
+        )
+        parser.add_argument('--tick-seconds', type=float, default=None, help='Default: DISPATCH_INTERVAL_SECONDS')
+        parser.add_argument('--service-ticks', type=int, default=6, help='Ticks a mechanic stays busy after a match')
+        parser.add_argument('--skilled', type=float, default=0.5, help='Fraction of requests that need a skill')
+        parser.add_argument('--center', nargs=2, type=float, default=[28.6139, 77.2090], metavar=('LAT', 'LNG'))
+        parser.add_argument('--spread', type=float, default=0.3, help='Degrees around the center')
+        parser.add_argument('--strategy', choices=['greedy', 'sequential', 'both'], default='both')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        lat0, lng0 = options['center']
+        spread = options['spread']
+
+        def point():
+            return lat0 + rng.uniform(-spread, spread), lng0 + rng.uniform(-spread, spread)
+
+        mechanics = [
+            (key, *point(), rng.choice(SKILLS), round(rng.uniform(3, 5), 2))
+            for key in range(options['mechanics'])
+        ]
+        requests = [
+            (request_id, *point(), rng.choice(SKILLS) if rng.random() < options['skilled'] else None)
+            for request_id in range(options['requests'])
+        ]
+
+        started = time.perf_counter()
+        pool = MechanicPool(mechanics)
+        self.stdout.write(f'Built a pool of {len(pool)} mechanics in {(time.perf_counter() - started) * 1000:.0f}ms')
+
+        strategies = ['greedy', 'sequential'] if options['strategy'] == 'both' else [options['strategy']]
+        self.stdout.write(
+            f"{'strategy':>10} {'matched':>8} {'tick ms':>8} {'p95 ms':>8} {'max ms':>8} "
+            f"{'wait s':>7} {'p95 s':>7} {'km':>6} {'p95 km':>7}"
+        )
+        for strategy in strategies:
+            match = match_requests if strategy == 'greedy' else sequential_match
+            self._report(strategy, self._simulate(match, requests, pool, options))
+
+    def _simulate(self, match, requests, pool, options):
+        tick_seconds = options['tick_seconds'] or settings.DISPATCH_INTERVAL_SECONDS
+        per_tick = -(-len(requests) // max(1, options['ticks']))
+        busy_until = {}
+        open_requests = {}
+        tick_times, waits, distances = [], [], []
+
+        tick = 0
+        while tick < options['ticks'] or (open_requests and tick < options['ticks'] + DRAIN_TICKS):
+            for request in requests[tick * per_tick:(tick + 1) * per_tick]:
+                open_requests[request[0]] = (request, tick)
+            unavailable = {key for key, until in busy_until.items() if until > tick}
+
+            started = time.perf_counter()
+            assignments = match([request for request, _ in open_requests.values()], pool, unavailable=unavailable)
+            tick_times.append((time.perf_counter() - started) * 1000)
+
+            for request_id, (key, distance_km) in assignments.items():
+                _, arrived = open_requests.pop(request_id)
+                waits.append((tick - arrived) * tick_seconds)
+                distances.append(distance_km)
+                busy_until[key] = tick + options['service_ticks']
+            tick += 1
+
+        return {'requests': len(requests), 'tick_times': tick_times, 'waits': waits, 'distances': distances}
+
+    def _report(self, strategy, result):
+        tick_times, waits, distances = result['tick_times'], result['waits'], result['distances']
+        matched = len(distances) / result['requests'] if result['requests'] else 0.0
+
+        def fmt(value, width, digits=1):
+            return f'{value:>{width}.{digits}f}' if value is not None else f"{'-':>{width}}"
+
+        self.stdout.write(
+            f'{strategy:>10} {matched:>8.1%} {fmt(statistics.mean(tick_times), 8)} '
+            f'{fmt(percentile(tick_times, 0.95), 8)} {fmt(max(tick_times), 8)} '
+            f'{fmt(statistics.mean(waits) if waits else None, 7)} {fmt(percentile(waits, 0.95), 7)} '
+            f'{fmt(statistics.mean(distances) if distances else None, 6, 2)} '
+            f'{fmt(percentile(distances, 0.95), 7, 2)}'
+        )
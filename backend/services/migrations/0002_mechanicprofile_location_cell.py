@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:31
+
+from django.db import migrations, models
+
+
+def populate_location_cells(apps, schema_editor):
+    from services.utils import location_cell
+
+    MechanicProfile = apps.get_model('services', 'MechanicProfile')
+    profiles = MechanicProfile.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    batch = []
+    for profile in profiles.only('id', 'latitude', 'longitude').iterator(chunk_size=2000):
+        profile.location_cell = location_cell(profile.latitude, profile.longitude)
+        batch.append(profile)
+        if len(batch) >= 2000:
+            MechanicProfile.objects.bulk_update(batch, ['location_cell'])
+            batch = []
+    if batch:
+        MechanicProfile.objects.bulk_update(batch, ['location_cell'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mechanicprofile',
+            name='location_cell',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='mechanicprofile',
+            index=models.Index(fields=['availability', 'location_cell'], name='mech_avail_cell_idx'),
+        ),
+        migrations.RunPython(populate_location_cells, migrations.RunPython.noop),
+    ]
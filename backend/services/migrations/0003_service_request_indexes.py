@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0002_mechanicprofile_location_cell'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(fields=['customer', '-created_at', '-id'], name='req_customer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(fields=['mechanic', '-created_at', '-id'], name='req_mechanic_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(condition=models.Q(('mechanic__isnull', True), ('status', 'REQUESTED')), fields=['-created_at', '-id'], name='req_open_unassigned_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0003_service_request_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicerequest',
+            name='skill_type',
+            field=models.CharField(blank=True, choices=[('GENERAL_REPAIR', 'General Repair'), ('TYRES', 'Tyres'), ('ELECTRICAL', 'Electrical'), ('ENGINE', 'Engine'), ('BATTERY', 'Battery')], max_length=50, null=True),
+        ),
+    ]
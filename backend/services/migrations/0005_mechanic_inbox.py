@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('services', '0004_servicerequest_skill_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MechanicInboxEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance_km', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('mechanic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to=settings.AUTH_USER_MODEL)),
+                ('service_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='services.servicerequest')),
+            ],
+            options={
+                'db_table': 'mechanic_inbox',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='mechanicinboxentry',
+            constraint=models.UniqueConstraint(fields=('mechanic', 'service_request'), name='inbox_mechanic_request_uniq'),
+        ),
+    ]
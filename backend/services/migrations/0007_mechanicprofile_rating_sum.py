@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:11
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_rating_sums(apps, schema_editor):
+    MechanicProfile = apps.get_model('services', 'MechanicProfile')
+    Rating = apps.get_model('ratings', 'Rating')
+    totals = Rating.objects.values('mechanic_id').annotate(stars=Sum('stars'), count=Count('id'))
+    batch = []
+    for profile in MechanicProfile.objects.only('id', 'user_id').iterator(chunk_size=2000):
+        batch.append(profile)
+        if len(batch) >= 2000:
+            _apply_totals(MechanicProfile, totals, batch)
+            batch = []
+    if batch:
+        _apply_totals(MechanicProfile, totals, batch)
+
+
+def _apply_totals(MechanicProfile, totals, profiles):
+    by_mechanic = {
+        row['mechanic_id']: row
+        for row in totals.filter(mechanic_id__in=[profile.user_id for profile in profiles])
+    }
+    for profile in profiles:
+        row = by_mechanic.get(profile.user_id, {'stars': 0, 'count': 0})
+        profile.rating_sum = row['stars']
+        profile.rating_count = row['count']
+    MechanicProfile.objects.bulk_update(profiles, ['rating_sum', 'rating_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0006_idempotency_keys'),
+        ('ratings', '0002_rating_mechanic_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mechanicprofile',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_rating_sums, migrations.RunPython.noop),
+    ]
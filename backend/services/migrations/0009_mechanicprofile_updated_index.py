@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0008_sync_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mechanicprofile',
+            index=models.Index(fields=['updated_at'], name='mech_updated_idx'),
+        ),
+    ]
@@ -1,5 +1,8 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
 from accounts.models import User
+from .utils import location_cell
 
 
 class MechanicProfile(models.Model):
@@ -18,17 +21,68 @@ class MechanicProfile(models.Model):
     availability = models.BooleanField(default=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    location_cell = models.BigIntegerField(null=True, blank=True, editable=False)
     rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
     rating_count = models.IntegerField(default=0)
+    # Sum of all stars received, kept next to rating_count so the average updates in O(1)
+    rating_sum = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         db_table = 'mechanic_profiles'
         ordering = ['-rating_avg', '-rating_count']
+        indexes = [
+            models.Index(fields=['availability', 'location_cell'], name='mech_avail_cell_idx'),
+            # Location index catch-up: profiles saved since the last check
+            models.Index(fields=['updated_at'], name='mech_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.name} - {self.get_skill_type_display()}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so post_save receivers can tell which fields changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        # Keep the grid cell in step with the coordinates it is derived from
+        self.location_cell = location_cell(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'location_cell'}
+        super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields
+        }
+    
+    def changed_fields(self, field_names):
+        """
+        Return which of field_names differ from the values last loaded or saved
+        Every field counts as changed for an instance that never came from the database
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return set(field_names)
+        return {name for name in field_names if loaded.get(name) != getattr(self, name)}
+
+
+class ServiceRequestQuerySet(models.QuerySet):
+    
+    def transition(self, to_status, **changes):
+        """
+        Move every matching request that is still allowed to reach to_status, with one
+        conditional UPDATE (UPDATE ... WHERE <filters> AND status IN <allowed>)
+        Returns the number of requests moved, so concurrent callers can tell who won.
+        Like any update() it skips save() and its signals
+        """
+        changes.setdefault('updated_at', timezone.now())
+        return self.filter(status__in=ServiceRequest.TRANSITIONS[to_status]).update(
+            status=to_status, **changes
+        )
 
 
 class ServiceRequest(models.Model):
@@ -41,9 +95,18 @@ class ServiceRequest(models.Model):
         ('CANCELLED', 'Cancelled'),
     ]
     
+    # Statuses each status can be reached from
+    TRANSITIONS = {
+        'ACCEPTED': ('REQUESTED',),
+        'COMPLETED': ('ACCEPTED',),
+        'CANCELLED': ('REQUESTED', 'ACCEPTED'),
+    }
+    
     customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='customer_requests')
     mechanic = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='mechanic_requests')
     issue_text = models.TextField()
+    # Skill the dispatcher looks for; any mechanic will do when blank
+    skill_type = models.CharField(max_length=50, choices=MechanicProfile.SKILL_TYPE_CHOICES, null=True, blank=True)
     customer_lat = models.DecimalField(max_digits=9, decimal_places=6)
     customer_lng = models.DecimalField(max_digits=9, decimal_places=6)
     distance_km = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
@@ -53,9 +116,113 @@ class ServiceRequest(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     
+    objects = ServiceRequestQuerySet.as_manager()
+    
     class Meta:
         db_table = 'service_requests'
         ordering = ['-created_at']
+        indexes = [
+            # Customer and mechanic request lists, keyset-paginated on (created_at, id)
+            models.Index(fields=['customer', '-created_at', '-id'], name='req_customer_created_idx'),
+            models.Index(fields=['mechanic', '-created_at', '-id'], name='req_mechanic_created_idx'),
+            # Delta sync walks each user's requests on (updated_at, id)
+            models.Index(fields=['customer', 'updated_at', 'id'], name='req_customer_updated_idx'),
+            models.Index(fields=['mechanic', 'updated_at', 'id'], name='req_mechanic_updated_idx'),
+            # The small pool of open unassigned requests every mechanic sees
+            models.Index(
+                fields=['-created_at', '-id'], name='req_open_unassigned_idx',
+                condition=models.Q(mechanic__isnull=True, status='REQUESTED')
+            ),
+        ]
     
     def __str__(self):
         return f"Request #{self.id} - {self.customer.name} - {self.status}"
+    
+    def transition(self, to_status, mechanic=None, **changes):
+        """
+        Compare-and-swap this request from its current status to to_status, optionally
+        only while it belongs to mechanic. Returns whether this call made the change;
+        on success the instance is updated to match the row
+        """
+        changes.setdefault('updated_at', timezone.now())
+        requests = ServiceRequest.objects.filter(pk=self.pk, status=self.status)
+        if mechanic is not None:
+            requests = requests.filter(mechanic=mechanic)
+        if not requests.transition(to_status, **changes):
+            return False
+        self.status = to_status
+        for name, value in changes.items():
+            setattr(self, name, value)
+        return True
+
+
+class MechanicInboxEntry(models.Model):
+    """An open service request offered to a nearby mechanic with a matching skill"""
+    
+    mechanic = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inbox_entries')
+    service_request = models.ForeignKey(ServiceRequest, on_delete=models.CASCADE, related_name='inbox_entries')
+    distance_km = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'mechanic_inbox'
+        constraints = [
+            # Also the index behind each mechanic's inbox read
+            models.UniqueConstraint(fields=['mechanic', 'service_request'], name='inbox_mechanic_request_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"Request #{self.service_request_id} offered to mechanic #{self.mechanic_id}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    The stored outcome of a create request sent with an Idempotency-Key header
+    status_code stays null while the first request is still being processed
+    """
+    
+    # Indexed through the unique constraint
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=64)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        db_table = 'idempotency_keys'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='idempotency_user_scope_key_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.status_code})"
+
+
+class SyncTombstone(models.Model):
+    """
+    A request or rating that disappeared from a user's view, kept so delta sync can
+    tell their devices to drop it: deleted, or withdrawn from a mechanic's inbox
+    """
+    
+    KIND_CHOICES = [
+        ('request', 'Service request'),
+        ('rating', 'Rating'),
+    ]
+    
+    # Not a foreign key: tombstones are written while the user's own rows are being
+    # cascade-deleted; purge_sync_tombstones drops them with the rest
+    user_id = models.BigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        db_table = 'sync_tombstones'
+        indexes = [
+            models.Index(fields=['user_id', 'created_at', 'id'], name='tombstone_user_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} #{self.object_id} gone for user #{self.user_id}"
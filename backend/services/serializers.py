@@ -48,7 +48,7 @@ class ServiceRequestSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = ServiceRequest
-        fields = ('id', 'customer', 'customer_id', 'mechanic', 'mechanic_id', 'issue_text',
+        fields = ('id', 'customer', 'customer_id', 'mechanic', 'mechanic_id', 'issue_text', 'skill_type',
                   'customer_lat', 'customer_lng', 'distance_km', 'estimated_cost', 'status',
                   'created_at', 'updated_at', 'completed_at')
         read_only_fields = ('id', 'distance_km', 'estimated_cost', 'status', 'created_at',
@@ -56,12 +56,12 @@ class ServiceRequestSerializer(serializers.ModelSerializer):
 
 
 class ServiceRequestCreateSerializer(serializers.ModelSerializer):
-    """Serializer for creating service request"""
-    mechanic_id = serializers.IntegerField(write_only=True, required=True)
+    """Serializer for creating service request; without mechanic_id the dispatcher picks one"""
+    mechanic_id = serializers.IntegerField(write_only=True, required=False)
     
     class Meta:
         model = ServiceRequest
-        fields = ('issue_text', 'customer_lat', 'customer_lng', 'mechanic_id')
+        fields = ('issue_text', 'skill_type', 'customer_lat', 'customer_lng', 'mechanic_id')
         extra_kwargs = {
             'issue_text': {'required': True},
             'customer_lat': {'required': True},
@@ -76,7 +76,7 @@ class ServiceRequestListSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = ServiceRequest
-        fields = ('id', 'customer', 'mechanic', 'issue_text', 'customer_lat', 'customer_lng',
+        fields = ('id', 'customer', 'mechanic', 'issue_text', 'skill_type', 'customer_lat', 'customer_lng',
                   'distance_km', 'estimated_cost', 'status', 'created_at', 'updated_at',
                   'completed_at')
 
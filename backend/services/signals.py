@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import nearby_cache
+from .models import MechanicInboxEntry, MechanicProfile, ServiceRequest
+from .spatial import mechanic_index
+from .sync import record_tombstones
+
+
+# Profile fields that show up in nearby search results
+NEARBY_RESULT_FIELDS = ('latitude', 'longitude', 'availability', 'skill_type', 'rating_avg', 'rating_count')
+
+
+@receiver(post_save, sender=MechanicProfile)
+def sync_mechanic_index(sender, instance, **kwargs):
+    """Keep the in-memory location index in step with saved profiles"""
+    values = (instance.pk, instance.availability, instance.latitude, instance.longitude, instance.skill_type)
+    transaction.on_commit(lambda: mechanic_index.sync_profile(*values))
+
+
+@receiver(post_save, sender=MechanicProfile)
+def invalidate_nearby_cache(sender, instance, **kwargs):
+    """Drop cached nearby searches around the mechanic's old and new location"""
+    changed = instance.changed_fields(NEARBY_RESULT_FIELDS)
+    if not changed:
+        return
+    
+    points = {(instance.latitude, instance.longitude)}
+    if {'latitude', 'longitude'} & changed:
+        loaded = getattr(instance, '_loaded_values', {})
+        points.add((loaded.get('latitude'), loaded.get('longitude')))
+    points = [(lat, lng) for lat, lng in points if lat is not None and lng is not None]
+    
+    def invalidate():
+        for lat, lng in points:
+            nearby_cache.invalidate_point(lat, lng)
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_delete, sender=MechanicProfile)
+def remove_from_mechanic_index(sender, instance, **kwargs):
+    profile_id = instance.pk
+    transaction.on_commit(lambda: mechanic_index.discard(profile_id))
+
+
+@receiver(post_delete, sender=MechanicProfile)
+def invalidate_nearby_cache_on_delete(sender, instance, **kwargs):
+    lat, lng = instance.latitude, instance.longitude
+    if lat is not None and lng is not None:
+        transaction.on_commit(lambda: nearby_cache.invalidate_point(lat, lng))
+
+
+@receiver(pre_delete, sender=ServiceRequest)
+def tombstone_deleted_request(sender, instance, **kwargs):
+    """Tell the devices of everyone who could see the request to drop it"""
+    offered_to = MechanicInboxEntry.objects.filter(service_request=instance).values_list('mechanic_id', flat=True)
+    record_tombstones('request', [instance.customer_id, instance.mechanic_id, *offered_to], instance.pk)
@@ -0,0 +1,323 @@
+import heapq
+import math
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .utils import EARTH_RADIUS_KM
+
+
+LEAF_SIZE = 16
+
+# The overlay of changes since the last build is folded into a fresh tree once it
+# holds more than this many entries, or this fraction of the index, whichever is larger
+OVERLAY_MIN_SIZE = 64
+OVERLAY_MAX_FRACTION = 0.05
+
+
+def to_unit_vector(lat, lng):
+    """
+    Convert a coordinate to a point on the unit sphere
+    Straight-line (chord) distance between such points grows monotonically with
+    great-circle distance, so a plain 3-d tree answers spherical queries
+    """
+    phi = math.radians(float(lat))
+    lam = math.radians(float(lng))
+    cos_phi = math.cos(phi)
+    return (cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi))
+
+
+def chord_sq_to_km(chord_sq):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(chord_sq) / 2))
+
+
+def km_to_chord_sq(distance_km):
+    chord = 2 * math.sin(min(distance_km / EARTH_RADIUS_KM, math.pi) / 2)
+    return chord * chord
+
+
+def cursor_distance(distance_km):
+    """Precision at which distances are compared when resuming from a cursor"""
+    return round(distance_km, 9)
+
+
+def _chord_sq(a, b):
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2
+
+
+class KDTree:
+    """
+    Immutable 3-d tree over unit-sphere points
+    Inner nodes are (dim, split, left, right); leaves are (-1, start, end) into the
+    point list, which is stored in leaf order
+    """
+
+    def __init__(self, keys, points):
+        self._keys = []
+        self._points = []
+        self._nodes = []
+        if keys:
+            self._source_keys = list(keys)
+            self._build(np.asarray(points, dtype=float), np.arange(len(keys)))
+            del self._source_keys
+        self.keys = frozenset(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _build(self, points, indices):
+        node_id = len(self._nodes)
+        self._nodes.append(None)
+
+        if len(indices) <= LEAF_SIZE:
+            start = len(self._points)
+            for i in indices:
+                self._points.append(tuple(points[i]))
+                self._keys.append(self._source_keys[i])
+            self._nodes[node_id] = (-1, start, len(self._points))
+            return node_id
+
+        # Split on the widest dimension at the median
+        subset = points[indices]
+        dim = int(np.argmax(subset.max(axis=0) - subset.min(axis=0)))
+        middle = len(indices) // 2
+        indices = indices[np.argpartition(subset[:, dim], middle)]
+        split = float(points[indices[middle], dim])
+
+        left = self._build(points, indices[:middle])
+        right = self._build(points, indices[middle:])
+        self._nodes[node_id] = (dim, split, left, right)
+        return node_id
+
+    def query(self, point, k=None, max_chord_sq=math.inf, accept=None):
+        """
+        Find points within max_chord_sq of point, nearest first
+        Returns at most k (chord_sq, key) pairs, or every match when k is None;
+        points rejected by accept(key, chord_sq) are skipped without using up a slot
+        """
+        if not self._nodes:
+            return []
+
+        nodes, points, keys = self._nodes, self._points, self._keys
+        bound = max_chord_sq
+        heap = []
+        stack = [(0, 0.0)]
+
+        while stack:
+            node_id, lower = stack.pop()
+            if lower > bound:
+                continue
+            node = nodes[node_id]
+
+            if node[0] < 0:
+                for i in range(node[1], node[2]):
+                    d = _chord_sq(points[i], point)
+                    if d > bound or (accept is not None and not accept(keys[i], d)):
+                        continue
+                    if k is None:
+                        heap.append((d, keys[i]))
+                    elif len(heap) < k:
+                        heapq.heappush(heap, (-d, keys[i]))
+                        if len(heap) == k:
+                            bound = -heap[0][0]
+                    elif d < -heap[0][0]:
+                        heapq.heapreplace(heap, (-d, keys[i]))
+                        bound = -heap[0][0]
+                continue
+
+            dim, split, left, right = node
+            diff = point[dim] - split
+            near, far = (left, right) if diff < 0 else (right, left)
+            stack.append((far, max(lower, diff * diff)))
+            stack.append((near, lower))
+
+        if k is None:
+            return sorted(heap)
+        return sorted((-d, key) for d, key in heap)
+
+
+_Entry = namedtuple('_Entry', ('lat', 'lng', 'skill_type', 'point'))
+
+PROFILE_FIELDS = ('id', 'availability', 'latitude', 'longitude', 'skill_type')
+
+
+class MechanicLocationIndex:
+    """
+    Per-process nearest-neighbour index over available mechanic locations
+
+    The KD-tree is immutable: profile changes are applied to a small overlay (upserts)
+    and a stale set (tree entries to skip), which are folded into a new tree from
+    memory once they grow. Changes saved by this worker are applied at once. Every
+    MECHANIC_INDEX_REFRESH_SECONDS the next query also catches up with the profiles
+    other processes saved, by reading the rows whose updated_at moved since the last
+    check (less MECHANIC_INDEX_OVERLAP_SECONDS, for transactions that committed late)
+    and counting the profiles; a count that does not match means profiles were
+    deleted, and the whole index is rebuilt from the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._tree = None
+        self._overlay = {}
+        self._stale = set()
+        self._profile_ids = set()
+        self._synced_at = None
+        self._built_at = 0.0
+        self._checked_at = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def rebuild(self):
+        """Reload every available mechanic with a location from the database"""
+        from .models import MechanicProfile
+
+        synced_at = timezone.now()
+        entries, profile_ids = {}, set()
+        rows = MechanicProfile.objects.values_list(*PROFILE_FIELDS)
+        for profile_id, availability, lat, lng, skill_type in rows.iterator(chunk_size=5000):
+            profile_ids.add(profile_id)
+            if availability and lat is not None and lng is not None:
+                entries[profile_id] = _Entry(float(lat), float(lng), skill_type, to_unit_vector(lat, lng))
+
+        with self._lock:
+            self._entries = entries
+            self._profile_ids = profile_ids
+            self._compact()
+            self._synced_at = synced_at
+            self._built_at = self._checked_at = time.monotonic()
+
+    def sync_profile(self, profile_id, availability, lat, lng, skill_type):
+        """Apply a saved MechanicProfile to the index"""
+        self.sync_profiles([(profile_id, availability, lat, lng, skill_type)])
+
+    def sync_profiles(self, profiles):
+        """Apply many saved profiles, given as (id, availability, lat, lng, skill_type)"""
+        with self._lock:
+            for profile_id, availability, lat, lng, skill_type in profiles:
+                self._profile_ids.add(profile_id)
+                if availability and lat is not None and lng is not None:
+                    entry = _Entry(float(lat), float(lng), skill_type, to_unit_vector(lat, lng))
+                    if self._entries.get(profile_id) == entry:
+                        # Seen already, e.g. a catch-up rereading this worker's own save
+                        continue
+                    self._entries[profile_id] = entry
+                    self._overlay[profile_id] = entry
+                else:
+                    self._entries.pop(profile_id, None)
+                    self._overlay.pop(profile_id, None)
+                self._mark_stale(profile_id)
+
+    def discard(self, profile_id):
+        """Drop a deleted mechanic from the index"""
+        with self._lock:
+            self._profile_ids.discard(profile_id)
+            self._entries.pop(profile_id, None)
+            self._overlay.pop(profile_id, None)
+            self._mark_stale(profile_id)
+
+    def invalidate(self):
+        """Force a rebuild from the database on the next query"""
+        with self._lock:
+            self._synced_at = None
+
+    def nearest(self, lat, lng, k=None, radius_km=None, skill_type=None, after=None, accept=None):
+        """
+        Find available mechanics around a coordinate, nearest first
+        Returns up to k (distance_km, profile_id) pairs, or all of them within
+        radius_km when k is None. after=(distance_km, profile_id) resumes a previous
+        result list strictly after that position, comparing distances at the precision
+        of cursor_distance()
+        """
+        self._ensure_fresh()
+        point = to_unit_vector(lat, lng)
+        max_chord_sq = km_to_chord_sq(radius_km) if radius_km is not None else math.inf
+        if after is not None:
+            after_chord_sq = km_to_chord_sq(after[0])
+            low, high = after_chord_sq * (1 - 1e-9), after_chord_sq * (1 + 1e-9)
+
+        def is_after(profile_id, d):
+            if d < low:
+                return False
+            if d > high:
+                return True
+            # Too close to the cursor to decide in chord space
+            return (cursor_distance(chord_sq_to_km(d)), profile_id) > after
+
+        with self._lock:
+            entries, stale = self._entries, self._stale
+
+            def is_match(profile_id, d):
+                if profile_id in stale:
+                    return False
+                if skill_type is not None and entries[profile_id].skill_type != skill_type:
+                    return False
+                if after is not None and not is_after(profile_id, d):
+                    return False
+                return accept is None or accept(profile_id)
+
+            found = self._tree.query(point, k, max_chord_sq, is_match) if self._tree else []
+            for profile_id, entry in self._overlay.items():
+                d = _chord_sq(entry.point, point)
+                if d > max_chord_sq:
+                    continue
+                if skill_type is not None and entry.skill_type != skill_type:
+                    continue
+                if after is not None and not is_after(profile_id, d):
+                    continue
+                if accept is not None and not accept(profile_id):
+                    continue
+                found.append((d, profile_id))
+
+        best = sorted(found) if k is None else heapq.nsmallest(k, found)
+        return [(chord_sq_to_km(d), profile_id) for d, profile_id in best]
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._synced_at is not None:
+            if now - self._checked_at < settings.MECHANIC_INDEX_REFRESH_SECONDS:
+                return
+            if now - self._built_at < settings.MECHANIC_INDEX_MAX_AGE_SECONDS and self._catch_up():
+                return
+        self.rebuild()
+
+    def _catch_up(self):
+        """
+        Apply the profiles saved since the last check, with two queries
+        Returns False when profiles were deleted, which only a rebuild picks up
+        """
+        from .models import MechanicProfile
+
+        synced_at = timezone.now()
+        since = self._synced_at - timedelta(seconds=settings.MECHANIC_INDEX_OVERLAP_SECONDS)
+        changed = list(MechanicProfile.objects.filter(updated_at__gte=since).values_list(*PROFILE_FIELDS))
+        count = MechanicProfile.objects.count()
+        with self._lock:
+            if count != len(self._profile_ids | {row[0] for row in changed}):
+                return False
+            self.sync_profiles(changed)
+            self._synced_at = synced_at
+            self._checked_at = time.monotonic()
+        return True
+
+    def _mark_stale(self, profile_id):
+        if self._tree is not None and profile_id in self._tree.keys:
+            self._stale.add(profile_id)
+        pending = len(self._overlay) + len(self._stale)
+        if pending > max(OVERLAY_MIN_SIZE, len(self._entries) * OVERLAY_MAX_FRACTION):
+            self._compact()
+
+    def _compact(self):
+        keys = list(self._entries)
+        self._tree = KDTree(keys, [self._entries[key].point for key in keys])
+        self._overlay = {}
+        self._stale = set()
+
+
+mechanic_index = MechanicLocationIndex()
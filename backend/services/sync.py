@@ -0,0 +1,113 @@
+import base64
+import heapq
+import json
+from datetime import datetime, timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import MechanicInboxEntry, SyncTombstone
+
+
+class SyncCursorExpired(Exception):
+    pass
+
+
+def encode_sync_cursor(positions):
+    payload = {kind: [timestamp.isoformat(), pk] for kind, (timestamp, pk) in positions.items()}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_sync_cursor(cursor, kinds):
+    """Positions by kind from a cursor; raises ValueError for a malformed one"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {kind: (datetime.fromisoformat(payload[kind][0]), int(payload[kind][1])) for kind in kinds}
+    except (TypeError, KeyError, IndexError, AttributeError, ValueError) as exc:
+        raise ValueError(str(exc))
+
+
+def changed_rows(querysets, field, position, limit):
+    """
+    Up to limit rows of the querysets (disjoint, for one user) with (field, id) after
+    position, oldest first; each queryset is one range scan of its (user, field, id) index
+    Returns the rows and whether more are waiting
+    """
+    timestamp, pk = position
+    after = Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'id__gt': pk})
+    pages = [queryset.filter(after).order_by(field, 'id')[:limit + 1] for queryset in querysets]
+    rows = list(islice(heapq.merge(*pages, key=lambda row: (getattr(row, field), row.pk)), limit + 1))
+    return rows[:limit], len(rows) > limit
+
+
+def changes_since(user_id, querysets, cursor=None):
+    """
+    Everything that changed for a user since cursor (from the start without one):
+    rows of each kind in querysets ({kind: [querysets]}) whose updated_at moved, and
+    tombstones of rows the user can no longer see
+
+    A kind that is caught up restarts SYNC_OVERLAP_SECONDS before now on the next call,
+    so rows written by transactions that committed after this read are not missed;
+    clients upsert by id, so the few repeated rows are harmless. Raises ValueError for
+    a malformed cursor and SyncCursorExpired for one older than the tombstones kept.
+    """
+    now = timezone.now()
+    restart = (now - timedelta(seconds=settings.SYNC_OVERLAP_SECONDS), 0)
+    kinds = [*querysets, 'deleted']
+    if cursor:
+        positions = checked_sync_positions(cursor, kinds, now)
+    else:
+        # A first sync fetches every row, so only tombstones from here on matter
+        epoch = (datetime.min.replace(tzinfo=now.tzinfo), 0)
+        positions = {**dict.fromkeys(querysets, epoch), 'deleted': restart}
+
+    limit = settings.SYNC_PAGE_SIZE
+    changes, has_more = {}, False
+    for kind in kinds:
+        if kind == 'deleted':
+            kind_querysets, field = [SyncTombstone.objects.filter(user_id=user_id)], 'created_at'
+        else:
+            kind_querysets, field = querysets[kind], 'updated_at'
+        rows, truncated = changed_rows(kind_querysets, field, positions[kind], limit)
+        changes[kind] = rows
+        has_more = has_more or truncated
+        positions[kind] = (getattr(rows[-1], field), rows[-1].pk) if truncated else restart
+    return changes, encode_sync_cursor(positions), has_more
+
+
+def checked_sync_positions(cursor, kinds, now=None):
+    """Decode a since cursor; raises ValueError if malformed, SyncCursorExpired if too old"""
+    now = now or timezone.now()
+    positions = decode_sync_cursor(cursor, kinds)
+    if positions['deleted'][0] < now - timedelta(seconds=settings.SYNC_TOMBSTONE_TTL_SECONDS):
+        raise SyncCursorExpired()
+    return positions
+
+
+def current_sync_cursor(kinds):
+    """A cursor from which only changes made from about now on are returned"""
+    restart = (timezone.now() - timedelta(seconds=settings.SYNC_OVERLAP_SECONDS), 0)
+    return encode_sync_cursor(dict.fromkeys([*kinds, 'deleted'], restart))
+
+
+def record_tombstones(kind, user_ids, object_id):
+    SyncTombstone.objects.bulk_create([
+        SyncTombstone(user_id=user_id, kind=kind, object_id=object_id)
+        for user_id in set(user_ids) if user_id is not None
+    ])
+
+
+def record_withdrawn_offers(request_ids):
+    """
+    Tombstone open requests about to leave mechanics' inboxes, except for the mechanic
+    the request went to, who still sees it
+    """
+    withdrawn = MechanicInboxEntry.objects.filter(service_request_id__in=request_ids).exclude(
+        service_request__mechanic_id=F('mechanic_id')
+    ).values_list('mechanic_id', 'service_request_id')
+    SyncTombstone.objects.bulk_create([
+        SyncTombstone(user_id=mechanic_id, kind='request', object_id=request_id)
+        for mechanic_id, request_id in withdrawn
+    ], batch_size=1000)
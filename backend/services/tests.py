@@ -1,3 +1,1337 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import math
+import random
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncClient, AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+
+from accounts.authentication import user_cache
+from accounts.models import User
+from accounts.tests import FakeClock
+from mechanic_assist.query_budget import QueryBudgetTestMixin
+from mechanic_assist.throttling import TokenBucketThrottle, token_buckets
+from rest_framework_simplejwt.tokens import AccessToken
+from ratings.models import Rating
+from ratings.views import mechanic_ratings_queryset
+from . import async_views
+from .cache import nearby_cache
+from .events import InProcessBroker, PostgresNotifyBroker, user_channel
+from .location_buffer import LocationBuffer
+from .management.commands.explain_hot_queries import first_page
+from .models import IdempotencyKey, MechanicInboxEntry, MechanicProfile, ServiceRequest, SyncTombstone
+from .serializers import ServiceRequestListSerializer
+from .spatial import KDTree, MechanicLocationIndex, km_to_chord_sq, mechanic_index, to_unit_vector
+from .utils import (
+    bounding_box, calculate_distance, calculate_distances, calculate_estimated_cost, calculate_estimated_costs,
+    location_cell, location_cells_for_box,
+)
+from .views import customer_requests_queryset
+from .websocket import websocket_application
+
+
+def create_user(email, role):
+    return User.objects.create_user(email=email, password='password', name=email, phone='5550100', role=role)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True, NEARBY_CACHE_ENABLED=False)
+class ListQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """List views must run the same number of queries for 1 row as for a full page"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = create_user('customer@example.com', 'CUSTOMER')
+        cls.admin = create_user('admin@example.com', 'ADMIN')
+        cls.mechanics = [create_user(f'mechanic{i}@example.com', 'MECHANIC') for i in range(10)]
+        for i, mechanic in enumerate(cls.mechanics):
+            MechanicProfile.objects.create(
+                user=mechanic, latitude=Decimal('12.970000') + Decimal(i) / 100, longitude=Decimal('77.590000')
+            )
+            service_request = ServiceRequest.objects.create(
+                customer=cls.customer, mechanic=mechanic if i % 2 else None, issue_text='Flat tyre',
+                customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+            )
+            if service_request.mechanic is None:
+                MechanicInboxEntry.objects.create(
+                    mechanic=cls.mechanics[1], service_request=service_request, distance_km=Decimal('1.00')
+                )
+
+    def get(self, user, url, max_queries):
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.assertMaxQueries(max_queries):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_customer_requests(self):
+        response = self.get(self.customer, '/api/requests/customer/', 2)
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_mechanic_requests(self):
+        response = self.get(self.mechanics[1], '/api/requests/mechanic/', 4)
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_admin_lists(self):
+        self.get(self.admin, '/api/admin/services/', 1)
+        self.get(self.admin, '/api/admin/users/', 1)
+
+    @override_settings(MECHANIC_INDEX_ENABLED=False)
+    def test_nearby_mechanics(self):
+        response = self.get(self.customer, '/api/mechanics/nearby/?lat=12.97&lng=77.59', 1)
+        self.assertEqual(len(response.data), 10)
+
+
+class CursorPaginationTests(TestCase):
+    """Pages follow (created_at, id), so rows sharing a created_at are neither repeated nor skipped"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = create_user('customer@example.com', 'CUSTOMER')
+        cls.mechanic = create_user('mechanic@example.com', 'MECHANIC')
+        for i in range(7):
+            service_request = ServiceRequest.objects.create(
+                customer=cls.customer, mechanic=cls.mechanic if i % 2 else None, issue_text='Flat tyre',
+                customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+            )
+            if service_request.mechanic is None:
+                MechanicInboxEntry.objects.create(
+                    mechanic=cls.mechanic, service_request=service_request, distance_km=Decimal('1.00')
+                )
+        ServiceRequest.objects.update(created_at=timezone.now())
+    
+    def walk(self, user, url):
+        client = APIClient()
+        client.force_authenticate(user)
+        ids = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        return ids
+    
+    def test_equal_created_at_pages_by_id(self):
+        expected = sorted(ServiceRequest.objects.values_list('id', flat=True), reverse=True)
+        self.assertEqual(self.walk(self.customer, '/api/requests/customer/?page_size=3'), expected)
+        # Assigned and offered requests are paged separately and merged
+        self.assertEqual(self.walk(self.mechanic, '/api/requests/mechanic/?page_size=2'), expected)
+    
+    def test_invalid_cursor(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        self.assertEqual(client.get('/api/requests/customer/?cursor=nonsense').status_code, 404)
+
+
+def run_concurrently(func, count):
+    """
+    Run func in count threads released at the same moment; returns their results, or
+    raises the first exception a thread hit
+    """
+    barrier = threading.Barrier(count)
+    results = [None] * count
+    errors = []
+    
+    def worker(index):
+        try:
+            barrier.wait()
+            results[index] = func()
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+    
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+class StatusTransitionTests(TransactionTestCase):
+    """Transitions are compare-and-swap: exactly one of many concurrent attempts wins"""
+    
+    def setUp(self):
+        self.customer = create_user('customer@example.com', 'CUSTOMER')
+        self.mechanic = create_user('mechanic@example.com', 'MECHANIC')
+        self.service_request = ServiceRequest.objects.create(
+            customer=self.customer, mechanic=self.mechanic, issue_text='Flat tyre',
+            customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+        )
+    
+    def test_parallel_transitions(self):
+        requests = ServiceRequest.objects.filter(pk=self.service_request.pk, mechanic=self.mechanic)
+        results = run_concurrently(lambda: requests.transition('ACCEPTED'), 8)
+        self.assertEqual(sorted(results), [0] * 7 + [1])
+        self.service_request.refresh_from_db()
+        self.assertEqual(self.service_request.status, 'ACCEPTED')
+    
+    def test_parallel_accept_requests(self):
+        def accept():
+            client = APIClient()
+            client.force_authenticate(self.mechanic)
+            return client.post(f'/api/requests/{self.service_request.pk}/accept/').status_code
+        
+        results = run_concurrently(accept, 8)
+        self.assertEqual(sorted(results), [200] + [400] * 7)
+    
+    def test_accept_and_complete_answer_from_the_row_read_before_the_update(self):
+        client = APIClient()
+        client.force_authenticate(self.mechanic)
+        for action in ('accept', 'complete'):
+            # The read of the request, then the conditional UPDATE
+            with self.assertNumQueries(2):
+                response = client.post(f'/api/requests/{self.service_request.pk}/{action}/')
+            self.assertEqual(response.status_code, 200)
+            stored = ServiceRequest.objects.select_related('customer', 'mechanic').get(pk=self.service_request.pk)
+            self.assertEqual(response.data, ServiceRequestListSerializer(stored).data)
+    
+    def test_instance_transition(self):
+        other = create_user('other@example.com', 'MECHANIC')
+        self.assertFalse(self.service_request.transition('ACCEPTED', mechanic=other))
+        self.assertTrue(self.service_request.transition('ACCEPTED', mechanic=self.mechanic))
+        self.assertEqual(self.service_request.status, 'ACCEPTED')
+        
+        stale = ServiceRequest.objects.get(pk=self.service_request.pk)
+        stale.status = 'REQUESTED'
+        self.assertFalse(stale.transition('ACCEPTED'))
+        self.assertTrue(self.service_request.transition('COMPLETED'))
+        self.assertEqual(ServiceRequest.objects.get(pk=self.service_request.pk).status, 'COMPLETED')
+    
+    def test_transition_errors(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        self.assertEqual(client.post('/api/requests/0/accept/').status_code, 404)
+        self.assertEqual(client.post(f'/api/requests/{self.service_request.pk}/accept/').status_code, 403)
+        client.force_authenticate(self.mechanic)
+        response = client.post(f'/api/requests/{self.service_request.pk}/complete/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Request must be accepted before completion')
+    
+    def test_bulk_cancel(self):
+        admin = create_user('admin@example.com', 'ADMIN')
+        completed = ServiceRequest.objects.create(
+            customer=self.customer, mechanic=self.mechanic, issue_text='Battery', status='COMPLETED',
+            customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+        )
+        ids = [self.service_request.pk, completed.pk]
+        
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.post('/api/admin/services/cancel/', {'ids': ids}, format='json')
+        self.assertEqual(response.data, {'cancelled': [self.service_request.pk]})
+        response = client.post('/api/admin/services/cancel/', {'ids': ids}, format='json')
+        self.assertEqual(response.data, {'cancelled': []})
+    
+    def test_bulk_cancel_reports_only_requests_it_cancelled(self):
+        admin = create_user('admin@example.com', 'ADMIN')
+        now = timezone.now()
+        earlier = ServiceRequest.objects.create(
+            customer=self.customer, issue_text='Battery', status='CANCELLED',
+            customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+        )
+        ServiceRequest.objects.filter(pk=earlier.pk).update(updated_at=now)
+        
+        # A request cancelled before, with the same timestamp, is not cancelled again
+        client = APIClient()
+        client.force_authenticate(admin)
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            response = client.post(
+                '/api/admin/services/cancel/', {'ids': [self.service_request.pk, earlier.pk]}, format='json'
+            )
+        self.assertEqual(response.data, {'cancelled': [self.service_request.pk]})
+
+
+@override_settings(DISPATCH_RADIUS_KM=15)
+class DispatchTests(TestCase):
+    
+    def test_tick_assigns_nearest_free_mechanic_with_skill(self):
+        customer = create_user('customer@example.com', 'CUSTOMER')
+        near, far, busy, electrician = [
+            create_user(f'{name}@example.com', 'MECHANIC') for name in ('near', 'far', 'busy', 'electrician')
+        ]
+        for mechanic, lat, skill_type in [
+            (near, '12.971000', 'TYRES'), (far, '12.990000', 'TYRES'),
+            (busy, '12.970000', 'TYRES'), (electrician, '12.970100', 'ELECTRICAL'),
+        ]:
+            MechanicProfile.objects.create(
+                user=mechanic, skill_type=skill_type, latitude=Decimal(lat), longitude=Decimal('77.590000')
+            )
+        
+        def open_request(skill_type):
+            return ServiceRequest.objects.create(
+                customer=customer, issue_text='Help', skill_type=skill_type,
+                customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+            )
+        
+        ServiceRequest.objects.create(
+            customer=customer, mechanic=busy, issue_text='Battery', status='ACCEPTED',
+            customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+        )
+        tyres, electrical, unmatched = open_request('TYRES'), open_request('ELECTRICAL'), open_request('ENGINE')
+        
+        from .dispatch import run_dispatch_tick
+        stats = run_dispatch_tick(publish=False)
+        self.assertEqual((stats['open'], stats['assigned']), (3, 2))
+        
+        tyres.refresh_from_db()
+        electrical.refresh_from_db()
+        unmatched.refresh_from_db()
+        self.assertEqual(tyres.mechanic, near)
+        self.assertEqual(tyres.distance_km, Decimal('0.11'))
+        self.assertIsNotNone(tyres.estimated_cost)
+        self.assertEqual(electrical.mechanic, electrician)
+        self.assertIsNone(unmatched.mechanic)
+        
+        # Assigned requests are neither reassigned nor re-counted
+        self.assertEqual(run_dispatch_tick(publish=False)['assigned'], 0)
+    
+    def test_assign_reports_only_requests_given_its_mechanic(self):
+        from .dispatch import _assign
+        customer = create_user('customer@example.com', 'CUSTOMER')
+        mechanic, rival = create_user('mechanic@example.com', 'MECHANIC'), create_user('rival@example.com', 'MECHANIC')
+        mine, taken = [
+            ServiceRequest.objects.create(
+                customer=customer, issue_text='Help', customer_lat=Decimal('12.970000'),
+                customer_lng=Decimal('77.590000')
+            ) for _ in range(2)
+        ]
+        # Assigned elsewhere at the very instant this tick writes
+        now = timezone.now()
+        ServiceRequest.objects.filter(pk=taken.pk).update(mechanic=rival, updated_at=now)
+        
+        self.assertEqual(_assign({mine.pk: (mechanic.pk, 1.0), taken.pk: (mechanic.pk, 1.0)}, now), [mine.pk])
+        taken.refresh_from_db()
+        self.assertEqual(taken.mechanic, rival)
+    
+    @mock.patch('services.management.commands.run_dispatcher.close_old_connections')
+    def test_dispatcher_needs_a_cross_process_broker_to_publish(self, close_old_connections):
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, 'only delivers within this process'):
+            call_command('run_dispatcher', '--once', stdout=out)
+        call_command('run_dispatcher', '--once', '--no-events', stdout=out)
+        with override_settings(EVENT_BROKER='services.events.PostgresNotifyBroker'):
+            call_command('run_dispatcher', '--once', stdout=out)
+        self.assertEqual(out.getvalue().count('0/0 open requests'), 2)
+
+
+@override_settings(INBOX_RADIUS_KM=5, MECHANIC_INDEX_ENABLED=False)
+class MechanicInboxTests(TestCase):
+    
+    def setUp(self):
+        self.customer = create_user('customer@example.com', 'CUSTOMER')
+        self.mechanics = {}
+        for name, lat, skill_type in [
+            ('near', '12.971000', 'TYRES'), ('also_near', '12.980000', 'TYRES'),
+            ('far', '13.200000', 'TYRES'), ('electrician', '12.970000', 'ELECTRICAL'),
+        ]:
+            mechanic = create_user(f'{name}@example.com', 'MECHANIC')
+            MechanicProfile.objects.create(
+                user=mechanic, skill_type=skill_type, latitude=Decimal(lat), longitude=Decimal('77.590000')
+            )
+            self.mechanics[name] = mechanic
+    
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+    
+    def test_open_request_is_offered_to_nearby_mechanics_until_taken(self):
+        response = self.client_for(self.customer).post('/api/requests/create/', {
+            'issue_text': 'Flat tyre', 'skill_type': 'TYRES', 'customer_lat': '12.970000', 'customer_lng': '77.590000'
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        request_id = response.data['id']
+        self.assertEqual(
+            set(MechanicInboxEntry.objects.values_list('mechanic__email', flat=True)),
+            {'near@example.com', 'also_near@example.com'}
+        )
+        
+        results = self.client_for(self.mechanics['also_near']).get('/api/requests/mechanic/').data['results']
+        self.assertEqual([row['id'] for row in results], [request_id])
+        self.assertEqual(self.client_for(self.mechanics['far']).get('/api/requests/mechanic/').data['results'], [])
+        
+        response = self.client_for(self.mechanics['near']).post(f'/api/requests/{request_id}/accept/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['mechanic']['email'], 'near@example.com')
+        self.assertEqual(response.data['distance_km'], '0.11')
+        self.assertFalse(MechanicInboxEntry.objects.exists())
+        
+        response = self.client_for(self.mechanics['also_near']).post(f'/api/requests/{request_id}/accept/')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client_for(self.mechanics['also_near']).get('/api/requests/mechanic/').data['results'], [])
+    
+    def test_backfill_offers_requests_opened_before_the_inbox(self):
+        open_request, _ = [
+            ServiceRequest.objects.create(
+                customer=self.customer, mechanic=mechanic, issue_text='Flat tyre', skill_type='TYRES',
+                customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+            ) for mechanic in (None, self.mechanics['far'])
+        ]
+        out = StringIO()
+        call_command('backfill_mechanic_inbox', stdout=out)
+        call_command('backfill_mechanic_inbox', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'Offered 1 open requests to 2 mechanic inboxes', 'Offered 0 open requests to 0 mechanic inboxes'
+        ])
+        self.assertEqual(
+            set(MechanicInboxEntry.objects.values_list('service_request_id', 'mechanic__email')),
+            {(open_request.id, 'near@example.com'), (open_request.id, 'also_near@example.com')}
+        )
+
+
+class ConditionalGetTests(TestCase):
+    
+    def setUp(self):
+        self.customer = create_user('customer@example.com', 'CUSTOMER')
+        self.mechanic = create_user('mechanic@example.com', 'MECHANIC')
+        MechanicProfile.objects.create(user=self.mechanic)
+        self.service_request = ServiceRequest.objects.create(
+            customer=self.customer, mechanic=self.mechanic, issue_text='Flat tyre',
+            customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+        )
+    
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+    
+    def assertRevalidates(self, user, url, change, is_list=True):
+        """A repeated GET is a bodiless 304 until change() runs, then a 200 with a new ETag"""
+        client = self.client_for(user)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        # Lists are validated by ETag alone, see mechanic_assist.conditional
+        self.assertEqual(response.has_header('Last-Modified'), not is_list)
+        
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        
+        change()
+        user.refresh_from_db()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_customer_list_changes_with_the_nested_mechanic(self):
+        def rename_mechanic():
+            self.mechanic.name = 'Renamed'
+            self.mechanic.save()
+        self.assertRevalidates(self.customer, '/api/requests/customer/', rename_mechanic)
+    
+    def test_mechanic_list_changes_when_a_request_is_accepted(self):
+        self.assertRevalidates(
+            self.mechanic, '/api/requests/mechanic/',
+            lambda: self.client_for(self.mechanic).post(f'/api/requests/{self.service_request.id}/accept/')
+        )
+    
+    def test_pages_have_different_etags(self):
+        client = self.client_for(self.customer)
+        first = client.get('/api/requests/customer/')['ETag']
+        self.assertNotEqual(client.get('/api/requests/customer/?page_size=5')['ETag'], first)
+    
+    def test_current_user_and_mechanic_profile(self):
+        def update_profile():
+            self.client_for(self.mechanic).patch('/api/mechanic/profile/update/', {'availability': False})
+        self.assertRevalidates(self.mechanic, '/api/mechanic/profile/', update_profile, is_list=False)
+        
+        def update_user():
+            self.mechanic.phone = '5550199'
+            self.mechanic.save()
+        self.assertRevalidates(self.mechanic, '/api/auth/me/', update_user, is_list=False)
+    
+    def test_list_ignores_if_modified_since_when_a_row_is_deleted(self):
+        other = ServiceRequest.objects.create(
+            customer=self.customer, issue_text='Battery',
+            customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+        )
+        client = self.client_for(self.customer)
+        since = http_date(time.time() + 60)
+        other.delete()
+        response = client.get('/api/requests/customer/', HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data['results']], [self.service_request.id])
+
+
+@override_settings(SYNC_OVERLAP_SECONDS=0, QUERY_BUDGET_STRICT=True)
+class SyncTests(TestCase):
+    
+    def setUp(self):
+        self.customer = create_user('customer@example.com', 'CUSTOMER')
+        self.mechanics = [create_user(f'mechanic{i}@example.com', 'MECHANIC') for i in range(2)]
+        self.service_request = ServiceRequest.objects.create(
+            customer=self.customer, issue_text='Flat tyre',
+            customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+        )
+        for mechanic in self.mechanics:
+            MechanicInboxEntry.objects.create(
+                mechanic=mechanic, service_request=self.service_request, distance_km=Decimal('1.00')
+            )
+    
+    def sync(self, user, cursor=None):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/requests/sync/', {'since': cursor} if cursor else {})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+    
+    def test_sync_returns_changes_and_tombstones(self):
+        customer_sync = self.sync(self.customer)
+        self.assertEqual([row['id'] for row in customer_sync['requests']], [self.service_request.id])
+        mechanic_cursors = []
+        for mechanic in self.mechanics:
+            data = self.sync(mechanic)
+            self.assertEqual([row['id'] for row in data['requests']], [self.service_request.id])
+            mechanic_cursors.append(data['cursor'])
+        self.assertEqual(self.sync(self.customer, customer_sync['cursor'])['requests'], [])
+        
+        client = APIClient()
+        client.force_authenticate(self.mechanics[0])
+        self.assertEqual(client.post(f'/api/requests/{self.service_request.id}/accept/').status_code, 200)
+        
+        data = self.sync(self.customer, customer_sync['cursor'])
+        self.assertEqual([row['status'] for row in data['requests']], ['ACCEPTED'])
+        taker = self.sync(self.mechanics[0], mechanic_cursors[0])
+        self.assertEqual([row['id'] for row in taker['requests']], [self.service_request.id])
+        self.assertEqual(taker['deleted']['requests'], [])
+        other = self.sync(self.mechanics[1], mechanic_cursors[1])
+        self.assertEqual(other['requests'], [])
+        self.assertEqual(other['deleted']['requests'], [self.service_request.id])
+        
+        self.service_request.status = 'COMPLETED'
+        self.service_request.save()
+        rating = Rating.objects.create(
+            customer=self.customer, mechanic=self.mechanics[0], service_request=self.service_request, stars=5
+        )
+        data = self.sync(self.customer, data['cursor'])
+        self.assertEqual([row['id'] for row in data['ratings']], [rating.id])
+        request_id = self.service_request.id
+        self.service_request.delete()
+        data = self.sync(self.customer, data['cursor'])
+        self.assertEqual(data['deleted'], {'requests': [request_id], 'ratings': [rating.id]})
+    
+    def test_cancelled_offer_is_withdrawn_from_every_inbox(self):
+        cursor = self.sync(self.mechanics[1])['cursor']
+        admin = create_user('admin@example.com', 'ADMIN')
+        client = APIClient()
+        client.force_authenticate(admin)
+        client.post('/api/admin/services/cancel/', {'ids': [self.service_request.id]}, format='json')
+        self.assertEqual(self.sync(self.mechanics[1], cursor)['deleted']['requests'], [self.service_request.id])
+        self.assertEqual(SyncTombstone.objects.count(), 2)
+    
+    @override_settings(SYNC_TOMBSTONE_TTL_SECONDS=3600)
+    def test_purge_drops_only_expired_tombstones(self):
+        for object_id in (1, 2, 3):
+            SyncTombstone.objects.create(user_id=self.customer.id, kind='request', object_id=object_id)
+        SyncTombstone.objects.exclude(object_id=3).update(created_at=timezone.now() - timedelta(hours=2))
+        out = StringIO()
+        call_command('purge_sync_tombstones', batch_size=1, stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Deleted 2 expired sync tombstones')
+        self.assertEqual(list(SyncTombstone.objects.values_list('object_id', flat=True)), [3])
+    
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_large_changes_are_paged(self):
+        for _ in range(4):
+            ServiceRequest.objects.create(
+                customer=self.customer, issue_text='Flat tyre',
+                customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+            )
+        seen, cursor, has_more = [], None, True
+        while has_more:
+            data = self.sync(self.customer, cursor)
+            seen += [row['id'] for row in data['requests']]
+            cursor, has_more = data['cursor'], data['has_more']
+        self.assertEqual(sorted(seen), list(ServiceRequest.objects.order_by('id').values_list('id', flat=True)))
+    
+    def test_bad_and_expired_cursors(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        self.assertEqual(client.get('/api/requests/sync/', {'since': 'nonsense'}).status_code, 400)
+        cursor = self.sync(self.customer)['cursor']
+        with override_settings(SYNC_TOMBSTONE_TTL_SECONDS=-1):
+            self.assertEqual(client.get('/api/requests/sync/', {'since': cursor}).status_code, 410)
+
+
+@override_settings(SYNC_OVERLAP_SECONDS=0)
+class WaitForWorkTests(TransactionTestCase):
+    
+    def setUp(self):
+        # Rolled back users leave cached rows behind, and their ids get reused
+        user_cache.clear()
+        self.customer = create_user('customer@example.com', 'CUSTOMER')
+        self.mechanic = create_user('mechanic@example.com', 'MECHANIC')
+        MechanicProfile.objects.create(
+            user=self.mechanic, latitude=Decimal('12.971000'), longitude=Decimal('77.590000')
+        )
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.mechanic)}'}
+    
+    async def test_wait_returns_as_soon_as_work_arrives(self):
+        client = AsyncClient()
+        started = time.monotonic()
+        waiting = asyncio.ensure_future(
+            client.get('/api/requests/mechanic/wait/', {'timeout': 20}, headers=self.headers)
+        )
+        await asyncio.sleep(0.2)
+        
+        def create_request():
+            client = APIClient()
+            client.force_authenticate(self.customer)
+            return client.post('/api/requests/create/', {
+                'mechanic_id': self.mechanic.id, 'issue_text': 'Flat tyre',
+                'customer_lat': '12.970000', 'customer_lng': '77.590000'
+            }, format='json')
+        self.assertEqual((await sync_to_async(create_request)()).status_code, 201)
+        
+        response = await waiting
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertEqual([row['issue_text'] for row in response.json()['requests']], ['Flat tyre'])
+    
+    async def test_wait_times_out_with_no_changes(self):
+        response = await AsyncClient().get('/api/requests/mechanic/wait/', {'timeout': 1}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['requests'], [])
+        
+        response = await AsyncClient().get(
+            '/api/requests/mechanic/wait/', {'since': 'nonsense'}, headers=self.headers
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    NEARBY_CACHE_ENABLED=False,
+    REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {'nearby': '1/min', 'nearby_ip': '4/min'},
+    },
+)
+class ThrottleTests(TestCase):
+    
+    def setUp(self):
+        token_buckets.clear()
+        self.clock = FakeClock()
+        patcher = mock.patch.object(TokenBucketThrottle, 'timer', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+    
+    def test_nearby_search_is_limited_per_user_and_per_ip(self):
+        users = [create_user(f'customer{i}@example.com', 'CUSTOMER') for i in range(4)]
+        statuses = []
+        for user in [users[0], users[0], *users[1:]]:
+            self.client.force_authenticate(user)
+            statuses.append(self.client.get('/api/mechanics/nearby/?lat=12.97&lng=77.59').status_code)
+        # users[0]'s second search is refused by its own bucket but still takes a token
+        # from the IP's, as every throttle is checked; users[3]'s finds that one empty
+        self.assertEqual(statuses, [200, 429, 200, 200, 429])
+    
+    def test_quotes_share_the_nearby_search_buckets(self):
+        self.client.force_authenticate(create_user('customer@example.com', 'CUSTOMER'))
+        self.assertEqual(self.client.get('/api/mechanics/nearby/?lat=12.97&lng=77.59').status_code, 200)
+        self.assertEqual(self.client.get('/api/mechanics/quote/?lat=12.97&lng=77.59').status_code, 429)
+    
+    async def test_async_nearby_search_is_throttled(self):
+        customer = await sync_to_async(create_user)('customer@example.com', 'CUSTOMER')
+        request_factory = AsyncRequestFactory()
+        token = AccessToken.for_user(customer)
+        statuses = []
+        for _ in range(2):
+            request = request_factory.get(
+                '/api/mechanics/nearby/?lat=12.97&lng=77.59', headers={'Authorization': f'Bearer {token}'}
+            )
+            response = await async_views.nearby_mechanics_view(request)
+            statuses.append(response.status_code)
+        self.assertEqual(statuses, [200, 429])
+        self.assertEqual(response['Retry-After'], '60')
+
+
+class AdminExportTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin@example.com', 'ADMIN')
+        cls.customer = create_user('customer@example.com', 'CUSTOMER')
+        cls.mechanic = create_user('mechanic@example.com', 'MECHANIC')
+        cls.requests = [
+            ServiceRequest.objects.create(
+                customer=cls.customer, mechanic=mechanic, issue_text='Flat tyre', status=request_status,
+                customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+            )
+            for mechanic, request_status in [(None, 'REQUESTED'), (cls.mechanic, 'ACCEPTED'), (cls.mechanic, 'COMPLETED')]
+        ]
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+    
+    def export(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+    
+    @override_settings(ADMIN_EXPORT_CHUNK_SIZE=2)
+    def test_services_export_as_ndjson(self):
+        rows = [json.loads(line) for line in self.export('/api/admin/services/export.ndjson').splitlines()]
+        self.assertEqual([row['id'] for row in rows], [request.id for request in self.requests])
+        self.assertEqual(rows[0]['mechanic_name'], None)
+        self.assertEqual(rows[1]['mechanic_email'], 'mechanic@example.com')
+        self.assertEqual(rows[1]['customer_lat'], '12.970000')
+        
+        accepted = self.export('/api/admin/services/export.ndjson?status=ACCEPTED').splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in accepted], [self.requests[1].id])
+    
+    def test_users_export_as_csv(self):
+        response = self.client.get('/api/admin/users/export.csv?role=CUSTOMER')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('users.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([row['email'] for row in rows], ['customer@example.com'])
+    
+    def test_date_range_filter(self):
+        ServiceRequest.objects.filter(pk=self.requests[0].pk).update(created_at=timezone.now() - timedelta(days=3))
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        rows = self.export(f'/api/admin/services/export.ndjson?created_after={since}').splitlines()
+        self.assertEqual(len(rows), 2)
+        older = self.export(f'/api/admin/services/export.ndjson?created_before={since}').splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in older], [self.requests[0].id])
+    
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get('/api/admin/users/export.xml').status_code, 404)
+        self.assertEqual(self.client.get('/api/admin/users/export.csv?created_after=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/services/export.csv?status=LOST').status_code, 400)
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get('/api/admin/users/export.csv').status_code, 403)
+    
+    async def test_export_streams_from_an_async_iterator_under_asgi(self):
+        response = await AsyncClient().get(
+            '/api/admin/services/export.ndjson', headers={'Authorization': f'Bearer {AccessToken.for_user(self.admin)}'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        lines = [line async for line in response.streaming_content]
+        self.assertEqual([json.loads(line)['id'] for line in lines], [request.id for request in self.requests])
+
+
+class IdempotencyTests(TestCase):
+    
+    def test_retried_create_replays_the_first_response(self):
+        customer = create_user('customer@example.com', 'CUSTOMER')
+        client = APIClient()
+        client.force_authenticate(customer)
+        body = {'issue_text': 'Flat tyre', 'customer_lat': '12.970000', 'customer_lng': '77.590000'}
+        
+        first = client.post('/api/requests/create/', body, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        retry = client.post('/api/requests/create/', body, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((retry.status_code, retry.data), (201, first.data))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(ServiceRequest.objects.count(), 1)
+        
+        changed = client.post(
+            '/api/requests/create/', {**body, 'issue_text': 'Battery'}, format='json', HTTP_IDEMPOTENCY_KEY='retry-1'
+        )
+        self.assertEqual(changed.status_code, 422)
+        
+        client.post('/api/requests/create/', body, format='json', HTTP_IDEMPOTENCY_KEY='retry-2')
+        self.assertEqual(ServiceRequest.objects.count(), 2)
+    
+    def test_failed_create_is_not_stored(self):
+        customer = create_user('customer@example.com', 'CUSTOMER')
+        client = APIClient()
+        client.force_authenticate(customer)
+        body = {'issue_text': 'Flat tyre', 'customer_lat': '12.970000', 'customer_lng': '77.590000', 'mechanic_id': 0}
+        
+        for _ in range(2):
+            response = client.post('/api/requests/create/', body, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+            self.assertEqual(response.status_code, 404)
+    
+    @override_settings(IDEMPOTENCY_TTL_SECONDS=3600)
+    def test_purge_drops_only_expired_keys_in_batches(self):
+        customer = create_user('customer@example.com', 'CUSTOMER')
+        for key in ('old-1', 'old-2', 'old-3', 'new'):
+            IdempotencyKey.objects.create(user=customer, scope='requests.create', key=key, request_hash='0' * 64)
+        IdempotencyKey.objects.exclude(key='new').update(created_at=timezone.now() - timedelta(hours=2))
+        
+        out = StringIO()
+        # A short batch is the last one, so no empty SELECT follows it
+        with self.assertNumQueries(4):
+            call_command('purge_idempotency_keys', batch_size=2, stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Deleted 3 expired idempotency keys')
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+
+
+@override_settings(NEARBY_CACHE_ENABLED=False, MECHANIC_INDEX_ENABLED=False, BASE_FARE=100, PER_KM_RATE=10)
+class QuoteTests(TestCase):
+    
+    def test_quotes_match_request_pricing(self):
+        customer = create_user('customer@example.com', 'CUSTOMER')
+        mechanics = []
+        for i, lat in enumerate(['12.980000', '12.970000', None]):
+            mechanic = create_user(f'mechanic{i}@example.com', 'MECHANIC')
+            MechanicProfile.objects.create(
+                user=mechanic, latitude=lat and Decimal(lat), longitude=lat and Decimal('77.590000')
+            )
+            mechanics.append(mechanic)
+        client = APIClient()
+        client.force_authenticate(customer)
+        
+        ids = ','.join(str(mechanic.id) for mechanic in mechanics)
+        quotes = client.get(f'/api/mechanics/quote/?lat=12.97&lng=77.59&mechanic_ids={ids}').data
+        self.assertEqual([quote['mechanic_id'] for quote in quotes], [mechanics[1].id, mechanics[0].id, mechanics[2].id])
+        self.assertEqual([quote['distance_km'] for quote in quotes], [0.0, 1.11, None])
+        self.assertEqual([quote['estimated_cost'] for quote in quotes], [100.0, 111.1, None])
+        
+        nearby = client.get('/api/mechanics/quote/?lat=12.97&lng=77.59').data
+        self.assertEqual(nearby, quotes[:2])
+        self.assertEqual(client.get('/api/mechanics/quote/?lat=12.97&lng=77.59&mechanic_ids=x').status_code, 400)
+
+
+class MechanicLocationIndexTests(TestCase):
+    
+    def create_mechanic(self, name, lat, lng='77.590000', skill_type='GENERAL_REPAIR'):
+        return MechanicProfile.objects.create(
+            user=create_user(f'{name}@example.com', 'MECHANIC'),
+            latitude=Decimal(lat), longitude=Decimal(lng), skill_type=skill_type
+        )
+    
+    def test_kd_tree_matches_brute_force(self):
+        rng = random.Random(7)
+        coordinates = [(rng.uniform(12.5, 13.5), rng.uniform(77, 78)) for _ in range(500)]
+        tree = KDTree(list(range(len(coordinates))), [to_unit_vector(lat, lng) for lat, lng in coordinates])
+        origin = to_unit_vector(12.97, 77.59)
+        exact = sorted(
+            (sum((a - b) ** 2 for a, b in zip(to_unit_vector(lat, lng), origin)), key)
+            for key, (lat, lng) in enumerate(coordinates)
+        )
+        
+        self.assertEqual([key for _, key in tree.query(origin, k=10)], [key for _, key in exact[:10]])
+        max_chord_sq = km_to_chord_sq(15)
+        self.assertEqual(
+            [key for _, key in tree.query(origin, max_chord_sq=max_chord_sq)],
+            [key for d, key in exact if d <= max_chord_sq]
+        )
+        odd = tree.query(origin, k=5, accept=lambda key, d: key % 2)
+        self.assertEqual([key for _, key in odd], [key for _, key in exact if key % 2][:5])
+    
+    def test_nearest_applies_own_changes_through_the_overlay(self):
+        near = self.create_mechanic('near', '12.971000')
+        far = self.create_mechanic('far', '12.990000', skill_type='TYRES')
+        index = MechanicLocationIndex()
+        index.rebuild()
+        self.assertEqual([pk for _, pk in index.nearest(12.97, 77.59)], [near.pk, far.pk])
+        self.assertEqual([pk for _, pk in index.nearest(12.97, 77.59, skill_type='TYRES')], [far.pk])
+        self.assertEqual([pk for _, pk in index.nearest(12.97, 77.59, radius_km=1)], [near.pk])
+        
+        index.sync_profile(far.pk, True, Decimal('12.970000'), Decimal('77.590000'), 'TYRES')
+        index.sync_profile(near.pk, False, near.latitude, near.longitude, near.skill_type)
+        distance, pk = index.nearest(12.97, 77.59, k=1)[0]
+        self.assertEqual((round(distance, 6), pk), (0, far.pk))
+        self.assertEqual(len(index.nearest(12.97, 77.59)), 1)
+    
+    @override_settings(MECHANIC_INDEX_REFRESH_SECONDS=0)
+    def test_nearest_catches_up_with_other_processes(self):
+        moved = self.create_mechanic('moved', '12.971000')
+        deleted = self.create_mechanic('deleted', '12.972000')
+        index = MechanicLocationIndex()
+        index.rebuild()
+        
+        # Updates and deletes made elsewhere reach this index only through the database
+        MechanicProfile.objects.filter(pk=moved.pk).update(latitude=Decimal('13.500000'), updated_at=timezone.now())
+        with self.assertNumQueries(2):
+            self.assertEqual([pk for _, pk in index.nearest(12.97, 77.59, radius_km=5)], [deleted.pk])
+        
+        deleted.delete()
+        self.assertEqual([pk for _, pk in index.nearest(12.97, 77.59, radius_km=100)], [moved.pk])
+
+
+@override_settings(NEARBY_CACHE_ENABLED=False, MECHANIC_INDEX_ENABLED=False)
+class NearbyPrefilterTests(TestCase):
+    
+    def test_bounding_box_encloses_the_circle(self):
+        min_lat, max_lat, min_lng, max_lng = bounding_box(12.97, 77.59, 10)
+        lats = [min_lat, max_lat, 12.97, 12.97]
+        lngs = [77.59, 77.59, min_lng, max_lng]
+        # The box edges touch the circle at its four compass points
+        for distance in calculate_distances((12.97, 77.59), lats, lngs):
+            self.assertAlmostEqual(float(distance), 10, delta=0.01)
+        
+        self.assertEqual(bounding_box(89.99, 0, 10)[2:], (-180.0, 180.0))
+        self.assertEqual(bounding_box(0, 179.99, 10)[2:], (-180.0, 180.0))
+    
+    def test_box_cells_cover_every_point_in_the_box(self):
+        box = bounding_box(12.97, 77.59, 25)
+        cells = set(location_cells_for_box(*box))
+        for lat in (box[0], 12.97, box[1]):
+            for lng in (box[2], 77.59, box[3]):
+                self.assertIn(location_cell(lat, lng), cells)
+        self.assertIsNone(location_cell(None, 77.59))
+        self.assertIsNone(location_cells_for_box(-90, 90, -180, 180))
+        self.assertEqual(location_cell(90, 180), location_cell(89.95, 179.95))
+    
+    def test_database_search_keeps_only_mechanics_within_radius(self):
+        customer = create_user('customer@example.com', 'CUSTOMER')
+        for i, lat in enumerate(['12.975000', '13.050000', '12.900000']):
+            MechanicProfile.objects.create(
+                user=create_user(f'mechanic{i}@example.com', 'MECHANIC'),
+                latitude=Decimal(lat), longitude=Decimal('77.590000')
+            )
+        client = APIClient()
+        client.force_authenticate(customer)
+        
+        response = client.get('/api/mechanics/nearby/?lat=12.97&lng=77.59&radius_km=8.5')
+        self.assertEqual([mechanic['distance_km'] for mechanic in response.data], [0.56, 7.78])
+        for query in ('lat=nan&lng=77.59', 'lat=12.97&lng=inf', 'lat=91&lng=77.59', 'lat=12.97&lng=77.59&radius_km=nan'):
+            self.assertEqual(client.get(f'/api/mechanics/nearby/?{query}').status_code, 400, query)
+
+
+class DistanceEngineTests(TestCase):
+    
+    def test_haversine_stays_within_half_a_percent_of_the_geodesic(self):
+        rng = random.Random(3)
+        lats = [rng.uniform(-80, 80) for _ in range(200)]
+        lngs = [rng.uniform(-180, 180) for _ in range(200)]
+        fast = calculate_distances((12.97, 77.59), lats, lngs)
+        exact = calculate_distances((12.97, 77.59), lats, lngs, exact=True)
+        for fast_km, exact_km in zip(fast, exact):
+            self.assertLessEqual(abs(fast_km - exact_km), exact_km * 0.005)
+    
+    def test_missing_coordinates_give_nan(self):
+        distances = calculate_distances(
+            (12.97, 77.59), [Decimal('12.980000'), None], [Decimal('77.590000'), Decimal('77.590000')]
+        )
+        self.assertAlmostEqual(float(distances[0]), 1.11, places=2)
+        self.assertTrue(math.isnan(distances[1]))
+        self.assertEqual(calculate_distance(12.97, 77.59, 12.98, 77.59), 1.11)
+        self.assertIsNone(calculate_distance(12.97, 77.59, None, 77.59))
+    
+    @override_settings(BASE_FARE=100, PER_KM_RATE=10)
+    def test_batch_pricing_matches_single_pricing_on_half_cents(self):
+        distances = [k / 2000 for k in range(20000)]
+        self.assertEqual(calculate_estimated_costs(distances), [calculate_estimated_cost(d) for d in distances])
+        self.assertEqual(calculate_estimated_costs([0.0125, math.nan]), [calculate_estimated_cost(0.0125), None])
+        self.assertEqual(calculate_estimated_costs([Decimal('1.11'), None]), [111.1, None])
+
+
+@override_settings(NEARBY_CACHE_ENABLED=False)
+class NearbyPagingTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = create_user('customer@example.com', 'CUSTOMER')
+        # Two mechanics at the same spot make the cursor break the tie on id
+        cls.profiles = [
+            MechanicProfile.objects.create(
+                user=create_user(f'mechanic{i}@example.com', 'MECHANIC'), skill_type=skill_type,
+                latitude=Decimal(lat), longitude=Decimal('77.590000')
+            )
+            for i, (lat, skill_type) in enumerate([
+                ('12.980000', 'TYRES'), ('12.980000', 'GENERAL_REPAIR'), ('12.975000', 'TYRES'), ('12.990000', 'TYRES')
+            ])
+        ]
+    
+    def setUp(self):
+        # Each walk is several searches from the one test IP
+        token_buckets.clear()
+        self.addCleanup(token_buckets.clear)
+        mechanic_index.invalidate()
+        self.addCleanup(mechanic_index.invalidate)
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+    
+    def walk(self, query):
+        ids, cursor = [], None
+        for _ in range(10):
+            url = f'/api/mechanics/nearby/?lat=12.97&lng=77.59&limit=1&{query}'
+            response = self.client.get(url + (f'&cursor={cursor}' if cursor else ''))
+            self.assertEqual(response.status_code, 200)
+            ids += [mechanic['id'] for mechanic in response.data]
+            cursor = response.get('X-Next-Cursor')
+            if not cursor:
+                return ids
+        self.fail('cursor did not stop')
+    
+    def test_pages_follow_distance_then_id(self):
+        first, second, nearest, farthest = [profile.id for profile in self.profiles]
+        for enabled in (False, True):
+            with self.subTest(index=enabled), override_settings(MECHANIC_INDEX_ENABLED=enabled):
+                self.assertEqual(self.walk('radius_km=5'), [nearest, first, second, farthest])
+                self.assertEqual(self.walk('radius_km=5&skill_type=TYRES'), [nearest, first, farthest])
+                self.assertEqual(self.walk('radius_km=1.2'), [nearest, first, second])
+        self.assertEqual(self.client.get('/api/mechanics/nearby/?lat=12.97&lng=77.59&cursor=x').status_code, 400)
+        self.assertEqual(self.client.get('/api/mechanics/nearby/?lat=12.97&lng=77.59&skill_type=X').status_code, 400)
+    
+    @override_settings(MECHANIC_INDEX_ENABLED=True)
+    def test_index_reads_past_mechanics_the_database_made_unavailable(self):
+        first, second, nearest, farthest = [profile.id for profile in self.profiles]
+        self.assertEqual(self.walk('radius_km=5'), [nearest, first, second, farthest])
+        # A bulk update saves no updated_at, so the index still holds both as available
+        MechanicProfile.objects.filter(id__in=[nearest, first]).update(availability=False)
+        self.assertEqual(self.walk('radius_km=5'), [second, farthest])
+        response = self.client.get('/api/mechanics/nearby/?lat=12.97&lng=77.59&radius_km=5&limit=2')
+        self.assertEqual([mechanic['id'] for mechanic in response.data], [second, farthest])
+
+
+@override_settings(MECHANIC_INDEX_ENABLED=False, NEARBY_CACHE_ENABLED=True, NEARBY_CACHE_CELL_DEGREES=0.05)
+class NearbyCacheTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = create_user('customer@example.com', 'CUSTOMER')
+        rng = random.Random(11)
+        for i in range(30):
+            MechanicProfile.objects.create(
+                user=create_user(f'mechanic{i}@example.com', 'MECHANIC'),
+                latitude=Decimal(f'{rng.uniform(12.90, 13.10):.6f}'),
+                longitude=Decimal(f'{rng.uniform(77.50, 77.70):.6f}')
+            )
+    
+    def setUp(self):
+        nearby_cache.clear()
+        self.addCleanup(nearby_cache.clear)
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+    
+    def search(self, lat, lng, query='radius_km=4&limit=5'):
+        response = self.client.get(f'/api/mechanics/nearby/?lat={lat}&lng={lng}&{query}')
+        return response.data, response.get('X-Next-Cursor')
+    
+    def test_cached_pages_match_uncached_search_from_each_origin(self):
+        # Origins spread over one 0.05 degree cell, ranked from its center when cached
+        origins = [(12.951, 77.551), (12.999, 77.599), (12.975, 77.552), (12.951, 77.598)]
+        for query in ('radius_km=4&limit=5', 'radius_km=2&limit=3', 'radius_km=6&limit=50'):
+            for lat, lng in origins:
+                cached = self.search(lat, lng, query)
+                with override_settings(NEARBY_CACHE_ENABLED=False):
+                    self.assertEqual(cached, self.search(lat, lng, query), (lat, lng, query))
+        self.assertGreater(nearby_cache.hits, 0)
+    
+    def test_mechanic_change_drops_only_entries_that_could_include_it(self):
+        results, _ = self.search(12.97, 77.59)
+        self.search(13.4, 77.59)
+        self.assertEqual(nearby_cache.stats()['entries'], 2)
+        nearby_cache.invalidate_point(results[0]['latitude'], results[0]['longitude'])
+        self.assertEqual(nearby_cache.stats()['entries'], 1)
+        self.assertIsNotNone(nearby_cache.get(nearby_cache.snap(13.4, 77.59)[0], (4.0, 5, None)))
+
+
+@override_settings(NEARBY_CACHE_ENABLED=False)
+class LocationBufferTests(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.mechanic = create_user('mechanic@example.com', 'MECHANIC')
+        cls.other = create_user('other@example.com', 'MECHANIC')
+        for user in (cls.mechanic, cls.other):
+            MechanicProfile.objects.create(user=user, latitude=Decimal('12.970000'), longitude=Decimal('77.590000'))
+    
+    def setUp(self):
+        # Flushes are driven by the tests, not the background thread
+        patcher = mock.patch.object(LocationBuffer, '_ensure_worker')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(mechanic_index.invalidate)
+        self.buffer = LocationBuffer()
+    
+    def location(self, user):
+        profile = MechanicProfile.objects.get(user=user)
+        return profile.latitude, profile.longitude
+    
+    def test_flush_writes_the_latest_ping_per_mechanic_in_one_update(self):
+        self.buffer.add(self.mechanic.id, 12.5, 77.5, recorded_at=200)
+        self.buffer.add(self.mechanic.id, 12.1, 77.1, recorded_at=100)
+        self.buffer.add(self.mechanic.id, 12.6, 77.6, recorded_at=300)
+        self.buffer.add(self.other.id, 13.0, 78.0, recorded_at=100)
+        self.assertEqual(self.buffer.stats()['pending'], 2)
+        
+        # The profile read and a single UPDATE, plus the savepoint around it under TestCase
+        with self.assertNumQueries(4):
+            self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.location(self.mechanic), (Decimal('12.600000'), Decimal('77.600000')))
+        self.assertEqual(self.location(self.other), (Decimal('13.000000'), Decimal('78.000000')))
+        self.assertEqual(self.buffer.stats()['totals'], {'pings': 4, 'rows_written': 2, 'flushes': 1})
+        self.assertEqual(self.buffer.flush(), 0)
+    
+    def test_failed_flush_requeues_without_overwriting_newer_pings(self):
+        self.buffer.add(self.mechanic.id, 12.5, 77.5, recorded_at=200)
+        self.buffer.add(self.other.id, 13.0, 78.0, recorded_at=200)
+        
+        def fail(*args, **kwargs):
+            # A ping arriving while the write is in flight is newer than the failed batch
+            self.buffer.add(self.other.id, 13.5, 78.5, recorded_at=300)
+            raise RuntimeError('database unavailable')
+        
+        with mock.patch.object(MechanicProfile.objects, 'bulk_update', side_effect=fail):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+        self.assertEqual(self.location(self.mechanic), (Decimal('12.970000'), Decimal('77.590000')))
+        
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.location(self.mechanic), (Decimal('12.500000'), Decimal('77.500000')))
+        self.assertEqual(self.location(self.other), (Decimal('13.500000'), Decimal('78.500000')))
+        self.assertEqual(self.buffer.stats()['totals']['pings'], 3)
+    
+    @override_settings(LOCATION_MAX_CLOCK_SKEW_SECONDS=60)
+    def test_ping_view_validates_before_queueing(self):
+        client = APIClient()
+        client.force_authenticate(self.mechanic)
+        now = time.time()
+        with mock.patch('services.views.location_buffer') as buffer:
+            for recorded_at in ('nan', 'inf', now + 3600):
+                response = client.post(
+                    '/api/mechanic/location/',
+                    {'latitude': 12.9, 'longitude': 77.5, 'recorded_at': recorded_at}, format='json'
+                )
+                self.assertEqual(response.status_code, 400, recorded_at)
+            
+            response = client.post(
+                '/api/mechanic/location/', {'latitude': 12.9, 'longitude': 77.5, 'recorded_at': now}, format='json'
+            )
+            self.assertEqual(response.status_code, 202)
+            buffer.add.assert_called_once_with(self.mechanic.id, 12.9, 77.5, now)
+            
+            client.force_authenticate(create_user('new@example.com', 'MECHANIC'))
+            response = client.post('/api/mechanic/location/', {'latitude': 12.9, 'longitude': 77.5}, format='json')
+            self.assertEqual(response.status_code, 404)
+            buffer.add.assert_called_once()
+
+
+class WebSocketConnection:
+    """Drives an ASGI WebSocket application through in-memory queues"""
+    
+    def __init__(self, path, query_string=b''):
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+        scope = {'type': 'websocket', 'path': path, 'query_string': query_string}
+        self.task = asyncio.ensure_future(websocket_application(scope, self.incoming.get, self.outgoing.put))
+    
+    async def connect(self):
+        await self.incoming.put({'type': 'websocket.connect'})
+        return await self.receive()
+    
+    async def send_text(self, text):
+        await self.incoming.put({'type': 'websocket.receive', 'text': text})
+    
+    async def receive(self):
+        return await asyncio.wait_for(self.outgoing.get(), 5)
+    
+    async def disconnect(self):
+        await self.incoming.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(self.task, 5)
+
+
+class WebSocketTests(TestCase):
+    
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.broker = InProcessBroker()
+        patcher = mock.patch('services.websocket.get_broker', return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    async def test_rejects_unknown_paths_and_missing_or_bad_tokens(self):
+        connection = WebSocketConnection('/ws/unknown/')
+        self.assertEqual(await connection.connect(), {'type': 'websocket.close', 'code': 4404})
+        
+        inactive = await sync_to_async(create_user)('inactive@example.com', 'CUSTOMER')
+        inactive.is_active = False
+        await sync_to_async(inactive.save)()
+        for query_string in (b'', b'token=not-a-token', f'token={AccessToken.for_user(inactive)}'.encode()):
+            connection = WebSocketConnection('/ws/requests/', query_string)
+            self.assertEqual(await connection.connect(), {'type': 'websocket.close', 'code': 4401}, query_string)
+            await asyncio.wait_for(connection.task, 5)
+    
+    async def test_streams_only_the_users_own_events(self):
+        customer = await sync_to_async(create_user)('customer@example.com', 'CUSTOMER')
+        other = await sync_to_async(create_user)('other@example.com', 'CUSTOMER')
+        connection = WebSocketConnection('/ws/requests/', f'token={AccessToken.for_user(customer)}'.encode())
+        self.assertEqual(await connection.connect(), {'type': 'websocket.accept'})
+        
+        await connection.send_text('ping')
+        self.assertEqual(await connection.receive(), {'type': 'websocket.send', 'text': 'pong'})
+        
+        # Published in order, so the other user's event would arrive first if it leaked
+        self.broker.publish(user_channel(other.id), {'type': 'request.created', 'request': {'id': 1}})
+        self.broker.publish(user_channel(customer.id), {'type': 'request.accepted', 'request': {'id': 2}})
+        message = await connection.receive()
+        self.assertEqual(json.loads(message['text']), {'type': 'request.accepted', 'request': {'id': 2}})
+        
+        await connection.disconnect()
+        self.assertEqual(self.broker._subscriptions, {})
+
+
+class PostgresNotifyBrokerTests(TestCase):
+    
+    def test_listener_reconnects_with_backoff_and_listens_again(self):
+        import psycopg2
+        
+        class StopListening(Exception):
+            pass
+        
+        def listener_connection(poll):
+            pg_connection = mock.MagicMock(notifies=[])
+            pg_connection.poll.side_effect = poll
+            return pg_connection
+        
+        def notify():
+            payload = json.dumps({'channel': 'user:1', 'message': {'type': 'request.created'}})
+            working.notifies.append(mock.Mock(payload=payload))
+        
+        dropped = listener_connection(psycopg2.OperationalError('server closed the connection'))
+        working = listener_connection(notify)
+        broker = PostgresNotifyBroker()
+        patchers = [
+            mock.patch('psycopg2.connect', side_effect=[
+                psycopg2.OperationalError('refused'), psycopg2.OperationalError('refused'), dropped, working,
+            ]),
+            mock.patch('services.events.select.select', side_effect=[
+                ([dropped], [], []), ([working], [], []), StopListening,
+            ]),
+            mock.patch('services.events.time.sleep'),
+            mock.patch.object(broker, 'deliver_local'),
+        ]
+        connect, _, sleep, deliver_local = [patcher.start() for patcher in patchers]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+        
+        with self.assertLogs('services.events') as logs, self.assertRaises(StopListening):
+            broker._listen()
+        
+        self.assertEqual(connect.call_count, 4)
+        # Doubling while the server refuses, back to the first delay once connected
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1, 2, 1])
+        self.assertEqual(len(logs.records), 3)
+        for pg_connection in (dropped, working):
+            pg_connection.cursor.return_value.__enter__.return_value.execute.assert_called_once_with(
+                'LISTEN mechanic_assist_events'
+            )
+            pg_connection.close.assert_called_once_with()
+        deliver_local.assert_called_once_with('user:1', {'type': 'request.created'})
+
+
+@override_settings(NEARBY_CACHE_ENABLED=False, MECHANIC_INDEX_ENABLED=False)
+class AsyncViewTests(TransactionTestCase):
+    """
+    The async views routed under ASGI answer exactly like their sync counterparts
+    Committed data, since run_sync reads on the connections of its worker threads
+    """
+    
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.customer = create_user('customer@example.com', 'CUSTOMER')
+        self.mechanic = create_user('mechanic@example.com', 'MECHANIC')
+        MechanicProfile.objects.create(user=self.mechanic, latitude=Decimal('12.971000'), longitude=Decimal('77.590000'))
+        for status in ('REQUESTED', 'ACCEPTED', 'COMPLETED'):
+            ServiceRequest.objects.create(
+                customer=self.customer, mechanic=self.mechanic, issue_text=status, status=status,
+                customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+            )
+    
+    def auth_headers(self, user):
+        return {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+    
+    def async_get(self, view, path, user=None, **headers):
+        if user is not None:
+            headers.update(self.auth_headers(user))
+        return async_to_sync(view)(AsyncRequestFactory().get(path, headers=headers))
+    
+    def test_responses_match_the_sync_views(self):
+        for view, user, path in [
+            (async_views.customer_requests_view, self.customer, '/api/requests/customer/?page_size=2'),
+            (async_views.mechanic_requests_view, self.mechanic, '/api/requests/mechanic/?page_size=2'),
+            (async_views.nearby_mechanics_view, self.customer, '/api/mechanics/nearby/?lat=12.97&lng=77.59&limit=1'),
+        ]:
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=self.auth_headers(user)['Authorization'])
+            expected = client.get(path)
+            response = self.async_get(view, path, user)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertEqual(json.loads(response.content), expected.json(), path)
+            for header in ('ETag', 'Last-Modified', 'X-Next-Cursor'):
+                self.assertEqual(response.get(header), expected.get(header), (path, header))
+    
+    def test_conditional_get_and_errors(self):
+        path = '/api/requests/customer/'
+        etag = self.async_get(async_views.customer_requests_view, path, self.customer)['ETag']
+        response = self.async_get(async_views.customer_requests_view, path, self.customer, If_None_Match=etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+        
+        self.assertEqual(self.async_get(async_views.customer_requests_view, path).status_code, 401)
+        self.assertEqual(self.async_get(async_views.customer_requests_view, path, self.mechanic).status_code, 403)
+        response = async_to_sync(async_views.customer_requests_view)(AsyncRequestFactory().post(path))
+        self.assertEqual(response.status_code, 405)
+        response = self.async_get(async_views.nearby_mechanics_view, '/api/mechanics/nearby/?lat=nan&lng=1', self.customer)
+        self.assertEqual(response.status_code, 400)
+
+
+class HotQueryIndexTests(TestCase):
+    
+    def test_migrations_create_the_list_indexes(self):
+        expected = {
+            'service_requests': {
+                'req_customer_created_idx', 'req_mechanic_created_idx', 'req_customer_updated_idx',
+                'req_mechanic_updated_idx', 'req_open_unassigned_idx',
+            },
+            'ratings': {'rating_mechanic_created_idx', 'rating_customer_updated_idx', 'rating_mechanic_updated_idx'},
+            'mechanic_profiles': {'mech_avail_cell_idx', 'mech_updated_idx'},
+        }
+        with connection.cursor() as cursor:
+            for table, names in expected.items():
+                constraints = connection.introspection.get_constraints(cursor, table)
+                self.assertLessEqual(names, set(constraints), table)
+    
+    def test_hot_queries_use_their_indexes(self):
+        customer = create_user('customer@example.com', 'CUSTOMER')
+        mechanic = create_user('mechanic@example.com', 'MECHANIC')
+        MechanicProfile.objects.create(user=mechanic, latitude=Decimal('28.613900'), longitude=Decimal('77.209000'))
+        for i in range(20):
+            ServiceRequest.objects.create(
+                customer=customer, mechanic=mechanic if i % 2 else None, issue_text='Flat tyre',
+                customer_lat=Decimal('12.970000'), customer_lng=Decimal('77.590000')
+            )
+        
+        out = StringIO()
+        call_command('explain_hot_queries', stdout=out)
+        # Equality plus ORDER BY on the index columns is answered by the index on any
+        # backend; the others depend on the planner and table statistics, and SQLite
+        # names the index behind a unique constraint itself
+        for description in (
+            'Customer request list', 'Mechanic request list, assigned part', 'Customer delta sync',
+            'Mechanic delta sync, ratings part', 'Mechanic ratings',
+        ):
+            self.assertIn(f'{description}: uses', out.getvalue())
+    
+    def test_list_pages_are_read_in_index_order(self):
+        # The keyset order (created_at, id) is the index order, so no sort step is needed
+        for queryset, index in (
+            (first_page(customer_requests_queryset(1)), 'req_customer_created_idx'),
+            (first_page(mechanic_ratings_queryset(1).select_related('customer')), 'rating_mechanic_created_idx'),
+        ):
+            plan = queryset.explain()
+            self.assertIn(index, plan)
+            if connection.vendor == 'sqlite':
+                self.assertNotIn('TEMP B-TREE', plan)
+            elif connection.vendor == 'postgresql':
+                self.assertNotIn('Sort', plan)
@@ -1,9 +1,19 @@
 from django.urls import path
-from .views import admin_users_view, admin_services_view, admin_delete_user_view
+from .views import (
+    admin_users_view, admin_services_view, admin_cancel_services_view, admin_delete_user_view,
+    admin_users_export_view, admin_services_export_view,
+    admin_nearby_cache_stats_view, admin_location_buffer_stats_view, admin_inbox_stats_view
+)
 
 urlpatterns = [
     path('users/', admin_users_view, name='admin-users'),
     path('services/', admin_services_view, name='admin-services'),
+    path('users/export.<str:export_format>', admin_users_export_view, name='admin-users-export'),
+    path('services/export.<str:export_format>', admin_services_export_view, name='admin-services-export'),
+    path('services/cancel/', admin_cancel_services_view, name='admin-cancel-services'),
     path('users/<int:pk>/delete/', admin_delete_user_view, name='admin-delete-user'),
+    path('nearby-cache/', admin_nearby_cache_stats_view, name='admin-nearby-cache'),
+    path('location-buffer/', admin_location_buffer_stats_view, name='admin-location-buffer'),
+    path('inbox/', admin_inbox_stats_view, name='admin-inbox'),
 ]
 
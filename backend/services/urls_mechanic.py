@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import MechanicProfileView, MechanicProfileUpdateView
+from .views import MechanicProfileView, MechanicProfileUpdateView, mechanic_location_ping_view
 
 urlpatterns = [
     path('profile/', MechanicProfileView.as_view(), name='mechanic-profile'),
     path('profile/update/', MechanicProfileUpdateView.as_view(), name='mechanic-profile-update'),
+    path('location/', mechanic_location_ping_view, name='mechanic-location'),
 ]
 
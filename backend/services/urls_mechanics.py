@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.urls import path
-from .views import nearby_mechanics_view
+from . import async_views
+from .views import mechanic_quotes_view, nearby_mechanics_view
 
 urlpatterns = [
-    path('nearby/', nearby_mechanics_view, name='nearby-mechanics'),
+    path('nearby/', async_views.nearby_mechanics_view if settings.ASYNC_VIEWS else nearby_mechanics_view,
+         name='nearby-mechanics'),
+    path('quote/', mechanic_quotes_view, name='mechanic-quotes'),
 ]
-
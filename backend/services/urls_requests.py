@@ -1,13 +1,20 @@
+from django.conf import settings
 from django.urls import path
+from . import async_views
 from .views import (
     ServiceRequestCreateView, customer_requests_view, mechanic_requests_view,
-    accept_request_view, complete_request_view
+    accept_request_view, complete_request_view, sync_view
 )
 
 urlpatterns = [
     path('create/', ServiceRequestCreateView.as_view(), name='create-request'),
-    path('customer/', customer_requests_view, name='customer-requests'),
-    path('mechanic/', mechanic_requests_view, name='mechanic-requests'),
+    path('customer/', async_views.customer_requests_view if settings.ASYNC_VIEWS else customer_requests_view,
+         name='customer-requests'),
+    path('mechanic/', async_views.mechanic_requests_view if settings.ASYNC_VIEWS else mechanic_requests_view,
+         name='mechanic-requests'),
+    path('sync/', sync_view, name='sync-requests'),
+    # Async only: a waiting poll holds a coroutine, not a worker thread, under ASGI
+    path('mechanic/wait/', async_views.wait_for_work_view, name='mechanic-wait-for-work'),
     path('<int:pk>/accept/', accept_request_view, name='accept-request'),
     path('<int:pk>/complete/', complete_request_view, name='complete-request'),
 ]
@@ -1,16 +1,40 @@
+import base64
+import heapq
+import json
+import math
+from decimal import Decimal
+
 from rest_framework import status, generics, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
-from django.db.models import Q
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from accounts.models import User
-from .models import MechanicProfile, ServiceRequest
+from mechanic_assist.conditional import Validators
+from mechanic_assist.query_budget import query_budget
+from mechanic_assist.throttling import NearbySearchIPThrottle, NearbySearchUserThrottle
+from ratings.models import Rating
+from ratings.serializers import RatingSerializer
+from .models import MechanicInboxEntry, MechanicProfile, ServiceRequest
 from .serializers import (
     MechanicProfileSerializer, MechanicProfileUpdateSerializer,
     NearbyMechanicSerializer, ServiceRequestSerializer,
     ServiceRequestCreateSerializer, ServiceRequestListSerializer
 )
-from .utils import calculate_distance, calculate_estimated_cost
+from .cache import nearby_cache
+from .events import publish_request_event
+from .export import EXPORT_FORMATS, export_response, parse_export_filters
+from .idempotency import IdempotentCreateMixin
+from .inbox import fan_out_request, inbox_stats, prune_requests
+from .location_buffer import location_buffer
+from .pagination import CreatedAtCursorPagination
+from .spatial import mechanic_index, cursor_distance
+from .sync import SyncCursorExpired, changes_since
+from .utils import (
+    calculate_distance, calculate_distances, calculate_estimated_cost, calculate_estimated_costs,
+    bounding_box, location_cells_for_box
+)
 
 
 class MechanicProfileView(generics.RetrieveAPIView):
@@ -25,6 +49,14 @@ class MechanicProfileView(generics.RetrieveAPIView):
         except MechanicProfile.DoesNotExist:
             from rest_framework.exceptions import NotFound
             raise NotFound("Mechanic profile not found. Please update your profile.")
+    
+    def retrieve(self, request, *args, **kwargs):
+        profile = self.get_object()
+        validators = Validators.for_instances(request, profile, request.user)
+        not_modified = validators.not_modified(request)
+        if not_modified:
+            return not_modified
+        return validators.apply(Response(self.get_serializer(profile).data))
 
 
 class MechanicProfileUpdateView(generics.UpdateAPIView):
@@ -46,64 +78,388 @@ class MechanicProfileUpdateView(generics.UpdateAPIView):
         return Response(MechanicProfileSerializer(instance).data, status=status.HTTP_200_OK)
 
 
-@api_view(['GET'])
+@api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
-def nearby_mechanics_view(request):
-    """Get nearby mechanics sorted by distance"""
-    lat = request.query_params.get('lat')
-    lng = request.query_params.get('lng')
-    
-    if not lat or not lng:
+def mechanic_location_ping_view(request):
+    """
+    Queue a mechanic location update
+    Pings are coalesced in memory and written in bulk; the only query is the check that
+    the mechanic has a profile, since the flush silently drops pings without one
+    """
+    if request.user.role != 'MECHANIC':
         return Response(
-            {'error': 'Latitude and longitude are required'},
-            status=status.HTTP_400_BAD_REQUEST
+            {'error': 'Only mechanics can report their location'},
+            status=status.HTTP_403_FORBIDDEN
         )
     
     try:
-        lat = float(lat)
-        lng = float(lng)
+        lat = float(request.data.get('latitude'))
+        lng = float(request.data.get('longitude'))
+        recorded_at = request.data.get('recorded_at')
+        recorded_at = float(recorded_at) if recorded_at is not None else None
     except (ValueError, TypeError):
         return Response(
-            {'error': 'Invalid latitude or longitude'},
+            {'error': 'Invalid latitude, longitude or recorded_at'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return Response(
+            {'error': 'Latitude or longitude out of range'},
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Get all available mechanics
+    # A ping stamped far in the future would outrank every later real one in the buffer
+    if recorded_at is not None and not (
+        math.isfinite(recorded_at)
+        and recorded_at <= timezone.now().timestamp() + settings.LOCATION_MAX_CLOCK_SKEW_SECONDS
+    ):
+        return Response(
+            {'error': 'recorded_at is not a valid time'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if not MechanicProfile.objects.filter(user=request.user).exists():
+        return Response(
+            {'error': 'Mechanic profile not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    location_buffer.add(request.user.id, lat, lng, recorded_at)
+    return Response({'message': 'Location queued'}, status=status.HTTP_202_ACCEPTED)
+
+
+def _encode_nearby_cursor(distance, profile_id):
+    payload = json.dumps([cursor_distance(distance), profile_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def _decode_nearby_cursor(cursor):
+    try:
+        distance, profile_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(distance), int(profile_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def _nearby_from_index(lat, lng, radius_km, limit, skill_type=None, after=None):
+    """
+    Answer from the in-memory location index, hydrating only the returned profiles
+    Hits the database no longer has available are skipped and the index read on past
+    them, so a short page still means there is nothing further
+    """
+    found = []
+    while len(found) < limit:
+        wanted = limit - len(found)
+        nearest = mechanic_index.nearest(
+            lat, lng, k=wanted, radius_km=radius_km, skill_type=skill_type, after=after
+        )
+        profiles = MechanicProfile.objects.filter(availability=True).select_related('user').in_bulk(
+            [profile_id for _, profile_id in nearest]
+        )
+        found.extend(
+            (distance, profiles[profile_id])
+            for distance, profile_id in nearest
+            if profile_id in profiles
+        )
+        if len(nearest) < wanted:
+            break
+        distance, profile_id = nearest[-1]
+        after = (cursor_distance(distance), profile_id)
+    return found
+
+
+def _nearby_from_database(lat, lng, radius_km, limit, skill_type=None, after=None):
+    """Fetch only candidates inside the search box and compute exact distances for those rows"""
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
     mechanics = MechanicProfile.objects.filter(
         availability=True,
-        latitude__isnull=False,
-        longitude__isnull=False
-    )
+        latitude__range=(min_lat, max_lat),
+        longitude__range=(min_lng, max_lng)
+    ).select_related('user')
+    cells = location_cells_for_box(min_lat, max_lat, min_lng, max_lng)
+    if cells is not None:
+        mechanics = mechanics.filter(location_cell__in=cells)
+    if skill_type:
+        mechanics = mechanics.filter(skill_type=skill_type)
     
-    # Calculate distance for each mechanic
-    mechanics_with_distance = []
-    for mechanic in mechanics:
-        distance = calculate_distance(lat, lng, mechanic.latitude, mechanic.longitude)
-        if distance is not None:
-            mechanics_with_distance.append({
-                'mechanic': mechanic,
-                'distance': distance
-            })
-    
-    # Sort by distance
-    mechanics_with_distance.sort(key=lambda x: x['distance'])
+    # Distances for all candidates in one pass, dropping the corners of the box
+    candidates = list(mechanics)
+    distances = calculate_distances(
+        (lat, lng),
+        [mechanic.latitude for mechanic in candidates],
+        [mechanic.longitude for mechanic in candidates]
+    )
+    in_range = (
+        (float(distance), mechanic.id, mechanic)
+        for mechanic, distance in zip(candidates, distances)
+        if distance <= radius_km
+        and (after is None or (cursor_distance(float(distance)), mechanic.id) > after)
+    )
+    # Partial sort: only the rows that will be returned get ordered
+    return [
+        (distance, mechanic)
+        for distance, _, mechanic in heapq.nsmallest(limit, in_range, key=lambda item: item[:2])
+    ]
+
+
+def _search_nearby(lat, lng, radius_km, limit, skill_type, after):
+    """Run a nearby search; returns the serialized mechanics and the next-page cursor"""
+    find_nearby = _nearby_from_index if settings.MECHANIC_INDEX_ENABLED else _nearby_from_database
+    mechanics_with_distance = find_nearby(
+        lat, lng, radius_km, limit, skill_type=skill_type, after=after
+    )
     
     # Add distance as attribute to mechanics
-    for item in mechanics_with_distance:
-        item['mechanic']._distance_km = round(item['distance'], 2)
+    for distance, mechanic in mechanics_with_distance:
+        mechanic._distance_km = round(distance, 2)
     
     # Serialize with distance
     serializer = NearbyMechanicSerializer(
-        [m['mechanic'] for m in mechanics_with_distance],
-        many=True,
-        context={'request': request}
+        [mechanic for _, mechanic in mechanics_with_distance],
+        many=True
     )
     
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    next_cursor = None
+    if len(mechanics_with_distance) == limit:
+        distance, mechanic = mechanics_with_distance[-1]
+        next_cursor = _encode_nearby_cursor(distance, mechanic.id)
+    
+    return list(serializer.data), next_cursor
+
+
+def _nearby_candidates(center_lat, center_lng, radius_km, limit, skill_type):
+    """
+    What a cell's cache entry holds: up to NEARBY_CACHE_OVERFETCH times limit mechanics
+    nearest the cell center, within radius_km of any point of the cell
+    Returns the serialized mechanics and whether that is all of them
+    """
+    count = limit * settings.NEARBY_CACHE_OVERFETCH
+    results, _ = _search_nearby(center_lat, center_lng, radius_km + nearby_cache.slack_km(), count, skill_type, None)
+    return results, len(results) < count
 
 
-class ServiceRequestCreateView(generics.CreateAPIView):
-    """Create service request"""
+def _page_from_candidates(lat, lng, center, candidates, radius_km, limit):
+    """
+    Rank a cell's cached candidates from the caller's real origin
+    Returns the results and next-page cursor, or None when mechanics the cache did not
+    fetch could belong on the page
+    """
+    results, complete = candidates
+    distances = calculate_distances(
+        (lat, lng), [item['latitude'] for item in results], [item['longitude'] for item in results]
+    )
+    ranked = sorted(
+        (float(distance), item['id'], item) for item, distance in zip(results, distances) if distance <= radius_km
+    )[:limit]
+    
+    if not complete:
+        # A mechanic left out is no nearer the center than the last one fetched, so by the
+        # triangle inequality no nearer the origin than this
+        last = results[-1]
+        horizon = (
+            calculate_distances(center, [last['latitude']], [last['longitude']])[0]
+            - calculate_distances(center, [lat], [lng])[0]
+        )
+        if len(ranked) < limit or ranked[-1][0] >= horizon:
+            return None
+    
+    next_cursor = None
+    if len(ranked) == limit:
+        distance, profile_id, _ = ranked[-1]
+        next_cursor = _encode_nearby_cursor(distance, profile_id)
+    return [{**item, 'distance_km': round(distance, 2)} for distance, _, item in ranked], next_cursor
+
+
+def parse_nearby_params(query_params):
+    """
+    Validate the nearby search query parameters
+    Returns (params, None) on success or (None, error message)
+    """
+    lat = query_params.get('lat')
+    lng = query_params.get('lng')
+    
+    if not lat or not lng:
+        return None, 'Latitude and longitude are required'
+    
+    try:
+        lat = float(lat)
+        lng = float(lng)
+    except (ValueError, TypeError):
+        return None, 'Invalid latitude or longitude'
+    
+    # Comparisons with NaN are false, so this rejects it along with infinities
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None, 'Latitude or longitude out of range'
+    
+    radius_km = query_params.get('radius_km', settings.NEARBY_DEFAULT_RADIUS_KM)
+    try:
+        radius_km = float(radius_km)
+    except (ValueError, TypeError):
+        return None, 'Invalid radius_km'
+    
+    if math.isnan(radius_km):
+        return None, 'Invalid radius_km'
+    if radius_km <= 0:
+        return None, 'radius_km must be greater than zero'
+    radius_km = min(radius_km, settings.NEARBY_MAX_RADIUS_KM)
+    
+    limit = query_params.get('limit', settings.NEARBY_DEFAULT_LIMIT)
+    try:
+        limit = int(limit)
+    except (ValueError, TypeError):
+        return None, 'Invalid limit'
+    
+    if limit <= 0:
+        return None, 'limit must be greater than zero'
+    limit = min(limit, settings.NEARBY_MAX_RESULTS)
+    
+    skill_type = query_params.get('skill_type') or None
+    if skill_type is not None and skill_type not in dict(MechanicProfile.SKILL_TYPE_CHOICES):
+        return None, 'Invalid skill_type'
+    
+    after = None
+    cursor = query_params.get('cursor')
+    if cursor:
+        after = _decode_nearby_cursor(cursor)
+        if after is None:
+            return None, 'Invalid cursor'
+    
+    return {
+        'lat': lat, 'lng': lng, 'radius_km': radius_km, 'limit': limit,
+        'skill_type': skill_type, 'cursor': cursor, 'after': after,
+    }, None
+
+
+def find_nearby_mechanics(params):
+    """Run a validated nearby search; returns the serialized mechanics and the next-page cursor"""
+    lat, lng = params['lat'], params['lng']
+    search = (params['radius_km'], params['limit'], params['skill_type'], params['after'])
+    
+    # Later pages resume from a position measured from the caller's own origin
+    if not settings.NEARBY_CACHE_ENABLED or params['after'] is not None:
+        return _search_nearby(lat, lng, *search)
+    
+    cell, center = nearby_cache.snap(lat, lng)
+    key = (params['radius_km'], params['limit'], params['skill_type'])
+    candidates = nearby_cache.get(cell, key)
+    if candidates is None:
+        candidates = _nearby_candidates(*center, *key)
+        nearby_cache.set(cell, key, params['radius_km'], candidates)
+    page = _page_from_candidates(lat, lng, center, candidates, params['radius_km'], params['limit'])
+    if page is None:
+        return _search_nearby(lat, lng, *search)
+    return page
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@throttle_classes([NearbySearchUserThrottle, NearbySearchIPThrottle])
+# Hydrating the results, again when the cache cannot answer for this origin, plus the
+# location index's periodic catch-up
+@query_budget(4)
+def nearby_mechanics_view(request):
+    """
+    Get available mechanics within radius_km, sorted by distance
+    Returns at most `limit` mechanics, optionally of one skill_type; when more may follow,
+    the X-Next-Cursor header holds the `cursor` value for the next page. Results are
+    cached per NEARBY_CACHE_CELL_DEGREES grid cell of the search origin
+    """
+    params, error = parse_nearby_params(request.query_params)
+    if error:
+        return Response(
+            {'error': error},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    results, next_cursor = find_nearby_mechanics(params)
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor else {}
+    return Response(results, status=status.HTTP_200_OK, headers=headers)
+
+
+def parse_mechanic_ids(value):
+    """Parse a comma-separated list of mechanic user ids; returns None when invalid"""
+    try:
+        ids = list(dict.fromkeys(int(part) for part in value.split(',') if part.strip()))
+    except ValueError:
+        return None
+    return ids if 0 < len(ids) <= settings.NEARBY_MAX_RESULTS else None
+
+
+def _quotes_for_mechanics(lat, lng, mechanic_ids):
+    rows = list(
+        MechanicProfile.objects.filter(user_id__in=mechanic_ids, user__role='MECHANIC').values_list(
+            'user_id', 'user__name', 'skill_type', 'availability', 'rating_avg', 'latitude', 'longitude'
+        )
+    )
+    distances = calculate_distances((lat, lng), [row[5] for row in rows], [row[6] for row in rows])
+    return [
+        {
+            'mechanic_id': user_id, 'name': name, 'skill_type': skill_type,
+            'availability': availability, 'rating_avg': str(rating_avg),
+            'distance_km': None if math.isnan(distance) else float(distance),
+        }
+        for (user_id, name, skill_type, availability, rating_avg, _, _), distance in zip(rows, distances)
+    ]
+
+
+def _quotes_for_nearby(params):
+    results, _ = find_nearby_mechanics(params)
+    return [
+        {
+            'mechanic_id': result['user']['id'], 'name': result['user']['name'],
+            'skill_type': result['skill_type'], 'availability': result['availability'],
+            'rating_avg': result['rating_avg'], 'distance_km': result['distance_km'],
+        }
+        for result in results
+    ]
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+# Without mechanic_ids this runs the nearby search, so it draws on the same buckets
+@throttle_classes([NearbySearchUserThrottle, NearbySearchIPThrottle])
+@query_budget(4)  # as nearby_mechanics_view
+def mechanic_quotes_view(request):
+    """
+    Quote the estimated cost of several mechanics for the customer at lat/lng
+    Prices the mechanics in mechanic_ids (comma-separated user ids), or else the result
+    of the nearby search with the same parameters, nearest first
+    """
+    params, error = parse_nearby_params(request.query_params)
+    if error:
+        return Response(
+            {'error': error},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if request.query_params.get('mechanic_ids'):
+        mechanic_ids = parse_mechanic_ids(request.query_params['mechanic_ids'])
+        if mechanic_ids is None:
+            return Response(
+                {'error': f'mechanic_ids must list 1 to {settings.NEARBY_MAX_RESULTS} mechanic ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        quotes = _quotes_for_mechanics(params['lat'], params['lng'], mechanic_ids)
+    else:
+        quotes = _quotes_for_nearby(params)
+    
+    # Price the distances as rounded for display, exactly as request creation would
+    distances = [
+        None if quote['distance_km'] is None else round(quote['distance_km'], 2)
+        for quote in quotes
+    ]
+    for quote, distance, cost in zip(quotes, distances, calculate_estimated_costs(distances)):
+        quote['distance_km'] = distance
+        quote['estimated_cost'] = cost
+    
+    quotes.sort(key=lambda quote: (quote['distance_km'] is None, quote['distance_km'] or 0))
+    return Response(quotes, status=status.HTTP_200_OK)
+
+
+class ServiceRequestCreateView(IdempotentCreateMixin, generics.CreateAPIView):
+    """Create service request; retries with the same Idempotency-Key replay the first response"""
+    idempotency_scope = 'requests.create'
     queryset = ServiceRequest.objects.all()
     serializer_class = ServiceRequestCreateSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -118,7 +474,15 @@ class ServiceRequestCreateView(generics.CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        mechanic_id = serializer.validated_data.get('mechanic_id')
+        mechanic_id = serializer.validated_data.pop('mechanic_id', None)
+        if mechanic_id is None:
+            # Left open for the dispatcher to assign, and offered to nearby mechanics meanwhile
+            service_request = serializer.save(customer=customer, status='REQUESTED')
+            publish_request_event('request.created', service_request)
+            fan_out_request(service_request)
+            response_serializer = ServiceRequestListSerializer(service_request)
+            headers = self.get_success_headers(response_serializer.data)
+            return Response(response_serializer.data, status=status.HTTP_201_CREATED, headers=headers)
         
         try:
             mechanic = User.objects.get(id=mechanic_id, role='MECHANIC')
@@ -155,6 +519,7 @@ class ServiceRequestCreateView(generics.CreateAPIView):
             estimated_cost=estimated_cost,
             status='REQUESTED'
         )
+        publish_request_event('request.created', service_request)
         
         # Return with full serializer
         response_serializer = ServiceRequestListSerializer(service_request)
@@ -162,10 +527,36 @@ class ServiceRequestCreateView(generics.CreateAPIView):
         return Response(response_serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
 
+def customer_requests_queryset(user):
+    return ServiceRequest.objects.filter(customer=user).select_related(
+        'customer', 'mechanic'
+    ).order_by('-created_at', '-id')
+
+
+# Request lists show both users nested, so their profile edits must change the validators too
+REQUEST_VALIDATOR_FIELDS = ('updated_at', 'customer__updated_at', 'mechanic__updated_at')
+
+
+def mechanic_requests_querysets(user):
+    """
+    Requests assigned to the mechanic, and the open ones offered to them through their
+    inbox; the two sets are disjoint and are merged page by page
+    """
+    assigned = ServiceRequest.objects.filter(mechanic=user)
+    offered = ServiceRequest.objects.filter(
+        inbox_entries__mechanic=user, mechanic__isnull=True, status='REQUESTED'
+    )
+    return [
+        queryset.select_related('customer', 'mechanic').order_by('-created_at', '-id')
+        for queryset in (assigned, offered)
+    ]
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@query_budget(2)
 def customer_requests_view(request):
-    """Get all service requests for customer"""
+    """Get the customer's service requests, newest first, one cursor page at a time"""
     user = request.user
     
     if user.role != 'CUSTOMER':
@@ -174,15 +565,24 @@ def customer_requests_view(request):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    requests = ServiceRequest.objects.filter(customer=user).order_by('-created_at')
+    validators = Validators.for_querysets(
+        request, customer_requests_queryset(user), fields=REQUEST_VALIDATOR_FIELDS
+    )
+    not_modified = validators.not_modified(request)
+    if not_modified:
+        return not_modified
+    
+    paginator = CreatedAtCursorPagination()
+    requests = paginator.paginate_queryset(customer_requests_queryset(user), request)
     serializer = ServiceRequestListSerializer(requests, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return validators.apply(paginator.get_paginated_response(serializer.data))
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@query_budget(4)
 def mechanic_requests_view(request):
-    """Get all service requests for mechanic"""
+    """Get the mechanic's service requests, newest first, one cursor page at a time"""
     user = request.user
     
     if user.role != 'MECHANIC':
@@ -191,73 +591,180 @@ def mechanic_requests_view(request):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    requests = ServiceRequest.objects.filter(
-        Q(mechanic=user) | Q(mechanic__isnull=True, status='REQUESTED')
-    ).order_by('-created_at')
+    querysets = mechanic_requests_querysets(user)
+    validators = Validators.for_querysets(request, *querysets, fields=REQUEST_VALIDATOR_FIELDS)
+    not_modified = validators.not_modified(request)
+    if not_modified:
+        return not_modified
     
+    paginator = CreatedAtCursorPagination()
+    requests = paginator.merge_rows(*[
+        paginator.get_page_queryset(queryset, request) for queryset in querysets
+    ])
     serializer = ServiceRequestListSerializer(requests, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return validators.apply(paginator.get_paginated_response(serializer.data))
 
 
-@api_view(['POST'])
+SYNC_KINDS = ('requests', 'ratings')
+
+
+def sync_querysets(user):
+    """The requests and ratings a user's devices keep a copy of, by kind (SYNC_KINDS)"""
+    if user.role == 'MECHANIC':
+        requests = mechanic_requests_querysets(user)
+        ratings = Rating.objects.filter(mechanic=user)
+    else:
+        requests = [customer_requests_queryset(user)]
+        ratings = Rating.objects.filter(customer=user)
+    return {'requests': requests, 'ratings': [ratings.select_related('customer', 'mechanic')]}
+
+
+@api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
-def accept_request_view(request, pk):
-    """Accept a service request"""
-    try:
-        service_request = ServiceRequest.objects.get(pk=pk)
-    except ServiceRequest.DoesNotExist:
-        return Response(
-            {'error': 'Service request not found'},
-            status=status.HTTP_404_NOT_FOUND
-        )
+@query_budget(4)
+def sync_view(request):
+    """
+    Get the caller's requests and ratings created or changed since the `since` cursor
+    (everything without one), plus the ids of those they can no longer see
+    """
+    user = request.user
     
-    if request.user != service_request.mechanic:
+    if user.role not in ('CUSTOMER', 'MECHANIC'):
         return Response(
-            {'error': 'You can only accept requests assigned to you'},
+            {'error': 'Only customers and mechanics can sync'},
             status=status.HTTP_403_FORBIDDEN
         )
     
-    if service_request.status != 'REQUESTED':
+    try:
+        data = sync_data(user, request.query_params.get('since'))
+    except ValueError:
         return Response(
-            {'error': f'Request is already {service_request.status}'},
+            {'error': 'Invalid since cursor'},
             status=status.HTTP_400_BAD_REQUEST
         )
+    except SyncCursorExpired:
+        return Response(
+            {'error': 'The since cursor has expired; sync again without it'},
+            status=status.HTTP_410_GONE
+        )
+    return Response(data, status=status.HTTP_200_OK)
+
+
+def sync_data(user, cursor):
+    """The body of a sync response; raises like changes_since"""
+    changes, cursor, has_more = changes_since(user.id, sync_querysets(user), cursor)
+    deleted = {'requests': [], 'ratings': []}
+    for tombstone in changes['deleted']:
+        deleted[f'{tombstone.kind}s'].append(tombstone.object_id)
+    return {
+        'requests': ServiceRequestListSerializer(changes['requests'], many=True).data,
+        'ratings': RatingSerializer(changes['ratings'], many=True).data,
+        'deleted': deleted,
+        'cursor': cursor,
+        'has_more': has_more,
+    }
+
+
+def _request_for_transition(pk):
+    """The request with what its response shows, read before the transition's UPDATE"""
+    return ServiceRequest.objects.select_related('customer', 'mechanic').filter(pk=pk).first()
+
+
+def _transition_request(service_request, user, to_status, **changes):
+    """
+    Move a request assigned to user to to_status with one conditional UPDATE, applying
+    the change to the instance in memory
+    Returns False when it is missing, not assigned to user or no longer in a status that
+    allows the transition (including when a concurrent call got there first)
+    """
+    if service_request is None or service_request.mechanic_id != user.id:
+        return False
+    return service_request.transition(to_status, mechanic=user, **changes)
+
+
+def _claim_offered_request(service_request, user):
+    """
+    Accept an open request from the mechanic's inbox, assigning it to them
+    Returns False when it was not offered to them or is already taken
+    """
+    if service_request is None or service_request.mechanic_id is not None:
+        return False
+    distance_km = MechanicInboxEntry.objects.filter(
+        mechanic=user, service_request_id=service_request.pk
+    ).values_list('distance_km', flat=True).first()
+    if distance_km is None:
+        return False
     
+    changes = {
+        'distance_km': distance_km,
+        'estimated_cost': Decimal(f'{calculate_estimated_cost(float(distance_km)):.2f}'),
+        'updated_at': timezone.now(),
+    }
+    moved = ServiceRequest.objects.filter(
+        pk=service_request.pk, status=service_request.status, mechanic__isnull=True
+    ).transition('ACCEPTED', mechanic=user, **changes)
+    if not moved:
+        return False
     service_request.status = 'ACCEPTED'
-    service_request.save()
-    
-    serializer = ServiceRequestListSerializer(service_request)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    service_request.mechanic = user
+    for name, value in changes.items():
+        setattr(service_request, name, value)
+    prune_requests([service_request.pk])
+    return True
 
 
-@api_view(['POST'])
-@permission_classes([permissions.IsAuthenticated])
-def complete_request_view(request, pk):
-    """Complete a service request"""
-    try:
-        service_request = ServiceRequest.objects.get(pk=pk)
-    except ServiceRequest.DoesNotExist:
+def _transition_error(pk, user, forbidden_message, status_message):
+    """Explain why _transition_request did not move a request"""
+    current = ServiceRequest.objects.filter(pk=pk).values('mechanic_id', 'status').first()
+    if current is None:
         return Response(
             {'error': 'Service request not found'},
             status=status.HTTP_404_NOT_FOUND
         )
-    
-    if request.user != service_request.mechanic:
+    if current['mechanic_id'] != user.id:
         return Response(
-            {'error': 'You can only complete requests assigned to you'},
+            {'error': forbidden_message},
             status=status.HTTP_403_FORBIDDEN
         )
-    
-    if service_request.status != 'ACCEPTED':
-        return Response(
-            {'error': 'Request must be accepted before completion'},
-            status=status.HTTP_400_BAD_REQUEST
+    return Response(
+        {'error': status_message.format(status=current['status'])},
+        status=status.HTTP_400_BAD_REQUEST
+    )
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def accept_request_view(request, pk):
+    """Accept a service request assigned to the mechanic, or one offered in their inbox"""
+    service_request = _request_for_transition(pk)
+    if not (
+        _transition_request(service_request, request.user, 'ACCEPTED')
+        or _claim_offered_request(service_request, request.user)
+    ):
+        return _transition_error(
+            pk, request.user,
+            'You can only accept requests assigned to you',
+            'Request is already {status}'
         )
     
-    service_request.status = 'COMPLETED'
-    service_request.completed_at = timezone.now()
-    service_request.save()
+    publish_request_event('request.accepted', service_request)
+    serializer = ServiceRequestListSerializer(service_request)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def complete_request_view(request, pk):
+    """Complete a service request"""
+    service_request = _request_for_transition(pk)
+    if not _transition_request(service_request, request.user, 'COMPLETED', completed_at=timezone.now()):
+        return _transition_error(
+            pk, request.user,
+            'You can only complete requests assigned to you',
+            'Request must be accepted before completion'
+        )
     
+    publish_request_event('request.completed', service_request)
     serializer = ServiceRequestListSerializer(service_request)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -265,6 +772,7 @@ def complete_request_view(request, pk):
 # Admin Views
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@query_budget(1)
 def admin_users_view(request):
     """Admin: Get all users"""
     if request.user.role != 'ADMIN':
@@ -281,17 +789,130 @@ def admin_users_view(request):
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@query_budget(1)
 def admin_services_view(request):
-    """Admin: Get all service requests"""
+    """Admin: Get all service requests, newest first, one cursor page at a time"""
     if request.user.role != 'ADMIN':
         return Response(
             {'error': 'Only admins can access this endpoint'},
             status=status.HTTP_403_FORBIDDEN
         )
     
-    services = ServiceRequest.objects.all().order_by('-created_at')
+    paginator = CreatedAtCursorPagination()
+    services = paginator.paginate_queryset(
+        ServiceRequest.objects.select_related('customer', 'mechanic'), request
+    )
     serializer = ServiceRequestListSerializer(services, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return paginator.get_paginated_response(serializer.data)
+
+
+USER_EXPORT_COLUMNS = [
+    (name, name) for name in ('id', 'email', 'name', 'phone', 'role', 'is_active', 'created_at', 'updated_at')
+]
+
+SERVICE_EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('status', 'status'),
+    ('customer_id', 'customer_id'),
+    ('customer_name', 'customer.name'),
+    ('customer_email', 'customer.email'),
+    ('mechanic_id', 'mechanic_id'),
+    ('mechanic_name', 'mechanic.name'),
+    ('mechanic_email', 'mechanic.email'),
+    *((name, name) for name in (
+        'issue_text', 'skill_type', 'customer_lat', 'customer_lng', 'distance_km', 'estimated_cost',
+        'created_at', 'updated_at', 'completed_at'
+    )),
+]
+
+
+def _admin_export(request, queryset, columns, export_format, filename, choice_param, choices):
+    if request.user.role != 'ADMIN':
+        return Response(
+            {'error': 'Only admins can access this endpoint'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    if export_format not in EXPORT_FORMATS:
+        return Response(
+            {'error': f"Unsupported export format, use one of: {', '.join(EXPORT_FORMATS)}"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    filters, error = parse_export_filters(request.query_params, choice_param, choices)
+    if error:
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+    
+    queryset = queryset.filter(**filters).order_by('created_at', 'id')
+    return export_response(request, queryset, columns, export_format, filename)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def admin_users_export_view(request, export_format):
+    """
+    Admin: Stream every user as NDJSON or CSV, oldest first
+    Optional filters: created_after, created_before (ISO dates or datetimes) and role
+    """
+    return _admin_export(
+        request, User.objects.all(), USER_EXPORT_COLUMNS, export_format, 'users', 'role', User.ROLE_CHOICES
+    )
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def admin_services_export_view(request, export_format):
+    """
+    Admin: Stream every service request as NDJSON or CSV, oldest first
+    Optional filters: created_after, created_before (ISO dates or datetimes) and status
+    """
+    return _admin_export(
+        request, ServiceRequest.objects.select_related('customer', 'mechanic'), SERVICE_EXPORT_COLUMNS,
+        export_format, 'services', 'status', ServiceRequest.STATUS_CHOICES
+    )
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def admin_cancel_services_view(request):
+    """
+    Admin: Cancel many service requests at once
+    Expects {"ids": [...]}; requests that are already completed or cancelled are left alone.
+    Cancels with one conditional UPDATE and returns the ids that were cancelled
+    """
+    if request.user.role != 'ADMIN':
+        return Response(
+            {'error': 'Only admins can access this endpoint'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    ids = request.data.get('ids')
+    if not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids):
+        return Response(
+            {'error': 'ids must be a list of service request ids'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    # Locking the cancellable rows first makes them exactly the rows the UPDATE moves,
+    # so requests cancelled before (or by a concurrent call) are not reported again
+    with transaction.atomic():
+        cancellable = list(
+            ServiceRequest.objects.select_for_update()
+            .filter(pk__in=ids, status__in=ServiceRequest.TRANSITIONS['CANCELLED'])
+            .values_list('id', flat=True)
+        )
+        ServiceRequest.objects.filter(pk__in=cancellable).transition('CANCELLED')
+    cancelled = list(
+        ServiceRequest.objects.filter(pk__in=cancellable, status='CANCELLED').select_related('customer', 'mechanic')
+    )
+    prune_requests(service_request.id for service_request in cancelled)
+    for service_request in cancelled:
+        publish_request_event('request.cancelled', service_request)
+    
+    return Response(
+        {'cancelled': sorted(service_request.id for service_request in cancelled)},
+        status=status.HTTP_200_OK
+    )
 
 
 @api_view(['DELETE'])
@@ -321,3 +942,45 @@ def admin_delete_user_view(request, pk):
             {'error': 'User not found'},
             status=status.HTTP_404_NOT_FOUND
         )
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def admin_nearby_cache_stats_view(request):
+    """Admin: Get this worker's nearby search cache counters"""
+    if request.user.role != 'ADMIN':
+        return Response(
+            {'error': 'Only admins can access this endpoint'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    return Response(nearby_cache.stats(), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def admin_location_buffer_stats_view(request):
+    """Admin: Get this worker's location ping buffer and flush metrics"""
+    if request.user.role != 'ADMIN':
+        return Response(
+            {'error': 'Only admins can access this endpoint'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    return Response(location_buffer.stats(), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def admin_inbox_stats_view(request):
+    """Admin: Inbox fan-out statistics for this worker"""
+    if request.user.role != 'ADMIN':
+        return Response(
+            {'error': 'Only admins can access this endpoint'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    return Response(
+        {**inbox_stats.stats(), 'entries': MechanicInboxEntry.objects.count()},
+        status=status.HTTP_200_OK
+    )
@@ -0,0 +1,83 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from accounts.authentication import CachedJWTAuthentication
+from .events import get_broker, user_channel
+
+
+@sync_to_async
+def _authenticate(scope):
+    """Resolve the user from the access token in the ?token= query parameter"""
+    token = parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+    if not token:
+        return None
+    
+    authentication = CachedJWTAuthentication()
+    try:
+        user = authentication.get_user(authentication.get_validated_token(token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return user if user.is_active else None
+
+
+async def request_events_consumer(scope, receive, send):
+    """
+    Stream the connected user's service request events
+    Each message is a JSON object {"type": "request.created" | "request.accepted" |
+    "request.completed", "request": {...}}; sending "ping" gets "pong" back
+    """
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    
+    user = await _authenticate(scope)
+    if user is None:
+        await send({'type': 'websocket.close', 'code': 4401})
+        return
+    await send({'type': 'websocket.accept'})
+    
+    with get_broker().subscribe([user_channel(user.id)]) as subscription:
+        receive_task = asyncio.ensure_future(receive())
+        event_task = asyncio.ensure_future(subscription.get())
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    {receive_task, event_task}, return_when=asyncio.FIRST_COMPLETED
+                )
+                
+                if receive_task in done:
+                    incoming = receive_task.result()
+                    if incoming['type'] == 'websocket.disconnect':
+                        break
+                    if incoming.get('text') == 'ping':
+                        await send({'type': 'websocket.send', 'text': 'pong'})
+                    receive_task = asyncio.ensure_future(receive())
+                
+                if event_task in done:
+                    await send({
+                        'type': 'websocket.send',
+                        'text': json.dumps(event_task.result(), cls=JSONEncoder),
+                    })
+                    event_task = asyncio.ensure_future(subscription.get())
+        finally:
+            receive_task.cancel()
+            event_task.cancel()
+
+
+websocket_routes = {
+    '/ws/requests/': request_events_consumer,
+}
+
+
+async def websocket_application(scope, receive, send):
+    consumer = websocket_routes.get(scope['path'])
+    if consumer is None:
+        await receive()
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    await consumer(scope, receive, send)
@@ -7,13 +7,15 @@ export const requestService = {
   },
 
   async getCustomerRequests() {
+    // Newest page only; follow response.data.next for older requests
     const response = await api.get('/requests/customer/');
-    return response.data;
+    return response.data.results;
   },
 
   async getMechanicRequests() {
+    // Newest page only; follow response.data.next for older requests
     const response = await api.get('/requests/mechanic/');
-    return response.data;
+    return response.data.results;
   },
 
   async acceptRequest(requestId) {
@@ -42,8 +42,12 @@ api.interceptors.response.use(
           const response = await axios.post(`${API_BASE_URL}/auth/token/refresh/`, {
             refresh: refreshToken,
           });
-          const { access } = response.data;
+          const { access, refresh } = response.data;
           await AsyncStorage.setItem('accessToken', access);
+          // Refresh tokens are rotated and each one works only once
+          if (refresh) {
+            await AsyncStorage.setItem('refreshToken', refresh);
+          }
           error.config.headers.Authorization = `Bearer ${access}`;
           return api.request(error.config);
         } catch (refreshError) {
@@ -34,6 +34,14 @@ export const authService = {
   },
 
   async logout() {
+    const refreshToken = await AsyncStorage.getItem('refreshToken');
+    if (refreshToken) {
+      try {
+        await api.post('/auth/logout/', { refresh: refreshToken });
+      } catch (error) {
+        // Signing out locally still works if the server cannot be reached
+      }
+    }
     await AsyncStorage.multiRemove(['accessToken', 'refreshToken', 'user']);
   },
 
@@ -6,9 +6,21 @@ export const ratingService = {
     return response.data;
   },
 
-  async getMechanicRatings(mechanicId) {
-    const response = await api.get(`/ratings/mechanic/${mechanicId}/`);
+  async getMechanicRatingSummary(mechanicId) {
+    const response = await api.get(`/ratings/mechanic/${mechanicId}/summary/`);
     return response.data;
   },
+
+  async getMechanicRatings(mechanicId) {
+    // Newest page only; see getMechanicRatingsPage for older ratings
+    const { results } = await this.getMechanicRatingsPage(mechanicId);
+    return results;
+  },
+
+  async getMechanicRatingsPage(mechanicId, next = null) {
+    // next is the URL from the previous page, null once there are no older ratings
+    const response = await api.get(next || `/ratings/mechanic/${mechanicId}/`);
+    return { results: response.data.results, next: response.data.next };
+  },
 };
 
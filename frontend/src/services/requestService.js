@@ -7,12 +7,29 @@ export const requestService = {
   },
 
   async getCustomerRequests() {
+    // Newest page only; follow response.data.next for older requests
     const response = await api.get('/requests/customer/');
-    return response.data;
+    return response.data.results;
   },
 
   async getMechanicRequests() {
+    // Newest page only; follow response.data.next for older requests
     const response = await api.get('/requests/mechanic/');
+    return response.data.results;
+  },
+
+  async syncRequests(cursor) {
+    // Changed requests and ratings plus deleted ids; pass response.data.cursor next time
+    const response = await api.get('/requests/sync/', { params: cursor ? { since: cursor } : {} });
+    return response.data;
+  },
+
+  async waitForWork(cursor) {
+    // Held open by the server until there is news or about 25 seconds pass
+    const response = await api.get('/requests/mechanic/wait/', {
+      params: cursor ? { since: cursor } : {},
+      timeout: 35000,
+    });
     return response.data;
   },
 